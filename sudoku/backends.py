@@ -0,0 +1,20 @@
+from bitboard_state import BitboardSolverState
+from solver_state import SolverState
+
+# The SolverState implementations the Solver can run on, by name
+STATE_BACKENDS = {
+    'list': SolverState,
+    'bitboard': BitboardSolverState,
+}
+
+
+def create_state(board, backend: str = 'list'):
+    """
+    Builds the scratch pad for a board using the named backend.
+
+    'list' keeps the possibilities in Python lists. 'bitboard' keeps them as integer masks, which is faster but hands
+    out read-only tuples.
+    """
+    if backend not in STATE_BACKENDS:
+        raise ValueError(f"Unknown state backend '{backend}'. Expected one of {sorted(STATE_BACKENDS)}")
+    return STATE_BACKENDS[backend](board)
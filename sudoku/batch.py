@@ -0,0 +1,152 @@
+"""
+Solves a stream of puzzles and writes one result line per puzzle as it goes.
+
+Nothing is held in memory beyond the puzzle being solved, so the input can be any size. Output goes through whatever
+buffering the output stream has; the CLI opens stdout with a large buffer so results are written in big blocks.
+
+With the 'routed' engine (see routing.py), the puzzles the router puts in the slow lane are the exception: they are
+put aside with their Route and solved after the rest, so the results for the rest are not held up behind them. At
+most MAX_DEFERRED are kept, so memory stays constant: when that many are waiting they are solved before reading on,
+and the rest at the end of the input. Their result lines come out of input order, which the line numbers make up for.
+"""
+import json
+from typing import Iterable, Optional, Tuple
+
+from dispatcher import solve_board
+from puzzle_io import format_board, to_board
+from routing import ROUTED, SLOW, Route, Router
+from solve_result import SolveResult
+from stats import StatsTracker
+
+# Status written for lines that are not a valid puzzle
+INVALID = 'invalid'
+
+# Status solve_line gives a puzzle it was asked to put aside because the router sent it to the slow lane
+DEFERRED = 'deferred'
+
+# Slow-lane puzzles put aside before they are solved, whatever the size of the input
+MAX_DEFERRED = 1024
+
+TSV_COLUMNS = ('line', 'status', 'solution', 'ms', 'passes', 'guesses', 'nodes', 'max_depth')
+
+
+def result_fields(line_number: int, result: SolveResult) -> dict:
+    """ Returns the values written for one solved puzzle, keyed by the names in TSV_COLUMNS """
+    stats = result.stats
+    fields = {
+        'line': line_number,
+        'status': result.status,
+        'solution': format_board(result.board),
+        'ms': round(stats.get_elapsed_time() * 1000, 3),
+        'passes': stats.num_iterations,
+        'guesses': stats.num_guesses,
+        'nodes': stats.num_nodes,
+        'max_depth': stats.get_max_recursion_depth(),
+    }
+    if result.reason is not None:
+        # which limit of the SearchBudget was hit
+        fields['reason'] = result.reason
+    if result.route is not None:
+        fields['lane'] = result.route.lane
+        fields['predicted_ms'] = round(result.route.predicted_ms, 3)
+    return fields
+
+
+def format_tsv(fields: dict) -> str:
+    return '\t'.join(str(fields.get(column, '')) for column in TSV_COLUMNS) + '\n'
+
+
+def format_jsonl(fields: dict) -> str:
+    return json.dumps(fields, separators=(',', ':')) + '\n'
+
+
+OUTPUT_FORMATS = {
+    'tsv': format_tsv,
+    'jsonl': format_jsonl,
+}
+
+
+def solve_line(line_number: int, line: str, engine='propagation', cache=None, router: Router = None,
+               defer_slow=False, **options) -> Tuple[dict, Optional[StatsTracker]]:
+    """
+    Solves one puzzle line and returns its output fields along with the StatsTracker for the run. Lines that cannot
+    be parsed get the status 'invalid' and no stats. If cache is a cache.SolutionCache, the puzzle is solved through
+    it. line can also be a board, such as one read from a packed file.
+
+    With the 'routed' engine the puzzle goes through router, or a Router with the default settings, and the fields
+    say which lane it took. If defer_slow is set, a puzzle routed to the slow lane is not solved: it gets the status
+    'deferred', its Route under 'route' and no stats. The caller solves it later by passing that Route as line, which
+    solves it in its lane without routing it again.
+    """
+    if isinstance(line, Route):
+        if router is None:
+            router = Router()
+        result = router.solve(line, **options)
+        return result_fields(line_number, result), result.stats
+
+    try:
+        board = to_board(line)
+    except ValueError as e:
+        return {'line': line_number, 'status': INVALID, 'solution': line, 'error': str(e)}, None
+
+    if engine == ROUTED:
+        if router is None:
+            router = Router()
+        route = router.route(board)
+        if defer_slow and route.lane == SLOW:
+            return {'line': line_number, 'status': DEFERRED, 'route': route}, None
+        result = router.solve(route, **options)
+    elif cache is not None:
+        result = cache.solve(board, engine, **options)
+    else:
+        result = solve_board(board, engine=engine, **options)
+    return result_fields(line_number, result), result.stats
+
+
+def write_results(results: Iterable[dict], out, output_format='tsv') -> dict:
+    """ Writes each result's fields to out in the given format. Returns how many results had each status. """
+    formatter = OUTPUT_FORMATS[output_format]
+    counts = {}
+    if output_format == 'tsv':
+        out.write('#' + '\t'.join(TSV_COLUMNS) + '\n')
+
+    for fields in results:
+        out.write(formatter(fields))
+        counts[fields['status']] = counts.get(fields['status'], 0) + 1
+
+    return counts
+
+
+def solve_stream(puzzles: Iterable[Tuple[int, str]], out, output_format='tsv', engine='propagation', cache=None,
+                 **options) -> Tuple[dict, StatsTracker]:
+    """
+    Solves each (line number, puzzle line) pair in this process and writes a result line to out. Lines that cannot be
+    parsed are reported with the status 'invalid' rather than stopping the run.
+
+    Returns how many puzzles ended with each status, and the stats of every solve added together. If cache is given,
+    every puzzle goes through it. With the 'routed' engine, the slow lane is solved last (see the module docs).
+    """
+    totals = StatsTracker()
+    slow_lane = []
+
+    def solve_slow_lane():
+        for line_number, route in slow_lane:
+            fields, stats = solve_line(line_number, route, engine, cache, **options)
+            totals.merge(stats)
+            yield fields
+        slow_lane.clear()
+
+    def results():
+        for line_number, line in puzzles:
+            fields, stats = solve_line(line_number, line, engine, cache, defer_slow=engine == ROUTED, **options)
+            if fields['status'] == DEFERRED:
+                slow_lane.append((line_number, fields['route']))
+                if len(slow_lane) >= MAX_DEFERRED:
+                    yield from solve_slow_lane()
+                continue
+            if stats is not None:
+                totals.merge(stats)
+            yield fields
+        yield from solve_slow_lane()
+
+    return write_results(results(), out, output_format), totals
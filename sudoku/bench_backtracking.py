@@ -0,0 +1,100 @@
+"""
+Compares the cost of backtracking with whole-state snapshots against undoing changes through the SolverState trail.
+
+    $ python sudoku/bench_backtracking.py --repeat 5
+"""
+import argparse
+import time
+
+from backends import STATE_BACKENDS
+from exceptions import ConstraintViolationError
+from puzzle_io import parse_puzzle
+from solver import Solver
+from stats import StatsTracker
+from strategies import BASIC_STRATEGIES
+
+# Puzzles that cannot be finished without a lot of guessing
+DEEP_SEARCH_PUZZLES = [
+    '1...34.8....8..5....4.6..21.18......3..1.2..6......81.52..7.9....6..9....9.64...2',
+    '...92......68.3...19..7...623..4.1....1...7....8.3..297...8..91...5.72......64...',
+    '.6.5.4.3.1...9...8.........9...5...6.4.6.2.7.7...4...5.........4...8...1.5.2.3.4.',
+    '7.....4...2..7..8...3..8.799..5..3...6..2..9...1.97..6...3..9...3..4..6...9..1.35',
+    '9.54..6.7...9.7...42....91.5.8..........65......1.9.....6..38......8..268..2.634.',
+]
+
+
+class SnapshotSolver(Solver):
+    """ The search as it was before the trail: copy the whole state before every guess and swap it back on failure """
+    def solve_recursively(self, stats_tracker, recursion_depth) -> bool:
+        stats_tracker.on_recursion(recursion_depth)
+        stats_tracker.on_node(self.heuristic_name)
+        try:
+            self.make_consistent()
+            stats_tracker.num_iterations += self.iteratively_solve()
+            if self.state.is_solved():
+                return True
+        except ConstraintViolationError:
+            return False
+
+        for row in range(9):
+            for col in range(9):
+                if self.state.is_cell_solved(row, col):
+                    continue
+
+                state_before_all_guesses = self.state.copy()
+                for guess in self.state.get_choices_for_cell(row, col):
+                    state_before_this_guess = self.state.copy()
+                    stats_tracker.on_guess(self.heuristic_name)
+                    try:
+                        self.state.update_board(row, col, guess)
+                    except ConstraintViolationError:
+                        # a peer already holds the value, as Solver.try_guess finds
+                        self.state = state_before_this_guess
+                        continue
+                    if self.solve_recursively(stats_tracker, recursion_depth + 1):
+                        return True
+                    self.state = state_before_this_guess
+
+                self.state = state_before_all_guesses
+                return False
+
+        return True
+
+
+def run(solver_class, backend: str, repeat: int) -> (float, int):
+    """ Returns the best total time in seconds over all puzzles, and the number of search nodes visited """
+    best = float('inf')
+    nodes = 0
+    for _ in range(repeat):
+        elapsed = 0.0
+        nodes = 0
+        for puzzle in DEEP_SEARCH_PUZZLES:
+            # the snapshot search swaps self.state out, so both run the whole-board rescans it was written for
+            solver = solver_class(parse_puzzle(puzzle), backend=backend, propagation='rescan',
+                                  strategies=BASIC_STRATEGIES)
+            stats = StatsTracker()
+            start = time.perf_counter()
+            solved = solver.solve_recursively(stats, 0)
+            elapsed += time.perf_counter() - start
+            assert solved and solver.state.is_solved()
+            nodes += stats.num_nodes
+        best = min(best, elapsed)
+    return best, nodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=3, help='runs per configuration; the fastest one is reported')
+    parser.add_argument('--backend', choices=sorted(STATE_BACKENDS), action='append',
+                        help='state backend to measure (default: all)')
+    args = parser.parse_args()
+
+    print(f"{'backend':<10} {'undo':<10} {'nodes':>7} {'total ms':>10} {'us/node':>9}")
+    for backend in args.backend or sorted(STATE_BACKENDS):
+        for name, solver_class in (('snapshot', SnapshotSolver), ('trail', Solver)):
+            elapsed, nodes = run(solver_class, backend, args.repeat)
+            print(f"{backend:<10} {name:<10} {nodes:>7} {elapsed * 1000:>10.1f} {elapsed * 1e6 / nodes:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
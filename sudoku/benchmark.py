@@ -0,0 +1,181 @@
+"""
+Measures solver performance on the bundled puzzle corpus and flags regressions against a saved baseline.
+
+The corpus in sudoku/corpus has one file per difficulty tier:
+    easy       solved by the basic row, column and section rules alone, without guessing
+    hard       minimal puzzles that need at least one guess with the basic rules
+    hardest    well-known puzzles built to defeat human techniques and simple solvers
+    17-clue    puzzles with the fewest clues a unique puzzle can have
+    16x16      16x16 puzzles with 120 of their 256 cells given
+    25x25      25x25 puzzles with 360 of their 625 cells given
+
+For each tier it reports throughput, p50/p95/p99 latency, and the guesses and recursion depth the search needed.
+Each puzzle is solved --repeat times and the fastest run is kept, which takes out most of the noise from the rest of
+the machine.
+
+    $ python sudoku/benchmark.py --output before.json
+    $ python sudoku/benchmark.py --baseline before.json
+
+With --baseline, any tier whose latency, throughput or guesses got worse by more than --tolerance is reported and the
+exit status is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from typing import Dict, List
+
+from backends import STATE_BACKENDS
+from dispatcher import ENGINES, solve_board
+from heuristics import BRANCHING_HEURISTICS, VALUE_ORDERINGS
+from puzzle_io import iter_puzzles, parse_puzzle
+from solver import PROPAGATION_MODES
+from stats import percentile
+from strategies import DEFAULT_STRATEGIES, parse_strategies
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'corpus')
+
+# The 9x9 tiers in order of difficulty, then the larger boards. Each one is CORPUS_DIR/<tier>.txt.
+TIERS = ('easy', 'hard', 'hardest', '17-clue', '16x16', '25x25')
+
+# How much worse than the baseline a number can get before it is flagged, as a fraction
+DEFAULT_TOLERANCE = 0.10
+
+
+def load_tier(tier: str) -> List[str]:
+    """ Returns the puzzle lines in a corpus tier """
+    with open(os.path.join(CORPUS_DIR, f"{tier}.txt")) as f:
+        return [line for _, line in iter_puzzles(f)]
+
+
+def run_tier(puzzles: List[str], repeat=3, warmup=5, engine='propagation', **options) -> dict:
+    """ Solves every puzzle in a tier and returns the summary numbers for it """
+    boards = [parse_puzzle(line) for line in puzzles]
+
+    # let caches and the allocator settle before anything is timed
+    for board in boards[:warmup]:
+        solve_board([row[:] for row in board], engine, **options)
+
+    latencies = []
+    guesses = []
+    depths = []
+    solved = 0
+    for board in boards:
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = solve_board([row[:] for row in board], engine, **options)
+            best = min(best, time.perf_counter() - start)
+        latencies.append(best)
+        guesses.append(result.stats.num_guesses)
+        depths.append(result.stats.get_max_recursion_depth())
+        solved += result.solved
+
+    total_time = sum(latencies)
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        'puzzles': len(boards),
+        'solved': solved,
+        'throughput': len(boards) / total_time if total_time else 0.0,
+        'latency_ms': {
+            'p50': percentile(latencies_ms, 50),
+            'p95': percentile(latencies_ms, 95),
+            'p99': percentile(latencies_ms, 99),
+            'max': latencies_ms[-1] if latencies_ms else 0.0,
+        },
+        'guesses': {'mean': sum(guesses) / len(guesses) if guesses else 0.0, 'max': max(guesses, default=0)},
+        'max_depth': {'mean': sum(depths) / len(depths) if depths else 0.0, 'max': max(depths, default=0)},
+    }
+
+
+def run_benchmark(tiers=TIERS, repeat=3, warmup=5, engine='propagation', **options) -> dict:
+    """ Runs the given tiers and returns the results in the form written by --output """
+    return {
+        'config': {
+            'engine': engine,
+            'options': {key: list(value) if isinstance(value, tuple) else value for key, value in options.items()},
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+        },
+        'tiers': {tier: run_tier(load_tier(tier), repeat, warmup, engine, **options) for tier in tiers},
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance=DEFAULT_TOLERANCE) -> List[str]:
+    """
+    Returns a message for every number in results that is worse than in the baseline by more than tolerance. Tiers
+    that are only in one of them are skipped.
+    """
+    regressions = []
+    for tier, current in results['tiers'].items():
+        before = baseline['tiers'].get(tier)
+        if before is None:
+            continue
+
+        checks = [(f"p{p} latency", current['latency_ms'][f"p{p}"], before['latency_ms'][f"p{p}"], 'ms')
+                  for p in (50, 95, 99)]
+        checks.append(('mean guesses', current['guesses']['mean'], before['guesses']['mean'], ''))
+        for name, now, then, unit in checks:
+            if now > then * (1 + tolerance):
+                regressions.append(f"{tier}: {name} went from {then:.3f}{unit} to {now:.3f}{unit}")
+
+        if current['throughput'] < before['throughput'] / (1 + tolerance):
+            regressions.append(f"{tier}: throughput went from {before['throughput']:.1f}/s to "
+                               f"{current['throughput']:.1f}/s")
+        if current['solved'] < before['solved']:
+            regressions.append(f"{tier}: solved {current['solved']} puzzles, down from {before['solved']}")
+    return regressions
+
+
+def print_table(results: Dict[str, dict]):
+    print(f"{'tier':<10} {'puzzles':>7} {'solved':>7} {'per sec':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'guesses':>8} {'depth':>6}")
+    for tier, numbers in results['tiers'].items():
+        latency = numbers['latency_ms']
+        print(f"{tier:<10} {numbers['puzzles']:>7} {numbers['solved']:>7} {numbers['throughput']:>9.1f} "
+              f"{latency['p50']:>9.3f} {latency['p95']:>9.3f} {latency['p99']:>9.3f} "
+              f"{numbers['guesses']['mean']:>8.1f} {numbers['max_depth']['max']:>6}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tier', choices=TIERS, action='append', help='tier to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per puzzle; the fastest one is kept')
+    parser.add_argument('--warmup', type=int, default=5, help='puzzles solved untimed before each tier')
+    parser.add_argument('--engine', choices=['auto'] + sorted(ENGINES), default='propagation')
+    parser.add_argument('--backend', choices=sorted(STATE_BACKENDS), default='list')
+    parser.add_argument('--heuristic', choices=sorted(BRANCHING_HEURISTICS), default='first')
+    parser.add_argument('--value-order', choices=sorted(VALUE_ORDERINGS), default='natural')
+    parser.add_argument('--propagation', choices=PROPAGATION_MODES, default='worklist')
+    parser.add_argument('--strategies', type=parse_strategies, default=DEFAULT_STRATEGIES)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='JSON file from an earlier --output to compare against')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='fraction a number can get worse by before it counts as a regression')
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.tier or TIERS, args.repeat, args.warmup, args.engine, backend=args.backend,
+                            heuristic=args.heuristic, value_order=args.value_order, propagation=args.propagation,
+                            strategies=args.strategies)
+    print_table(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
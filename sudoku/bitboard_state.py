@@ -0,0 +1,338 @@
+from __future__ import annotations
+from exceptions import ConstraintViolationError
+from geometry import geometry_of
+from typing import Dict, List, Sequence, Tuple
+
+# Bit (d - 1) of a mask is set when digit d is still possible. This is the full mask for a 9x9 board.
+ALL_DIGITS = 0x1FF
+
+# MASK_VALUES[mask] is the ascending tuple of digits in the mask. Handing these out avoids building a list per lookup.
+MASK_VALUES = tuple(tuple(d for d in range(1, 10) if mask & (1 << (d - 1))) for mask in range(ALL_DIGITS + 1))
+
+# POPCOUNT[mask] is the number of digits in the mask
+POPCOUNT = tuple(len(values) for values in MASK_VALUES)
+
+# A lazily filled mask table is emptied when it gets this big, so long runs on large boards do not grow without bound
+MAX_CACHED_MASKS = 1 << 16
+
+
+class _MaskTable(dict):
+    """
+    Stands in for MASK_VALUES and POPCOUNT on boards that do not have 9 digits. A table of every mask would be far too
+    big for the larger ones (2^25 entries for 25x25), so each mask is worked out the first time it is looked up and
+    kept after that.
+    """
+    def __init__(self, size: int, count_only: bool):
+        super().__init__()
+        self.size = size
+        self.count_only = count_only
+
+    def __missing__(self, mask: int):
+        if len(self) >= MAX_CACHED_MASKS:
+            self.clear()
+        if self.count_only:
+            value = bin(mask).count('1')
+        else:
+            value = tuple(d for d in range(1, self.size + 1) if mask & (1 << (d - 1)))
+        self[mask] = value
+        return value
+
+
+_TABLES: Dict[int, Tuple[Sequence, Sequence]] = {9: (MASK_VALUES, POPCOUNT)}
+
+
+def mask_tables(size: int) -> Tuple[Sequence, Sequence]:
+    """ Returns the tables that play the part of MASK_VALUES and POPCOUNT for boards with size digits """
+    tables = _TABLES.get(size)
+    if tables is None:
+        tables = _TABLES[size] = (_MaskTable(size, False), _MaskTable(size, True))
+    return tables
+
+
+def mask_of(values) -> int:
+    """ Returns the bit mask holding each of the given digits """
+    mask = 0
+    for v in values:
+        mask |= 1 << (v - 1)
+    return mask
+
+
+def lowest_digit(mask: int) -> int:
+    """ Returns the smallest digit in a non-empty mask """
+    return (mask & -mask).bit_length()
+
+
+class BitboardSolverState(object):
+    """
+    A drop-in replacement for SolverState that stores every possibility list as an integer mask, where bit d-1 is set
+    if digit d is still possible. The cell masks are kept in one flat list indexed by row * size + column, and there
+    is one mask of unplaced digits for each row, column and section. Python integers have no fixed width, so the same
+    code covers 16 and 25 digit boards.
+
+    It has the same public methods as SolverState so the Solver runs on either one. Methods that return choices give
+    back shared tuples from a lookup table instead of building a new list on every call, so callers must not mutate
+    them. The get_*_mask methods expose the raw masks for code that wants to use bit tricks directly.
+
+    Changes are recorded in a trail the same way as SolverState, so mark() and undo() work on both.
+    """
+    def __init__(self, board):
+        self.board = board
+        self._set_geometry(geometry_of(board))
+
+        # (container, key, previous value) for every change, in the order they were made
+        self.trail = []
+
+        # Like SolverState, the row and column masks start full and are narrowed down by the Solver
+        size = self.size
+        all_digits = self.all_digits
+        self.row_masks = [all_digits] * size
+        self.col_masks = [all_digits] * size
+        self.cell_masks = [all_digits] * (size * size)
+
+        # The section masks always mirror the board, so they start with the given clues removed
+        self.box_masks = [all_digits] * size
+        for r, c in self.geometry.cells:
+            if board[r][c] is not None:
+                self.box_masks[self.box_of[r][c]] &= ~(1 << (board[r][c] - 1))
+
+    def _set_geometry(self, geometry):
+        self.geometry = geometry
+        self.size = geometry.size
+        self.box_of = geometry.box_of
+        self.all_digits = (1 << geometry.size) - 1
+        self.mask_values, self.popcount = mask_tables(geometry.size)
+
+    def copy(self) -> BitboardSolverState:
+        """ Returns a deep copy of this state. Useful for undoing changes. """
+        new_state = BitboardSolverState.__new__(BitboardSolverState)
+        new_state._set_geometry(self.geometry)
+        new_state.board = [row[:] for row in self.board]
+        new_state.row_masks = self.row_masks[:]
+        new_state.col_masks = self.col_masks[:]
+        new_state.box_masks = self.box_masks[:]
+        new_state.cell_masks = self.cell_masks[:]
+        new_state.trail = []
+        return new_state
+
+    def mark(self) -> int:
+        """ Returns a marker for the current point in the trail, to be passed to undo() later """
+        return len(self.trail)
+
+    def undo(self, mark: int):
+        """ Reverts every change made since the given mark was taken """
+        trail = self.trail
+        while len(trail) > mark:
+            container, key, previous = trail.pop()
+            container[key] = previous
+
+    def get_cell_mask(self, row: int, column: int) -> int:
+        """ Returns the mask of remaining choices for the given cell """
+        return self.cell_masks[row * self.size + column]
+
+    def get_row_mask(self, row: int) -> int:
+        """ Returns the mask of remaining choices for unsolved cells in the given row """
+        return self.row_masks[row]
+
+    def get_col_mask(self, col: int) -> int:
+        """ Returns the mask of remaining choices for unsolved cells in the given column """
+        return self.col_masks[col]
+
+    def get_box_mask(self, box: int) -> int:
+        """ Returns the mask of values not yet placed in the given section """
+        return self.box_masks[box]
+
+    def get_live_mask(self, row: int, col: int) -> int:
+        """ Returns the mask of the cell's choices that are also still open for its row and column """
+        return self.cell_masks[row * self.size + col] & self.row_masks[row] & self.col_masks[col]
+
+    def get_live_choices(self, row: int, col: int) -> Sequence[int]:
+        """ Returns the cell's choices that are also still open for its row and column """
+        return self.mask_values[self.cell_masks[row * self.size + col] & self.row_masks[row] & self.col_masks[col]]
+
+    def get_choices_for_cell(self, row: int, column: int) -> Sequence[int]:
+        """ Returns the remaining choices possible for the given cell """
+        return self.mask_values[self.cell_masks[row * self.size + column]]
+
+    def get_choices_for_cells_in_row(self, row) -> set[int]:
+        """
+        Returns the union of remaining possible choices for all the cells in the given row. This only includes
+        unsolved cells because solved ones are no longer possible to assign.
+        """
+        mask = 0
+        popcount = self.popcount
+        for i in range(row * self.size, row * self.size + self.size):
+            if popcount[self.cell_masks[i]] != 1:
+                mask |= self.cell_masks[i]
+        return set(self.mask_values[mask])
+
+    def get_choices_for_cells_in_col(self, col: int) -> set[int]:
+        """
+        Returns the union of remaining possible choices for all the cells in the given column. This only includes
+        unsolved cells because solved ones are no longer possible to assign.
+        """
+        mask = 0
+        popcount = self.popcount
+        for i in range(col, len(self.cell_masks), self.size):
+            if popcount[self.cell_masks[i]] != 1:
+                mask |= self.cell_masks[i]
+        return set(self.mask_values[mask])
+
+    def get_values_in_box(self, box: int) -> Sequence[int]:
+        """ Returns the values that are known within the given section """
+        return self.mask_values[self.all_digits & ~self.box_masks[box]]
+
+    def get_choices_for_row(self, row: int) -> Sequence[int]:
+        """ Returns the remaining possible choices for unsolved cells in the given row """
+        return self.mask_values[self.row_masks[row]]
+
+    def get_choices_for_col(self, col: int) -> Sequence[int]:
+        """ Returns the remaining possible choices for unsolved cells in the given column """
+        return self.mask_values[self.col_masks[col]]
+
+    def mark_impossible_in_cell(self, row, column, to_remove) -> bool:
+        """
+        Remove the given value from the remaining possibilities for the given cell
+        :return bool True if anything was changed, False if the value was already impossible
+        """
+        return self._clear_bit(self.cell_masks, row * self.size + column, 1 << (to_remove - 1))
+
+    def mark_impossible_in_row(self, row: int, value: int):
+        """ Remove the given value from the remaining possibilities for a given row """
+        self._clear_bit(self.row_masks, row, 1 << (value - 1))
+
+    def mark_impossible_in_col(self, col: int, value: int):
+        """ Remove the given value from the remaining possibilities for a given column """
+        self._clear_bit(self.col_masks, col, 1 << (value - 1))
+
+    def set_choices_for_cell(self, row: int, column: int, value: List[int]):
+        """ Sets the remaining possibilities for a given cell """
+        # this is called for every cell on every pass, so it skips the call to _record when nothing changes
+        mask = mask_of(value)
+        i = row * self.size + column
+        if self.cell_masks[i] != mask:
+            self.trail.append((self.cell_masks, i, self.cell_masks[i]))
+            self.cell_masks[i] = mask
+
+    def set_choices_for_row(self, row, new_choices: List[int]):
+        """ Sets the remaining possibilities for a given row """
+        self._record(self.row_masks, row, mask_of(new_choices))
+
+    def set_choices_for_col(self, col, new_choices: List[int]):
+        """ Sets the remaining possibilities for a given column """
+        self._record(self.col_masks, col, mask_of(new_choices))
+
+    def _record(self, container: list, key: int, value):
+        """ Replaces container[key] with value and remembers the old value in the trail """
+        previous = container[key]
+        if previous != value:
+            self.trail.append((container, key, previous))
+            container[key] = value
+
+    def _clear_bit(self, masks: list, key: int, bit: int) -> bool:
+        """ Clears a bit in masks[key], returning False if it was already clear """
+        mask = masks[key]
+        if not mask & bit:
+            return False
+        self.trail.append((masks, key, mask))
+        masks[key] = mask ^ bit
+        return True
+
+    def board_at(self, row: int, column: int) -> int:
+        """ Returns the value of the given cell. Returns None if it does not have a known value. """
+        return self.board[row][column]
+
+    def is_cell_solved(self, row: int, column: int) -> bool:
+        """ Returns whether the given cell has a known value """
+        return self.board[row][column] is not None
+
+    def get_row(self, row: int):
+        """ Returns the given row of the board, including both solved and unsolved cells """
+        return self.board[row]
+
+    def get_column(self, col: int):
+        """ Returns the given column of the board, including both solved and unsolved cells """
+        return [v[col] for v in self.board]
+
+    def update_board(self, row: int, column: int, value: int):
+        """
+        Sets a value for the given cell in the board and updates the other possibility masks to match. Raises
+        ConstraintViolationError if the cell already holds a different value or a peer already holds this one.
+        """
+        board_row = self.board[row]
+        bit = 1 << (value - 1)
+        box = self.box_of[row][column]
+        current = board_row[column]
+        if current != value:
+            if current is not None:
+                raise ConstraintViolationError(f"Cell {row, column} already holds {current}, not {value}")
+            # the section mask mirrors the board exactly; the row and column masks may have been narrowed further
+            if not self.box_masks[box] & bit:
+                raise ConstraintViolationError(f"Cell {row, column} value {value} is already in section {box}")
+            if value in board_row:
+                raise ConstraintViolationError(f"Cell {row, column} value {value} is already in its row")
+            for other_row in self.board:
+                if other_row[column] == value:
+                    raise ConstraintViolationError(f"Cell {row, column} value {value} is already in its column")
+
+        self._record(board_row, column, value)
+        self._record(self.cell_masks, row * self.size + column, bit)
+        self._clear_bit(self.row_masks, row, bit)
+        self._clear_bit(self.col_masks, column, bit)
+        self._clear_bit(self.box_masks, box, bit)
+
+    def is_solved(self) -> bool:
+        """ Returns True if every cell in the board has a known value """
+        for row in self.board:
+            if None in row:
+                return False
+        try:
+            self.assert_still_valid()
+        except ConstraintViolationError:
+            return False
+
+        return True
+
+    def matches_expected(self, expected_solution) -> bool:
+        """ Returns true if the current board matches the given expectation """
+        return all(self.board[r] == list(expected_solution[r]) for r in range(self.size))
+
+    def assert_still_valid(self):
+        """
+        Ensures that all of the possibility masks are consistent with each other. If they are not, it either
+        indicates the solver has guessed an incorrect value (raises ConstraintViolationError) or there is a bug in the
+        code (assertion failure). Like SolverState's, it looks at the whole board.
+        """
+        size = self.size
+        row_seen = [0] * size
+        col_seen = [0] * size
+        box_seen = [0] * size
+        for r in range(size):
+            for c in range(size):
+                value = self.board[r][c]
+                if value is None:
+                    continue
+                bit = 1 << (value - 1)
+                if row_seen[r] & bit:
+                    raise ConstraintViolationError(f"Cell {r, c} value {value} is duplicated in row")
+                if col_seen[c] & bit:
+                    raise ConstraintViolationError(f"Cell {r, c} is duplicated in column")
+                box = self.box_of[r][c]
+                if box_seen[box] & bit:
+                    raise ConstraintViolationError(f"Duplicate value {value} in section {box}")
+                row_seen[r] |= bit
+                col_seen[c] |= bit
+                box_seen[box] |= bit
+
+        self._assert_internal_consistency()
+
+    def _assert_internal_consistency(self):
+        # any of these assertions that fail indicate a bug in the code
+        for r, c in self.geometry.cells:
+            mask = self.cell_masks[r * self.size + c]
+
+            # if there are no more possibilities, yet this cell has not been solved, there is a bug
+            if self.popcount[mask] == 1:
+                assert(self.board[r][c] is not None)
+
+            if self.board[r][c] is not None:
+                assert(mask == 1 << (self.board[r][c] - 1))
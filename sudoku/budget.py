@@ -0,0 +1,98 @@
+"""
+Limits on how long a search may run.
+
+A SearchBudget is passed to a solver as the budget option. The search reports every node and guess to it, and once a
+limit is passed the solve stops and returns a SolveResult with the status 'budget_exceeded', the reason, the board as
+far as it got and the stats up to that point. The limits are:
+    timeout       seconds from the start of the solve
+    deadline      a time.time() value, which means the same thing in every process
+    max_nodes     search nodes visited
+    max_guesses   values tried at a guessed cell
+    token         a CancellationToken; the solve stops soon after it is cancelled
+
+Counting is a comparison per node and per guess. The clock and the token are only looked at every CHECK_INTERVAL
+nodes, and by the Solver after each pass of its strategies, so a time limit is overshot by at most that much work:
+well under a millisecond on a 9x9 board, a few tens of milliseconds on 25x25.
+"""
+import math
+import time
+
+from exceptions import BudgetExceededError
+
+# Nodes between looks at the clock and the cancellation token. Must be a power of 2.
+CHECK_INTERVAL = 64
+
+# Why a solve ran out of budget
+DEADLINE = 'deadline'
+NODES = 'nodes'
+GUESSES = 'guesses'
+CANCELLED = 'cancelled'
+
+
+class CancellationToken(object):
+    """ Stops the solves whose budgets hold it. cancel() can be called from another thread. """
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class SearchBudget(object):
+    """
+    The limits for a solve; any left as None do not apply. start() is called by the solver at the beginning of each
+    solve and resets the counts, so one budget can be used for many solves in turn, but not for several at once.
+    """
+    def __init__(self, timeout: float = None, max_nodes: int = None, max_guesses: int = None,
+                 token: CancellationToken = None, deadline: float = None):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_nodes = max_nodes if max_nodes is not None else math.inf
+        self.max_guesses = max_guesses if max_guesses is not None else math.inf
+        self.token = token
+
+        self.nodes = 0
+        self.guesses = 0
+
+        # the perf_counter_ns() value the solve has to finish by, or None
+        self.stop_ns = None
+
+    def start(self):
+        self.nodes = 0
+        self.guesses = 0
+        self.stop_ns = None
+        now = time.perf_counter_ns()
+        if self.timeout is not None:
+            self.stop_ns = now + int(self.timeout * 1e9)
+        if self.deadline is not None:
+            stop_ns = now + int((self.deadline - time.time()) * 1e9)
+            self.stop_ns = stop_ns if self.stop_ns is None else min(self.stop_ns, stop_ns)
+        self.check()
+
+    def on_node(self):
+        self.nodes += 1
+        if self.nodes > self.max_nodes:
+            raise BudgetExceededError(NODES, f"Visited more than {self.max_nodes} search nodes")
+        if not self.nodes & (CHECK_INTERVAL - 1):
+            self.check()
+
+    def on_guess(self):
+        self.guesses += 1
+        if self.guesses > self.max_guesses:
+            raise BudgetExceededError(GUESSES, f"Made more than {self.max_guesses} guesses")
+
+    def add(self, nodes: int, guesses: int):
+        """ Counts nodes and guesses searched somewhere else, such as in another process, against the limits """
+        self.nodes += nodes
+        if self.nodes > self.max_nodes:
+            raise BudgetExceededError(NODES, f"Visited more than {self.max_nodes} search nodes")
+        self.guesses += guesses
+        if self.guesses > self.max_guesses:
+            raise BudgetExceededError(GUESSES, f"Made more than {self.max_guesses} guesses")
+
+    def check(self):
+        """ Raises BudgetExceededError if the token was cancelled or the time is up """
+        if self.token is not None and self.token.cancelled:
+            raise BudgetExceededError(CANCELLED, 'The solve was cancelled')
+        if self.stop_ns is not None and time.perf_counter_ns() >= self.stop_ns:
+            raise BudgetExceededError(DEADLINE, 'Ran out of time')
@@ -0,0 +1,139 @@
+"""
+A cache of solutions that sits in front of the solvers.
+
+Each board is put into canonical form first (see canonical.py), so a puzzle that was seen before in any orientation,
+or with its digits relabelled, is answered from the cache. The stored solution is mapped back to the caller's
+orientation, and no propagation or search runs at all.
+
+The cache keeps up to max_entries solutions in memory and evicts the least recently used one when it is full. Given a
+path, it also keeps every solution in an SQLite file, so later runs start with what earlier runs solved.
+"""
+import sqlite3
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from canonical import canonicalize
+from dispatcher import solve_board
+from geometry import SIZE
+from puzzle_io import format_board, parse_puzzle
+from solve_result import SolveResult
+from stats import StatsTracker
+
+DEFAULT_MAX_ENTRIES = 100000
+
+# Writes to the SQLite file are committed in batches of this many, since a commit per solve would be slow
+COMMIT_EVERY = 100
+
+
+class SolutionCache(object):
+    """
+    Solves boards through an LRU cache keyed by canonical form, with an optional SQLite tier. hits, misses, disk_hits
+    and evictions count what the cache did, and counters() returns them together.
+    """
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, path: str = None):
+        if max_entries < 1:
+            raise ValueError(f"max_entries must be at least 1, not {max_entries}")
+        self.max_entries = max_entries
+
+        # canonical puzzle -> (status, canonical solution), least recently used first
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # hits that were found in the SQLite file rather than in memory
+        self.disk_hits = 0
+
+        self.connection = None
+        self.uncommitted = 0
+        if path is not None:
+            self.connection = sqlite3.connect(path)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS solutions (puzzle TEXT PRIMARY KEY, status TEXT, solution TEXT)')
+
+    def solve(self, board, engine='auto', **options) -> SolveResult:
+        """
+        Returns the cached result for the board if there is one. Otherwise solves it and caches the result. Only 9x9
+        boards have a canonical form, so boards of other sizes are always solved. The time taken to canonicalize the
+        board is in the result's stats either way, as the canonicalization phase.
+        """
+        if len(board) != SIZE:
+            return solve_board(board, engine, **options)
+
+        stats = StatsTracker()
+        stats.start_timer()
+        started = stats.clock()
+        key, transform = canonicalize(board)
+        stats.add_phase_time('canonicalization', started)
+        entry = self._lookup(key)
+        if entry is not None:
+            status, solution = entry
+            result_board = transform.invert(parse_puzzle(solution)) if solution else [row[:] for row in board]
+            stats.stop_timer()
+            return SolveResult(status, result_board, stats)
+
+        stats.stop_timer()
+        result = solve_board([row[:] for row in board], engine, **options)
+        result.stats.merge(stats)
+        if result.status == SolveResult.BUDGET_EXCEEDED:
+            # a bigger budget might still solve it, so there is nothing to remember
+            return result
+        solution = format_board(transform.apply(result.board)) if result.solved else ''
+        self._store(key, (result.status, solution))
+        return result
+
+    def _lookup(self, key: str) -> Optional[Tuple[str, str]]:
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+        if self.connection is not None:
+            row = self.connection.execute('SELECT status, solution FROM solutions WHERE puzzle = ?', (key,)).fetchone()
+            if row is not None:
+                self.hits += 1
+                self.disk_hits += 1
+                self._remember(key, tuple(row))
+                return tuple(row)
+
+        self.misses += 1
+        return None
+
+    def _store(self, key: str, entry: Tuple[str, str]):
+        self._remember(key, entry)
+        if self.connection is not None:
+            self.connection.execute('INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)', (key,) + entry)
+            self.uncommitted += 1
+            if self.uncommitted >= COMMIT_EVERY:
+                self.flush()
+
+    def _remember(self, key: str, entry: Tuple[str, str]):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def flush(self):
+        """ Commits any solutions not yet written to the SQLite file """
+        if self.connection is not None and self.uncommitted:
+            self.connection.commit()
+            self.uncommitted = 0
+
+    def close(self):
+        self.flush()
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+    def counters(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'disk_hits': self.disk_hits, 'evictions': self.evictions,
+                'entries': len(self.entries)}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,111 @@
+"""
+Puts boards into a canonical orientation, so that puzzles which are the same up to symmetry can share one cache entry.
+
+These changes turn a puzzle into an equivalent one: relabelling the digits, transposing, reordering the three bands
+(rows 0-2, 3-5, 6-8) or the rows inside a band, and the same for stacks and columns. canonicalize() picks an order for
+the bands, rows, stacks and columns using counts that none of those changes affect. Where those counts tie, it tries
+every order of the tied items (up to MAX_CANDIDATES boards) and keeps the smallest result. The digits are then
+relabelled in order of first appearance.
+
+This is a best-effort canonical form. Two equivalent puzzles get the same form unless they have so many ties that
+the candidate limit cut the search short, which costs a cache miss but never gives a wrong answer. Any two boards
+with the same form really are equivalent, and Transform maps a solution back exactly.
+"""
+from itertools import permutations, product
+from typing import List, Optional, Tuple
+
+# Most orderings of tied rows and columns to compare per board. Keeps canonicalizing far cheaper than solving.
+MAX_CANDIDATES = 64
+
+
+class Transform(object):
+    """
+    A symmetry of the board: new[r][c] = digits[old'[rows[r]][cols[c]]], where old' is the board, transposed first if
+    transposed is set. digits maps every digit 1-9 to its new label.
+    """
+    def __init__(self, transposed: bool, rows: Tuple[int, ...], cols: Tuple[int, ...], digits: dict):
+        self.transposed = transposed
+        self.rows = rows
+        self.cols = cols
+        self.digits = digits
+
+    def apply(self, board) -> List[List[Optional[int]]]:
+        source = _transposed(board) if self.transposed else board
+        digits = self.digits
+        return [[digits.get(source[r][c]) for c in self.cols] for r in self.rows]
+
+    def invert(self, board) -> List[List[Optional[int]]]:
+        """ Maps a board in the transformed orientation back to the original one """
+        labels = {new: old for old, new in self.digits.items()}
+        source = [[None] * 9 for _ in range(9)]
+        for r, old_row in enumerate(self.rows):
+            for c, old_col in enumerate(self.cols):
+                source[old_row][old_col] = labels.get(board[r][c])
+        return _transposed(source) if self.transposed else source
+
+
+def _transposed(board):
+    return [list(column) for column in zip(*board)]
+
+
+def _line_orders(board) -> List[Tuple[int, ...]]:
+    """
+    Returns the row orders to try for a board. Rows are keyed by their clue count and the clue counts of the columns
+    their clues are in, and bands by the keys of their rows, none of which change when columns are reordered or
+    digits relabelled.
+    """
+    col_counts = [sum(1 for row in board if row[c] is not None) for c in range(9)]
+    row_keys = [(sum(1 for v in row if v is not None), sorted(col_counts[c] for c in range(9) if row[c] is not None))
+                for row in board]
+
+    def orders_within(items, key):
+        """ Every order of items sorted by key, with tied items in every order among themselves """
+        items = sorted(items, key=key)
+        groups = []
+        for item in items:
+            if groups and key(groups[-1][0]) == key(item):
+                groups[-1].append(item)
+            else:
+                groups.append([item])
+        return [sum(choice, ()) for choice in product(*(list(permutations(group)) for group in groups))]
+
+    band_rows = {band: orders_within(range(band * 3, band * 3 + 3), lambda r: row_keys[r]) for band in range(3)}
+    band_key = lambda band: sorted(row_keys[r] for r in range(band * 3, band * 3 + 3))
+
+    orders = []
+    for band_order in orders_within(range(3), band_key):
+        for rows in product(*(band_rows[band] for band in band_order)):
+            orders.append(sum(rows, ()))
+            if len(orders) >= MAX_CANDIDATES:
+                return orders
+    return orders
+
+
+def _relabelled(board, rows, cols) -> Tuple[str, dict]:
+    """ Returns the reordered board as a string with digits relabelled by first appearance, and the relabelling """
+    digits = {}
+    for r in rows:
+        for c in cols:
+            v = board[r][c]
+            if v is not None and v not in digits:
+                digits[v] = len(digits) + 1
+    # digits that are not clues still need a label so the solution can be mapped
+    for v in range(1, 10):
+        if v not in digits:
+            digits[v] = len(digits) + 1
+    text = ''.join(str(digits[board[r][c]]) if board[r][c] is not None else '.' for r in rows for c in cols)
+    return text, digits
+
+
+def canonicalize(board) -> Tuple[str, Transform]:
+    """ Returns the canonical form of a board as an 81-character line, and the Transform that produces it """
+    best = None
+    for transposed in (False, True):
+        source = _transposed(board) if transposed else board
+        row_orders = _line_orders(source)
+        col_orders = _line_orders(_transposed(source))
+        for rows, cols in product(row_orders, col_orders[:max(1, MAX_CANDIDATES // len(row_orders))]):
+            text, digits = _relabelled(source, rows, cols)
+            if best is None or text < best[0]:
+                best = (text, Transform(transposed, rows, cols, digits))
+    return best
@@ -0,0 +1,68 @@
+"""
+Picks a solving engine for each puzzle.
+
+The constraint propagation Solver finishes easy puzzles with little or no guessing, but its search degrades badly on
+sparse or adversarial puzzles. DLXSolver has a fixed cost to build its matrix but much more predictable search times.
+"""
+from dlx import DLXSolver
+from geometry import SIZE
+from solve_result import SolveResult
+from solver import Solver
+from split_search import SplitSearchSolver
+from stats import StatsTracker
+
+# 'split' is never chosen automatically: it starts worker processes, which only pays off for a very hard puzzle
+ENGINES = {
+    'propagation': Solver,
+    'dlx': DLXSolver,
+    'split': SplitSearchSolver,
+}
+
+# Puzzles with fewer clues than this go to DLX when the engine is picked automatically. Below about 45 clues the
+# propagation solver starts guessing and quickly falls behind.
+DLX_CLUE_THRESHOLD = 45
+
+
+def count_clues(board) -> int:
+    """ Returns how many cells have a value at the start """
+    return sum(1 for row in board for cell in row if cell is not None)
+
+
+def choose_engine(board) -> str:
+    """ Returns the name of the engine that should be used for the board """
+    if len(board) != SIZE:
+        # on 16x16 and 25x25 boards DLX was several times faster at every clue count the benchmarks cover
+        return 'dlx'
+    return 'dlx' if count_clues(board) < DLX_CLUE_THRESHOLD else 'propagation'
+
+
+def create_solver(board, expected_solution=None, engine='auto', **options):
+    """
+    Creates a solver for the board. The engine can be named explicitly (see ENGINES), or 'auto' to let
+    choose_engine() decide. Other options, such as backend, are passed to the engine.
+    """
+    if engine == 'auto':
+        engine = choose_engine(board)
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Expected 'auto' or one of {sorted(ENGINES)}")
+    return ENGINES[engine](board, expected_solution, **options)
+
+
+def solve_board(board, engine='auto', stats: StatsTracker = None, **options) -> SolveResult:
+    """
+    Solves a board with the chosen engine without printing anything. Stats are collected into stats if given, which
+    can be a NullStatsTracker to skip collecting them.
+    """
+    return create_solver(board, engine=engine, **options).find_solution(stats)
+
+
+def count_solutions(board, limit: int = 2, engine='auto', stats: StatsTracker = None, **options) -> int:
+    """
+    Returns how many solutions a board has, counting no further than limit. The default of 2 is enough to tell a
+    puzzle with no solution, a unique one or several apart, and stops the search as soon as it finds the second.
+    """
+    return create_solver(board, engine=engine, **options).count_solutions(limit, stats)
+
+
+def has_unique_solution(board, engine='auto', **options) -> bool:
+    return count_solutions(board, 2, engine, **options) == 1
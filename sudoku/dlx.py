@@ -0,0 +1,343 @@
+"""
+Solves Sudoku as an exact cover problem with Knuth's Algorithm X, using Dancing Links (DLX).
+
+Each of the 729 ways to put a value in a cell is a row of the matrix, and each row covers 4 of the 324 columns:
+    0-80      cell (r, c) has a value
+    81-161    row r has value v
+    162-242   column c has value v
+    243-323   3x3 section b has value v
+A solution is a set of rows that covers every column exactly once. Other board sizes work the same way, with size³
+rows and 4 * size² columns.
+"""
+from backends import create_state
+from budget import SearchBudget
+from exceptions import BudgetExceededError
+from geometry import STANDARD, Geometry
+from solver import print_report
+from solve_result import SolveResult
+from stats import NullStatsTracker, StatsTracker
+
+# The number of matrix columns for a 9x9 board
+NUM_COLUMNS = 324
+
+
+def constraint_columns(row: int, col: int, value: int, geometry: Geometry = STANDARD) -> (int, int, int, int):
+    """ Returns the four matrix columns covered by putting value in (row, col) """
+    size = geometry.size
+    cells = size * size
+    box = geometry.box_of[row][col]
+    return (row * size + col,
+            cells + row * size + value - 1,
+            cells * 2 + col * size + value - 1,
+            cells * 3 + box * size + value - 1)
+
+
+class DLXSolver(object):
+    """
+    An alternative to Solver with the same input format and the same solve() output. Its run time depends much less
+    on how the puzzle was built, which makes it the better choice for puzzles designed to defeat constraint
+    propagation.
+
+    Only the part of the matrix that is still open is built: columns already covered by the clues are left out, and
+    so is any row that would clash with a clue. When the search finishes, the solution is written into self.state so
+    it can be checked the same way as the Solver's.
+
+    excluded is a collection of (row, col, value) placements to leave out of the matrix, which searches for solutions
+    that avoid them. The generator uses it to ask whether a puzzle has any solution other than the known one.
+
+    budget limits the search the same way as the Solver's (see budget.SearchBudget).
+
+    Options that only apply to the Solver, such as heuristic, are accepted and ignored so that callers can pass the
+    same options to either engine.
+    """
+    def __init__(self, board, expected_solution=None, backend='list', excluded=(), budget: SearchBudget = None,
+                 **solver_only_options):
+        self.state = create_state(board, backend)
+        self.geometry = self.state.geometry
+        self.num_columns = 4 * self.geometry.size * self.geometry.size
+        self.expected_solution = expected_solution
+        self.heuristic_name = 'dlx'
+        self.budget = budget
+
+        # The links are kept in parallel lists indexed by node. Node 0 is the root, nodes 1..num_columns are the
+        # column headers (column i has header i + 1), and the rest are the 1s of the matrix.
+        self.left = []
+        self.right = []
+        self.up = []
+        self.down = []
+        self.column_of = []
+        self.row_of = []
+        self.size = [0] * (self.num_columns + 1)
+
+        # (row, col, value) for each matrix row
+        self.candidates = []
+
+        # matrix rows picked so far by the search
+        self.partial_solution = []
+
+        self.consistent = self._build_matrix(board, excluded)
+
+    def _new_node(self, column: int, row_id: int) -> int:
+        node = len(self.left)
+        self.left.append(node)
+        self.right.append(node)
+        self.up.append(node)
+        self.down.append(node)
+        self.column_of.append(column)
+        self.row_of.append(row_id)
+        return node
+
+    def _build_matrix(self, board, excluded=()) -> bool:
+        """ Links up the open part of the matrix. Returns False if the clues already break a rule. """
+        geometry = self.geometry
+        covered = set()
+        for r, c in geometry.cells:
+            if board[r][c] is not None:
+                for column in constraint_columns(r, c, board[r][c], geometry):
+                    if column in covered:
+                        return False
+                    covered.add(column)
+
+        # root and column headers
+        for header in range(self.num_columns + 1):
+            self._new_node(header, -1)
+
+        # only the uncovered columns are linked into the header list
+        previous = 0
+        for column in range(self.num_columns):
+            if column not in covered:
+                header = column + 1
+                self.right[previous] = header
+                self.left[header] = previous
+                previous = header
+        self.right[previous] = 0
+        self.left[0] = previous
+
+        for r, c in geometry.cells:
+            if board[r][c] is not None:
+                continue
+            for value in geometry.digits:
+                columns = constraint_columns(r, c, value, geometry)
+                if any(column in covered for column in columns) or (r, c, value) in excluded:
+                    continue
+                self._add_row(r, c, value, columns)
+        return True
+
+    def _add_row(self, row: int, col: int, value: int, columns):
+        row_id = len(self.candidates)
+        self.candidates.append((row, col, value))
+
+        first = None
+        for column in columns:
+            header = column + 1
+            node = self._new_node(header, row_id)
+
+            # append to the bottom of the column
+            self.up[node] = self.up[header]
+            self.down[node] = header
+            self.down[self.up[header]] = node
+            self.up[header] = node
+            self.size[header] += 1
+
+            # append to the end of the row
+            if first is None:
+                first = node
+            else:
+                self.left[node] = self.left[first]
+                self.right[node] = first
+                self.right[self.left[first]] = node
+                self.left[first] = node
+
+    def _cover(self, header: int):
+        left, right, up, down, column_of, size = self.left, self.right, self.up, self.down, self.column_of, self.size
+        right[left[header]] = right[header]
+        left[right[header]] = left[header]
+        i = down[header]
+        while i != header:
+            j = right[i]
+            while j != i:
+                down[up[j]] = down[j]
+                up[down[j]] = up[j]
+                size[column_of[j]] -= 1
+                j = right[j]
+            i = down[i]
+
+    def _uncover(self, header: int):
+        left, right, up, down, column_of, size = self.left, self.right, self.up, self.down, self.column_of, self.size
+        i = up[header]
+        while i != header:
+            j = left[i]
+            while j != i:
+                size[column_of[j]] += 1
+                down[up[j]] = j
+                up[down[j]] = j
+                j = left[j]
+            i = up[i]
+        right[left[header]] = header
+        left[right[header]] = header
+
+    def _choose_column(self) -> int:
+        """ Returns the open column with the fewest rows left, which keeps the search tree narrow """
+        right, size = self.right, self.size
+        best = right[0]
+        best_size = size[best]
+        header = right[best]
+        while header != 0 and best_size > 1:
+            if size[header] < best_size:
+                best = header
+                best_size = size[header]
+            header = right[header]
+        return best
+
+    def search(self, stats_tracker, depth=0):
+        """
+        Generates every exact cover that extends the current partial solution. The partial solution holds the
+        complete answer each time this yields, and is restored when the generator finishes.
+
+        Like the Solver's, the search keeps its own stack instead of recursing: for each column being covered, the
+        matrix row currently picked for it. A 25x25 board can go hundreds of levels deep, which a recursive search
+        would pay for in Python frames and a raised recursion limit.
+        """
+        budget = self.budget
+        right = self.right
+        left = self.left
+        down = self.down
+        column_of = self.column_of
+        partial_solution = self.partial_solution
+
+        # [column header, row node picked for it] for each level, the innermost last. The node is the header itself
+        # until the first row is picked.
+        levels = []
+
+        while True:
+            stats_tracker.on_recursion(depth + len(levels))
+            stats_tracker.on_node(self.heuristic_name)
+            if budget is not None:
+                budget.on_node()
+
+            if right[0] == 0:
+                yield partial_solution
+            else:
+                header = self._choose_column()
+                if self.size[header] == 0:
+                    stats_tracker.on_contradiction()
+                else:
+                    self._cover(header)
+                    levels.append([header, header])
+
+            # move on to the next row to pick, going back up past levels that have tried all of theirs
+            while levels:
+                level = levels[-1]
+                header, node = level
+                if node != header:
+                    # everything below the row picked last has been searched, so take it back out
+                    stats_tracker.on_backtrack()
+                    j = left[node]
+                    while j != node:
+                        self._uncover(column_of[j])
+                        j = left[j]
+                    partial_solution.pop()
+
+                node = down[node]
+                level[1] = node
+                if node == header:
+                    self._uncover(header)
+                    levels.pop()
+                    continue
+
+                stats_tracker.on_guess(self.heuristic_name)
+                if budget is not None:
+                    budget.on_guess()
+                partial_solution.append(self.row_of[node])
+                j = right[node]
+                while j != node:
+                    self._cover(column_of[j])
+                    j = right[j]
+                break
+            else:
+                return
+
+    def solve_recursively(self, stats_tracker, recursion_depth=0) -> bool:
+        """ Finds the first solution and writes it into the state. Returns False if there is none. """
+        if not self.consistent:
+            stats_tracker.on_contradiction()
+            return False
+        started = stats_tracker.clock()
+        for solution in self.search(stats_tracker, recursion_depth):
+            stats_tracker.add_phase_time('search', started)
+            # the clues go through update_board too so every possibility list ends up consistent with the board
+            for r, c in self.geometry.cells:
+                if self.state.is_cell_solved(r, c):
+                    self.state.update_board(r, c, self.state.board_at(r, c))
+            for row_id in solution:
+                self.state.update_board(*self.candidates[row_id])
+            return True
+        stats_tracker.add_phase_time('search', started)
+        return False
+
+    def iter_solutions(self, stats: StatsTracker = None):
+        """
+        Generates every solution of the puzzle, each as a new board, finding the next one only when it is asked for.
+        Stopping early leaves the matrix partly covered, so create a new DLXSolver to solve the puzzle again. Raises
+        BudgetExceededError if the budget runs out.
+        """
+        if stats is None:
+            stats = NullStatsTracker()
+        if not self.consistent:
+            return
+        if self.budget is not None:
+            self.budget.start()
+        for solution in self.search(stats):
+            board = [row[:] for row in self.state.board]
+            for row_id in solution:
+                r, c, value = self.candidates[row_id]
+                board[r][c] = value
+            yield board
+
+    def count_solutions(self, limit: int = 2, stats: StatsTracker = None) -> int:
+        """
+        Returns how many solutions the puzzle has, counting no further than limit. A puzzle has a unique solution
+        when count_solutions(2) is 1, and the search stops as soon as it finds a second one. Raises
+        BudgetExceededError if the budget runs out.
+        """
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, not {limit}")
+        if stats is None:
+            stats = NullStatsTracker()
+
+        stats.start_timer()
+        count = 0
+        if self.consistent:
+            if self.budget is not None:
+                self.budget.start()
+            # the partial solutions are not turned into boards, since only the number of them matters
+            for _ in self.search(stats):
+                count += 1
+                if count >= limit:
+                    break
+        stats.stop_timer()
+        return count
+
+    def solve(self):
+        result = self.find_solution()
+        print_report(self.state, self.expected_solution, result.stats)
+
+    def find_solution(self, stats: StatsTracker = None) -> SolveResult:
+        """
+        Solves the puzzle without printing anything, and returns the board and stats. Pass a NullStatsTracker to skip
+        collecting stats. If the budget runs out first, the result says so instead of raising.
+        """
+        if stats is None:
+            stats = StatsTracker()
+
+        stats.start_timer()
+        try:
+            if self.budget is not None:
+                self.budget.start()
+            solved = self.solve_recursively(stats, 0)
+        except BudgetExceededError as e:
+            stats.stop_timer()
+            return SolveResult(SolveResult.BUDGET_EXCEEDED, self.state.board, stats, e.reason)
+        stats.stop_timer()
+
+        return SolveResult(SolveResult.SOLVED if solved else SolveResult.UNSOLVABLE, self.state.board, stats)
@@ -2,3 +2,11 @@ class ConstraintViolationError(Exception):
     def __init__(self, message):
         self.message = message
         super().__init__(self.message)
+
+
+class BudgetExceededError(Exception):
+    """ Raised inside a search when its SearchBudget runs out. reason is one of the reasons in budget.py. """
+    def __init__(self, reason, message):
+        self.reason = reason
+        self.message = message
+        super().__init__(self.message)
@@ -0,0 +1,228 @@
+"""
+Generates puzzles that have a unique solution.
+
+Each puzzle starts as a random complete grid. Clues are taken away one at a time in random order, and a removal is
+kept only if the puzzle still has just the one solution. Taking more clues away can only add solutions, so a clue that
+had to stay once has to stay for good and every cell is only tried once. With no targets, what is left is a minimal
+puzzle: no clue can be removed without losing uniqueness.
+
+Checking a removal does not solve the puzzle again from scratch. The solution is already known, so the removal is safe
+exactly when no solution puts a different value in that cell. If the clues alone force the old value back into the
+cell, because the cell's peers rule out every other value or because no other cell in one of its units can take that
+value, the answer comes without any search. Otherwise a DLX search looks for a single solution with the old value
+left out of the matrix, and stops at the first one it finds.
+
+    $ python sudoku/generator.py --count 100 --difficulty medium --workers 4 > pack.txt
+
+--box-size makes larger (or smaller) boards: 4 for 16x16 and 5 for 25x25.
+"""
+import argparse
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterator, List, Optional, Tuple
+
+from canonical import Transform
+from dlx import DLXSolver
+from geometry import BOX_SIZE, STANDARD, Geometry, geometry_for_size
+from puzzle_io import format_board
+from solver import Solver
+from strategies import BASIC_STRATEGIES, DEFAULT_STRATEGIES
+
+# From easiest to hardest:
+#   easy      solved by the basic row, column and section rules without guessing, like the benchmark's easy tier
+#   medium    needs the other deduction strategies, but no guessing
+#   hard      needs at least one guess even with every strategy
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+# The fewest clues a 9x9 puzzle with a unique solution can have
+MIN_CLUES = 17
+
+# Fresh grids tried before giving up on meeting the targets
+DEFAULT_MAX_ATTEMPTS = 100
+
+# Puzzles generated per task sent to a worker process
+BATCH_CHUNK_SIZE = 8
+
+Board = List[List[Optional[int]]]
+
+
+def random_grid(rng: random.Random, geometry: Geometry = STANDARD) -> Board:
+    """ Returns a random complete grid """
+    # the sections on the diagonal share no row, column or section, so they can be filled in at random; from 9x9 up
+    # any filling of them can be completed, but on 4x4 boards about half cannot, and those are drawn again
+    size = geometry.size
+    grid = None
+    while grid is None:
+        board = [[None] * size for _ in range(size)]
+        for box in range(0, size, geometry.box_size + 1):
+            for (r, c), value in zip(geometry.box_cells[box], rng.sample(geometry.digits, size)):
+                board[r][c] = value
+        grid = next(DLXSolver(board).iter_solutions(), None)
+
+    # DLX always completes the same sections the same way, so shuffle the rows and columns to spread the grids out
+    identity = {value: value for value in geometry.digits}
+    rows = _shuffled_lines(rng, geometry.box_size)
+    cols = _shuffled_lines(rng, geometry.box_size)
+    return Transform(rng.random() < 0.5, rows, cols, identity).apply(grid)
+
+
+def _shuffled_lines(rng: random.Random, box_size: int) -> Tuple[int, ...]:
+    """ A random order of the rows (or columns) that keeps each band together """
+    return tuple(band * box_size + offset
+                 for band in rng.sample(range(box_size), box_size) for offset in rng.sample(range(box_size), box_size))
+
+
+def _needs_guess(board: Board, strategies) -> bool:
+    """ Whether the strategies leave cells of a valid puzzle unsolved, which is where the search would guess """
+    solver = Solver([row[:] for row in board], strategies=strategies)
+    solver.propagator.propagate()
+    solver.iteratively_solve()
+    return not solver.state.is_solved()
+
+
+def grade(board: Board) -> str:
+    """ Returns how hard a puzzle with a unique solution is, as one of DIFFICULTIES """
+    if not _needs_guess(board, BASIC_STRATEGIES):
+        return 'easy'
+    if not _needs_guess(board, DEFAULT_STRATEGIES):
+        return 'medium'
+    return 'hard'
+
+
+def _at_most(board: Board, difficulty: str) -> bool:
+    """ Whether the puzzle is no harder than the given difficulty """
+    if difficulty == 'easy':
+        return not _needs_guess(board, BASIC_STRATEGIES)
+    if difficulty == 'medium':
+        return not _needs_guess(board, DEFAULT_STRATEGIES)
+    return True
+
+
+def still_unique(puzzle: Board, solution: Board, row: int, col: int, geometry: Geometry = STANDARD) -> bool:
+    """
+    Whether puzzle, which had a unique solution before the clue at (row, col) was taken out of it, still has only
+    that solution.
+    """
+    value = solution[row][col]
+    peers = geometry.peers
+    peer_values = {puzzle[r][c] for r, c in peers[row][col]}
+    peer_values.discard(None)
+    if len(peer_values) == geometry.size - 1:
+        # every other value is ruled out by a clue, so the cell can only be what it was
+        return True
+    for unit in geometry.units_of[row][col]:
+        if all(puzzle[r][c] is not None or any(puzzle[pr][pc] == value for pr, pc in peers[r][c])
+               for r, c in geometry.units[unit] if (r, c) != (row, col)):
+            # no other cell in the unit can take the value, so it has to go here
+            return True
+    return DLXSolver(puzzle, excluded={(row, col, value)}).count_solutions(1) == 0
+
+
+def reduce_grid(solution: Board, rng: random.Random, clues: int = None, difficulty: str = None) -> Board:
+    """
+    Takes clues away from a complete grid in random order while the solution stays unique, and returns the puzzle.
+    Stops once only clues are left, if given. With difficulty, removals that would make the puzzle harder than that
+    are skipped too.
+    """
+    geometry = geometry_for_size(len(solution))
+    puzzle = [row[:] for row in solution]
+    remaining = len(geometry.cells)
+    for row, col in rng.sample(geometry.cells, remaining):
+        if clues is not None and remaining <= clues:
+            break
+        puzzle[row][col] = None
+        if still_unique(puzzle, solution, row, col, geometry) and (difficulty is None or _at_most(puzzle, difficulty)):
+            remaining -= 1
+        else:
+            puzzle[row][col] = solution[row][col]
+    return puzzle
+
+
+def generate(rng: random.Random = None, clues: int = None, difficulty: str = None,
+             max_attempts=DEFAULT_MAX_ATTEMPTS, box_size=BOX_SIZE) -> Tuple[Board, Board]:
+    """
+    Returns a puzzle with a unique solution, and the solution, as boards in the format Solver takes. box_size picks
+    the board: 3 for 9x9, 4 for 16x16 and so on.
+
+    With no targets the puzzle is minimal. clues asks for exactly that many clues, and difficulty for a puzzle of that
+    grade (see DIFFICULTIES). Raises ValueError if no puzzle meeting the targets turns up in max_attempts grids.
+    """
+    geometry = geometry_for_size(box_size * box_size)
+    min_clues = MIN_CLUES if geometry is STANDARD else 0
+    if difficulty is not None and difficulty not in DIFFICULTIES:
+        raise ValueError(f"Unknown difficulty '{difficulty}'. Expected one of {list(DIFFICULTIES)}")
+    if clues is not None and not min_clues <= clues <= len(geometry.cells):
+        raise ValueError(f"clues must be between {min_clues} and {len(geometry.cells)}, not {clues}")
+    if rng is None:
+        rng = random.Random()
+
+    for _ in range(max_attempts):
+        solution = random_grid(rng, geometry)
+        puzzle = reduce_grid(solution, rng, clues, difficulty)
+        if clues is not None and sum(1 for row in puzzle for v in row if v is not None) != clues:
+            continue
+        if difficulty is not None and grade(puzzle) != difficulty:
+            continue
+        return puzzle, solution
+
+    raise ValueError(f"No puzzle with clues={clues} and difficulty={difficulty} found in {max_attempts} attempts")
+
+
+def _generate_chunk(seeds: List[int], clues: int, difficulty: str, max_attempts: int,
+                    box_size: int) -> List[Tuple[Board, Board]]:
+    """ Runs in a worker process """
+    return [generate(random.Random(seed), clues, difficulty, max_attempts, box_size) for seed in seeds]
+
+
+def generate_batch(count: int, workers=1, seed: int = None, clues: int = None, difficulty: str = None,
+                   max_attempts=DEFAULT_MAX_ATTEMPTS, box_size=BOX_SIZE) -> Iterator[Tuple[Board, Board]]:
+    """
+    Yields count (puzzle, solution) pairs, generated on the given number of processes. Every puzzle gets its own seed
+    drawn from seed, so a seeded batch is the same however many workers make it.
+    """
+    seed_source = random.Random(seed)
+    seeds = [seed_source.getrandbits(64) for _ in range(count)]
+    if workers <= 1:
+        for puzzle_seed in seeds:
+            yield generate(random.Random(puzzle_seed), clues, difficulty, max_attempts, box_size)
+        return
+
+    chunks = [seeds[i:i + BATCH_CHUNK_SIZE] for i in range(0, count, BATCH_CHUNK_SIZE)]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for results in executor.map(_generate_chunk, chunks, repeat(clues), repeat(difficulty), repeat(max_attempts),
+                                    repeat(box_size)):
+            yield from results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1, help='number of puzzles to generate')
+    parser.add_argument('--clues', type=int, help='clues each puzzle should have (default: as few as possible)')
+    parser.add_argument('--difficulty', choices=DIFFICULTIES)
+    parser.add_argument('--seed', type=int, help='makes the output the same every run')
+    parser.add_argument('--workers', type=int, default=1, help='number of processes to generate puzzles in')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help='grids to try per puzzle before giving up on the targets')
+    parser.add_argument('--box-size', type=int, choices=(2, 3, 4, 5), default=BOX_SIZE,
+                        help='size of a section: 2 for 4x4 boards, 3 for 9x9, 4 for 16x16, 5 for 25x25')
+    args = parser.parse_args(argv)
+    cells = args.box_size ** 4
+    min_clues = MIN_CLUES if args.box_size == BOX_SIZE else 0
+    if args.clues is not None and not min_clues <= args.clues <= cells:
+        parser.error(f"--clues must be between {min_clues} and {cells}")
+
+    out = sys.stdout
+    try:
+        for puzzle, _ in generate_batch(args.count, args.workers, args.seed, args.clues, args.difficulty,
+                                        args.max_attempts, args.box_size):
+            out.write(format_board(puzzle) + '\n')
+    except ValueError as e:
+        # the targets could not be met in --max-attempts grids; the puzzles before it have been written
+        out.flush()
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""
+Lookup tables for the shape of the board, built once per board size.
+
+A board is made of box_size x box_size sections and has size = box_size² rows, columns, sections and digits: 4x4,
+the standard 9x9, 16x16 and 25x25 all work the same way. Cells are (row, col) tuples. Sections are numbered left to
+right, top to bottom. Units are the 3 * size groups of cells that must each hold every digit once, numbered
+0..size-1 for rows, then the columns, then the sections.
+
+Everything here is a tuple so the tables can be shared freely. Looping over them is cheaper than rebuilding the same
+coordinates with nested ranges and box arithmetic every time. geometry_of() returns the Geometry for a board, and the
+module-level names are the tables of the standard 9x9 board.
+"""
+import math
+from typing import Dict, Tuple
+
+
+class Geometry(object):
+    """ The lookup tables for a board whose sections are box_size cells on a side """
+    def __init__(self, box_size: int):
+        if box_size < 1:
+            raise ValueError(f"box_size must be at least 1, not {box_size}")
+        size = box_size * box_size
+        self.box_size = box_size
+        self.size = size
+
+        # the values a cell can hold
+        self.digits = tuple(range(1, size + 1))
+
+        # the first unit number of each kind
+        self.row_unit = 0
+        self.col_unit = size
+        self.box_unit = size * 2
+
+        # every cell in row-major order
+        self.cells = tuple((r, c) for r in range(size) for c in range(size))
+
+        # box_of[row][col] is the section the cell belongs to
+        self.box_of = tuple(tuple((r // box_size) * box_size + c // box_size for c in range(size))
+                            for r in range(size))
+
+        # row_cells[r], col_cells[c] and box_cells[b] are the cells in that row, column or section
+        self.row_cells = tuple(tuple((r, c) for c in range(size)) for r in range(size))
+        self.col_cells = tuple(tuple((r, c) for r in range(size)) for c in range(size))
+        self.box_cells = tuple(tuple(cell for cell in self.cells if self.box_of[cell[0]][cell[1]] == b)
+                               for b in range(size))
+
+        # units[u] are the cells in unit u
+        self.units = self.row_cells + self.col_cells + self.box_cells
+
+        # units_of[row][col] are the row, column and section unit numbers of the cell
+        self.units_of = tuple(tuple((self.row_unit + r, self.col_unit + c, self.box_unit + self.box_of[r][c])
+                                    for c in range(size)) for r in range(size))
+
+        # peers[row][col] are the cells that share a row, column or section with (row, col), not counting itself
+        self.peers = tuple(tuple(self._peers_of(r, c) for c in range(size)) for r in range(size))
+
+    def _peers_of(self, row: int, col: int) -> Tuple[Tuple[int, int], ...]:
+        cells = set(self.row_cells[row]) | set(self.col_cells[col]) | set(self.box_cells[self.box_of[row][col]])
+        cells.discard((row, col))
+        return tuple(sorted(cells))
+
+
+_GEOMETRIES: Dict[int, Geometry] = {}
+
+
+def geometry_for_size(size: int) -> Geometry:
+    """ Returns the shared Geometry for boards with size rows, which must be a square number """
+    geometry = _GEOMETRIES.get(size)
+    if geometry is None:
+        box_size = math.isqrt(size)
+        if size < 1 or box_size * box_size != size:
+            raise ValueError(f"A board must have a square number of rows, not {size}")
+        geometry = _GEOMETRIES[size] = Geometry(box_size)
+    return geometry
+
+
+def geometry_of(board) -> Geometry:
+    """ Returns the shared Geometry for a board, going by its number of rows """
+    return geometry_for_size(len(board))
+
+
+# The standard 9x9 board
+STANDARD = geometry_for_size(9)
+
+SIZE = STANDARD.size
+BOX_SIZE = STANDARD.box_size
+
+ROW_UNIT = STANDARD.row_unit
+COL_UNIT = STANDARD.col_unit
+BOX_UNIT = STANDARD.box_unit
+
+CELLS = STANDARD.cells
+BOX_OF = STANDARD.box_of
+ROW_CELLS = STANDARD.row_cells
+COL_CELLS = STANDARD.col_cells
+BOX_CELLS = STANDARD.box_cells
+UNITS = STANDARD.units
+UNITS_OF = STANDARD.units_of
+PEERS = STANDARD.peers
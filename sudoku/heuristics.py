@@ -0,0 +1,92 @@
+"""
+Branching heuristics decide which empty cell the search guesses at next. Value orderings decide in which order the
+values for that cell are tried. The Solver looks both up by name in BRANCHING_HEURISTICS and VALUE_ORDERINGS.
+
+A branching heuristic takes the state and returns the (row, column) of an unsolved cell, or None if there are none
+left. A value ordering takes the state and a cell and returns the values to try, best first.
+"""
+from typing import List, Optional, Tuple
+
+
+def live_choices(state, row: int, col: int) -> List[int]:
+    """
+    Returns the cell's choices that are also still open for its row and column. The cell lists only narrow down by
+    section, so this is a closer count of what can really go in the cell.
+    """
+    return state.get_live_choices(row, col)
+
+
+def first_unsolved(state) -> Optional[Tuple[int, int]]:
+    """ The first empty cell in row-major order """
+    for row, col in state.geometry.cells:
+        if not state.is_cell_solved(row, col):
+            return row, col
+    return None
+
+
+def minimum_remaining_values(state) -> Optional[Tuple[int, int]]:
+    """ The empty cell with the fewest choices left, so a wrong guess is found out as early as possible """
+    best = None
+    best_count = state.geometry.size + 1
+    for row, col in state.geometry.cells:
+        if state.is_cell_solved(row, col):
+            continue
+        count = len(live_choices(state, row, col))
+        if count < best_count:
+            best = (row, col)
+            best_count = count
+            if count <= 1:
+                # cannot do better than a forced value or a dead end
+                return best
+    return best
+
+
+def minimum_remaining_values_by_degree(state) -> Optional[Tuple[int, int]]:
+    """
+    Like minimum_remaining_values, but when several cells have the same number of choices, picks the one with the
+    most empty peers because its value constrains the most of the rest of the board.
+    """
+    best = None
+    peers = state.geometry.peers
+    best_key = (state.geometry.size + 1, 0)
+    for row, col in state.geometry.cells:
+        if state.is_cell_solved(row, col):
+            continue
+        count = len(live_choices(state, row, col))
+        if count <= 1:
+            return row, col
+        if count > best_key[0]:
+            continue
+        degree = sum(1 for r, c in peers[row][col] if not state.is_cell_solved(r, c))
+        if (count, -degree) < (best_key[0], -best_key[1]):
+            best = (row, col)
+            best_key = (count, degree)
+    return best
+
+
+def natural_order(state, row: int, col: int) -> List[int]:
+    """ The cell's live choices in the order the state lists them """
+    return list(live_choices(state, row, col))
+
+
+def least_constraining_value(state, row: int, col: int) -> List[int]:
+    """
+    The cell's live choices, ordered so that the value that rules out the fewest choices for empty peers comes first.
+    That keeps the most options open for the rest of the board.
+    """
+    open_peers = [state.get_choices_for_cell(r, c) for r, c in state.geometry.peers[row][col]
+                  if not state.is_cell_solved(r, c)]
+    choices = live_choices(state, row, col)
+    return sorted(choices, key=lambda v: sum(1 for peer_choices in open_peers if v in peer_choices))
+
+
+BRANCHING_HEURISTICS = {
+    'first': first_unsolved,
+    'mrv': minimum_remaining_values,
+    'mrv-degree': minimum_remaining_values_by_degree,
+}
+
+VALUE_ORDERINGS = {
+    'natural': natural_order,
+    'lcv': least_constraining_value,
+}
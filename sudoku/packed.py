@@ -0,0 +1,304 @@
+"""
+A packed binary format for large puzzle corpora, read through a memory map.
+
+Text files cost a parse per puzzle and have to be read from the start to find the millionth one. A packed file holds
+each puzzle as a fixed-width record of bits_per_cell bits per cell in row-major order, 0 for a blank: 4 bits for 9x9
+(41 bytes a puzzle, half the text), 5 for 16x16 and 25x25. Puzzle i is at a known offset, so the reader can jump
+straight to it, and a slice of the file is all a worker needs to solve its share.
+
+The layout, with the numbers in the header and index little-endian:
+    header    HEADER: magic, format version, box size, bits per cell, record size in bytes, puzzle count, and the
+              offset of the index
+    records   count records of record_size bytes, starting right after the header, with the first cell in the
+              highest bits
+    index     count 8-byte line numbers, the line each puzzle came from in the text file it was packed from, so
+              results can still be matched up with the original
+
+    $ python sudoku/packed.py pack puzzles.txt puzzles.sdkp
+    $ python sudoku/packed.py unpack puzzles.sdkp > puzzles.txt
+
+The solver reads packed files directly: python sudoku/sudoku_solver.py puzzles.sdkp
+"""
+import argparse
+import mmap
+import os
+import struct
+import sys
+from itertools import chain
+from typing import Iterator, List, Optional, Tuple
+
+from backends import create_state
+from geometry import BOX_SIZE, geometry_for_size
+from puzzle_io import format_board, iter_puzzles, parse_puzzle
+
+MAGIC = b'SDKP'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHBBIQQ')
+LINE_NUMBER = struct.Struct('<Q')
+
+Board = List[List[Optional[int]]]
+
+# Built on first use by _quads()
+_QUADS = None
+
+
+def bits_per_cell(size: int) -> int:
+    """ The bits needed for a cell of a board with size rows: any value from 0 (blank) to size """
+    return size.bit_length()
+
+
+def _quads() -> tuple:
+    """
+    Returns the table that decodes 4-bit records two bytes at a time: entry w is the four cells packed into the
+    16-bit big-endian word w, high bits first, with None for a blank. Decoding a word per lookup rather than a byte
+    or a cell is what makes reading a packed 9x9 file faster than parsing text.
+    """
+    global _QUADS
+    if _QUADS is None:
+        _QUADS = tuple((w >> 12 or None, w >> 8 & 0xF or None, w >> 4 & 0xF or None, w & 0xF or None)
+                       for w in range(1 << 16))
+    return _QUADS
+
+
+def is_packed(path: str) -> bool:
+    """ Whether the file at path starts like a packed corpus """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class PackedWriter(object):
+    """
+    Writes boards with box_size x box_size sections to a new packed file. The header is filled in by close(), so the
+    file is not readable until then; use it as a context manager. If the with block raises, the file is deleted
+    instead, as what was written before the error would read as a complete corpus.
+    """
+    def __init__(self, path: str, box_size=BOX_SIZE):
+        self.geometry = geometry_for_size(box_size * box_size)
+        self.bits = bits_per_cell(self.geometry.size)
+        num_bits = len(self.geometry.cells) * self.bits
+        self.record_size = (num_bits + 7) // 8
+        # records are padded with zero bits at the end to a whole number of bytes
+        self.padding = self.record_size * 8 - num_bits
+
+        self.path = path
+        self.file = open(path, 'wb')
+        self.file.write(b'\0' * HEADER.size)
+        self.line_numbers = []
+
+    def write(self, board: Board, line_number: int = None):
+        """ Adds a board. line_number is where it came from, by default its position in the file counting from 1. """
+        size = self.geometry.size
+        if len(board) != size or any(len(row) != size for row in board):
+            raise ValueError(f"Expected a {size}x{size} board")
+
+        packed = 0
+        for row in board:
+            for value in row:
+                if value is None:
+                    value = 0
+                elif not 1 <= value <= size:
+                    raise ValueError(f"Unexpected value {value} in a {size}x{size} board")
+                packed = (packed << self.bits) | value
+        self.file.write((packed << self.padding).to_bytes(self.record_size, 'big'))
+        self.line_numbers.append(line_number if line_number is not None else len(self.line_numbers) + 1)
+
+    def close(self):
+        if self.file.closed:
+            return
+        index_offset = self.file.tell()
+        for line_number in self.line_numbers:
+            self.file.write(LINE_NUMBER.pack(line_number))
+        self.file.seek(0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, self.geometry.box_size, self.bits, self.record_size,
+                                    len(self.line_numbers), index_offset))
+        self.file.close()
+
+    def discard(self):
+        """ Deletes an unfinished file instead of closing it. Does nothing once close() has been called. """
+        if self.file.closed:
+            return
+        self.file.close()
+        os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.discard()
+        else:
+            self.close()
+
+
+class PackedCorpus(object):
+    """
+    Reads a packed file through a memory map. Indexing with an integer decodes that board; slicing (without a step)
+    returns another PackedCorpus over that part of the file, sharing the same map, which is how the puzzles are split
+    between workers. Nothing is decoded until it is asked for.
+    """
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self.map) < HEADER.size:
+            raise ValueError(f"{path} is too short to be a packed corpus")
+        magic, version, box_size, bits, record_size, count, index_offset = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a packed corpus")
+        if version != VERSION:
+            raise ValueError(f"{path} is format version {version}, but only version {VERSION} can be read")
+
+        self.geometry = geometry_for_size(box_size * box_size)
+        self.bits = bits
+        self.record_size = record_size
+        self.index_offset = index_offset
+        if index_offset + count * LINE_NUMBER.size > len(self.map):
+            raise ValueError(f"{path} is truncated")
+
+        # with 4 bits per cell, the whole words in a record, then the odd byte if there is one
+        self.words = struct.Struct(f">{record_size // 2}H") if bits == 4 else None
+
+        # the puzzles this corpus covers, as positions in the file
+        self.start = 0
+        self.stop = count
+
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError('A packed corpus can only be sliced into a contiguous range')
+            view = object.__new__(PackedCorpus)
+            view.__dict__.update(self.__dict__)
+            view.start = self.start + start
+            view.stop = self.start + max(start, stop)
+            return view
+        return self.board(key)
+
+    def __iter__(self) -> Iterator[Board]:
+        for i in range(len(self)):
+            yield self.board(i)
+
+    def _position(self, i: int) -> int:
+        """ The position in the file of puzzle i of this corpus """
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(f"Puzzle {i} is out of range for a corpus of {len(self)}")
+        return self.start + i
+
+    def board(self, i: int) -> Board:
+        """ Decodes puzzle i into a board with None for blanks """
+        offset = HEADER.size + self._position(i) * self.record_size
+        size = self.geometry.size
+        if self.words is not None:
+            cells = list(chain.from_iterable(map(_quads().__getitem__, self.words.unpack_from(self.map, offset))))
+            if self.record_size % 2:
+                last = self.map[offset + self.record_size - 1]
+                cells.append(last >> 4 or None)
+                cells.append(last & 0xF or None)
+        else:
+            num_cells = len(self.geometry.cells)
+            record = self.map[offset:offset + self.record_size]
+            packed = int.from_bytes(record, 'big') >> (self.record_size * 8 - num_cells * self.bits)
+            mask = (1 << self.bits) - 1
+            cells = [(packed >> shift) & mask or None for shift in range((num_cells - 1) * self.bits, -1, -self.bits)]
+        # any padding at the end of the cells is left out by the slices
+        return [cells[start:start + size] for start in range(0, size * size, size)]
+
+    def line_number(self, i: int) -> int:
+        """ The line of the original text file that puzzle i came from """
+        return LINE_NUMBER.unpack_from(self.map, self.index_offset + self._position(i) * LINE_NUMBER.size)[0]
+
+    def state(self, i: int, backend='list'):
+        """ Decodes puzzle i straight into a fresh SolverState of the given backend """
+        return create_state(self.board(i), backend)
+
+    def iter_puzzles(self) -> Iterator[Tuple[int, Board]]:
+        """ Yields (line number, board) for each puzzle, like puzzle_io.iter_puzzles does with lines """
+        for i in range(len(self)):
+            yield self.line_number(i), self.board(i)
+
+    def shard(self, index: int, count: int) -> 'PackedCorpus':
+        """ Returns part index of count nearly equal contiguous parts, for splitting the corpus between workers """
+        if not 0 <= index < count:
+            raise ValueError(f"index must be between 0 and {count - 1}, not {index}")
+        return self[len(self) * index // count:len(self) * (index + 1) // count]
+
+    def close(self):
+        """ Unmaps the file, which closes every slice of it as well """
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def pack_text(source, path: str) -> int:
+    """
+    Packs the puzzles in a text stream, in the format puzzle_io.iter_puzzles reads, into a new packed file and returns
+    how many there were. Every puzzle must be the same size; a line that cannot be parsed raises ValueError, and no
+    file is left behind.
+    """
+    writer = None
+    try:
+        for line_number, line in iter_puzzles(source):
+            try:
+                board = parse_puzzle(line)
+            except ValueError as e:
+                raise ValueError(f"Line {line_number}: {e}") from None
+            if writer is None:
+                writer = PackedWriter(path, geometry_for_size(len(board)).box_size)
+            elif len(board) != writer.geometry.size:
+                raise ValueError(f"Line {line_number}: every puzzle in a packed file must be "
+                                 f"{writer.geometry.size}x{writer.geometry.size}")
+            writer.write(board, line_number)
+    except BaseException:
+        if writer is not None:
+            writer.discard()
+        raise
+    if writer is None:
+        # nothing to say what size the puzzles are, so the file is for 9x9
+        writer = PackedWriter(path)
+    writer.close()
+    return len(writer.line_numbers)
+
+
+def unpack_text(path: str, out) -> int:
+    """ Writes every puzzle in a packed file to a text stream, one line each, and returns how many there were """
+    with PackedCorpus(path) as corpus:
+        for board in corpus:
+            out.write(format_board(board) + '\n')
+        return len(corpus)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    pack = commands.add_parser('pack', help='convert a text file of puzzles to a packed file')
+    pack.add_argument('source', help='text file with one puzzle per line, or - for stdin')
+    pack.add_argument('destination')
+    unpack = commands.add_parser('unpack', help='write the puzzles in a packed file as text to stdout')
+    unpack.add_argument('source')
+    args = parser.parse_args(argv)
+
+    if args.command == 'pack':
+        source = sys.stdin if args.source == '-' else open(args.source)
+        try:
+            count = pack_text(source, args.destination)
+        except ValueError as e:
+            parser.error(str(e))
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        print(f"Packed {count} puzzles into {args.destination}", file=sys.stderr)
+    else:
+        unpack_text(args.source, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
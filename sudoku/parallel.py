@@ -0,0 +1,117 @@
+"""
+Spreads a batch of puzzles across worker processes.
+
+Solving is pure Python and CPU bound, so one process can only use one core. Puzzles are sent to the workers in chunks
+as they were read: text input as its 81-character lines, which are much smaller to send than boards or solver states,
+and a packed corpus as the boards it decodes to, pickled as nested lists, so they are not formatted and parsed again.
+Each chunk comes back as its output fields plus one StatsTracker for the whole chunk. Only a few chunks per worker are
+in flight at a time, so the input is still read lazily and memory stays constant however large it is.
+
+With the 'routed' engine the slow lane is put aside as batch.solve_stream does it: the workers hand back the puzzles
+routed there with their Route instead of solving them, and those are sent out again, one puzzle to a task, after the
+rest of the input or once MAX_DEFERRED of them are waiting.
+"""
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from typing import Iterable, Iterator, List, Tuple
+
+from batch import DEFERRED, MAX_DEFERRED, solve_line, write_results
+from routing import ROUTED
+from stats import StatsTracker
+
+# Puzzles sent to a worker at a time. Bigger chunks cost less to send, smaller ones balance the load better.
+DEFAULT_CHUNK_SIZE = 64
+
+# Chunks queued per worker, so a worker never sits idle waiting for the next one to be sent
+CHUNKS_IN_FLIGHT_PER_WORKER = 4
+
+
+def _solve_chunk(chunk: List[Tuple[int, str]], engine: str, options: dict) -> Tuple[List[dict], StatsTracker]:
+    """
+    Runs in a worker process. Solves every puzzle in the chunk and totals up their stats. Routed puzzles bound for
+    the slow lane are deferred rather than solved, unless the chunk holds their Routes already.
+    """
+    totals = StatsTracker()
+    results = []
+    for line_number, line in chunk:
+        fields, stats = solve_line(line_number, line, engine, defer_slow=engine == ROUTED, **options)
+        if stats is not None:
+            totals.merge(stats)
+        results.append(fields)
+    return results, totals
+
+
+def _chunks(puzzles: Iterable[Tuple[int, str]], chunk_size: int) -> Iterator[List[Tuple[int, str]]]:
+    puzzles = iter(puzzles)
+    while True:
+        chunk = list(islice(puzzles, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def solve_parallel(puzzles: Iterable[Tuple[int, str]], workers: int, totals: StatsTracker = None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, ordered=True, engine='propagation', **options) -> Iterator[dict]:
+    """
+    Solves (line number, puzzle line) pairs on a pool of worker processes and yields the output fields for each one.
+
+    With ordered=True the results come out in input order. With ordered=False each chunk is yielded as soon as it is
+    done, which keeps every worker busy when some chunks are much slower than others. Either way the routed slow
+    lane comes after the puzzles read before it (see the module docs). If totals is given, the stats from every
+    worker are merged into it.
+    """
+    max_in_flight = workers * CHUNKS_IN_FLIGHT_PER_WORKER
+    slow_lane = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+
+        def finished_chunks(wait_for_all: bool):
+            """ Yields the results of chunks that are done, waiting as little as the ordering allows """
+            while pending and (wait_for_all or len(pending) >= max_in_flight):
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                for future in done:
+                    results, chunk_totals = future.result()
+                    if totals is not None:
+                        totals.merge(chunk_totals)
+                    for fields in results:
+                        if fields['status'] == DEFERRED:
+                            slow_lane.append((fields['line'], fields['route']))
+                        else:
+                            yield fields
+
+        def solve_slow_lane():
+            """ Sends out the deferred puzzles one to a task, as each can take as long as a whole chunk """
+            routes = slow_lane[:]
+            slow_lane.clear()
+            for chunk in _chunks(routes, 1):
+                pending.append(executor.submit(_solve_chunk, chunk, engine, options))
+                yield from finished_chunks(wait_for_all=False)
+
+        for chunk in _chunks(puzzles, chunk_size):
+            pending.append(executor.submit(_solve_chunk, chunk, engine, options))
+            yield from finished_chunks(wait_for_all=False)
+            if len(slow_lane) >= MAX_DEFERRED:
+                yield from solve_slow_lane()
+        yield from finished_chunks(wait_for_all=True)
+        while slow_lane:
+            yield from solve_slow_lane()
+            yield from finished_chunks(wait_for_all=True)
+
+
+def solve_stream_parallel(puzzles: Iterable[Tuple[int, str]], out, workers: int, output_format='tsv',
+                          chunk_size=DEFAULT_CHUNK_SIZE, ordered=True, engine='propagation',
+                          **options) -> Tuple[dict, StatsTracker]:
+    """
+    The multi-process version of batch.solve_stream. Returns how many puzzles ended with each status, and the stats
+    of every solve across all workers added together.
+    """
+    totals = StatsTracker()
+    results = solve_parallel(puzzles, workers, totals, chunk_size, ordered, engine, **options)
+    return write_results(results, out, output_format), totals
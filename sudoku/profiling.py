@@ -0,0 +1,175 @@
+"""
+Finds out where the time goes when solving a puzzle file.
+
+    trace     solves each puzzle with a tracing.TraceRecorder and writes the trace to a file
+    summary   reads a trace back and prints, for each puzzle, the cells guessed at most, the biggest subtrees searched
+              for nothing, and the time each strategy took
+    profile   profiles the solve of a whole puzzle file, with any engine
+
+profile samples the stack every --interval-ms of CPU time by default, and writes how often each stack was seen in the
+folded format that flamegraph.pl, inferno and speedscope read. The sampling costs almost nothing, so the profile shows
+the solver as it normally runs; it needs Unix signals. --mode cprofile runs cProfile instead, which counts every
+call but slows small functions down a lot: the top functions are printed and --output gets the pstats file, which
+snakeviz and flameprof can draw.
+
+    $ python sudoku/profiling.py trace puzzles.txt trace.jsonl --heuristic mrv
+    $ python sudoku/profiling.py summary trace.jsonl
+    $ python sudoku/profiling.py profile puzzles.txt --engine dlx --output solve.folded
+    $ flamegraph.pl solve.folded > solve.svg
+"""
+import argparse
+import cProfile
+import os
+import pstats
+import signal
+import sys
+from collections import Counter
+
+from backends import STATE_BACKENDS
+from batch import solve_line
+from dispatcher import ENGINES
+from heuristics import BRANCHING_HEURISTICS, VALUE_ORDERINGS
+from puzzle_io import iter_puzzles, to_board
+from routing import ROUTED
+from solver import PROPAGATION_MODES, Solver
+from strategies import DEFAULT_STRATEGIES, parse_strategies
+from tracing import DEFAULT_TOP, TraceRecorder, format_summary, summarize_trace
+
+# Milliseconds of CPU time between stack samples
+DEFAULT_INTERVAL_MS = 1.0
+
+PROFILE_MODES = ('sample', 'cprofile')
+
+
+class StackSampler(object):
+    """
+    Samples the main thread's stack every interval seconds of CPU time with a SIGPROF timer, and counts how often each
+    stack was seen. Stacks start at the function passed to run(), so the sampler's own frames are left out.
+    """
+    def __init__(self, interval=DEFAULT_INTERVAL_MS / 1000):
+        self.interval = interval
+        self.counts = Counter()
+        self.root = None
+
+    def _sample(self, signum, frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            # co_qualname, which has the class in it, is new in Python 3.11
+            names.append(f"{module}.{getattr(code, 'co_qualname', code.co_name)}")
+            if code is self.root:
+                break
+            frame = frame.f_back
+        self.counts[';'.join(reversed(names))] += 1
+
+    def run(self, function, *args):
+        """ Calls function with args, sampling the stack until it returns, and returns what it returned """
+        self.root = function.__code__
+        previous = signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        try:
+            return function(*args)
+        finally:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, previous)
+
+    def write_folded(self, out):
+        """ Writes one line per stack, its frames from the outermost in separated by ';', then the sample count """
+        for stack, count in sorted(self.counts.items()):
+            out.write(f"{stack} {count}\n")
+
+
+def solve_all(puzzles, engine: str, options: dict) -> int:
+    """ Solves every puzzle in turn, as batch.solve_stream would but without writing anything. Returns how many. """
+    count = 0
+    for line_number, line in puzzles:
+        solve_line(line_number, line, engine, **options)
+        count += 1
+    return count
+
+
+def trace_file(puzzles, out, options: dict) -> int:
+    """ Solves every valid puzzle with a Solver that records a trace to out. Returns how many were traced. """
+    recorder = TraceRecorder(out)
+    count = 0
+    for _, line in puzzles:
+        try:
+            board = to_board(line)
+        except ValueError:
+            continue
+        Solver(board, tracer=recorder, **options).find_solution()
+        count += 1
+    return count
+
+
+def add_solver_options(parser: argparse.ArgumentParser):
+    parser.add_argument('--backend', choices=sorted(STATE_BACKENDS), default='list')
+    parser.add_argument('--heuristic', choices=sorted(BRANCHING_HEURISTICS), default='first')
+    parser.add_argument('--value-order', choices=sorted(VALUE_ORDERINGS), default='natural')
+    parser.add_argument('--propagation', choices=PROPAGATION_MODES, default='worklist')
+    parser.add_argument('--strategies', type=parse_strategies, default=DEFAULT_STRATEGIES)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    trace = commands.add_parser('trace', help='record a search trace of each puzzle with the propagation engine')
+    trace.add_argument('puzzles', help='file with one puzzle per line, or - for stdin')
+    trace.add_argument('trace', help='file to write the trace to')
+    add_solver_options(trace)
+    summary = commands.add_parser('summary', help='summarize a trace written by trace')
+    summary.add_argument('trace')
+    summary.add_argument('--top', type=int, default=DEFAULT_TOP, help='entries in each list')
+    profile = commands.add_parser('profile', help='profile the solve of a puzzle file')
+    profile.add_argument('puzzles', help='file with one puzzle per line, or - for stdin')
+    profile.add_argument('--engine', choices=['auto', ROUTED] + sorted(ENGINES), default='propagation')
+    profile.add_argument('--mode', choices=PROFILE_MODES, default='sample')
+    profile.add_argument('--interval-ms', type=float, default=DEFAULT_INTERVAL_MS,
+                         help='CPU time between stack samples')
+    profile.add_argument('--output', help='file for the folded stacks (default: stdout) or the pstats file')
+    add_solver_options(profile)
+    args = parser.parse_args(argv)
+
+    if args.command == 'summary':
+        if args.top < 1:
+            parser.error('--top must be at least 1')
+        with open(args.trace) as f:
+            for puzzle_summary in summarize_trace(f, args.top):
+                sys.stdout.write(format_summary(puzzle_summary))
+        return
+
+    options = {'backend': args.backend, 'heuristic': args.heuristic, 'value_order': args.value_order,
+               'propagation': args.propagation, 'strategies': args.strategies}
+    source = sys.stdin if args.puzzles == '-' else open(args.puzzles)
+    try:
+        puzzles = iter_puzzles(source)
+        if args.command == 'trace':
+            with open(args.trace, 'w') as out:
+                count = trace_file(puzzles, out, options)
+            print(f"Traced {count} puzzles into {args.trace}", file=sys.stderr)
+        elif args.mode == 'sample':
+            if args.interval_ms <= 0:
+                parser.error('--interval-ms must be positive')
+            sampler = StackSampler(args.interval_ms / 1000)
+            count = sampler.run(solve_all, puzzles, args.engine, options)
+            if args.output:
+                with open(args.output, 'w') as out:
+                    sampler.write_folded(out)
+            else:
+                sampler.write_folded(sys.stdout)
+            print(f"Solved {count} puzzles, {sum(sampler.counts.values())} samples", file=sys.stderr)
+        else:
+            profiler = cProfile.Profile()
+            count = profiler.runcall(solve_all, puzzles, args.engine, options)
+            if args.output:
+                profiler.dump_stats(args.output)
+            print(f"Solved {count} puzzles", file=sys.stderr)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats('cumulative').print_stats(25)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+"""
+Event-driven constraint propagation.
+
+Solver.make_consistent and Solver.iteratively_solve rescan the whole board after every change. WorklistPropagator
+applies the same rules, but only to the rows, columns and sections touched by a change:
+    - a solved cell's value is no longer possible for its row and column
+    - an empty cell can only hold a value that is still possible for its row or its column
+    - a row or column that still needs a value none of its empty cells can hold cannot be solved
+    - a row or column with one value left puts it in its only empty cell
+    - an empty cell where the row and column have exactly one value in common gets that value
+    - an empty cell cannot hold a value already in its section
+    - a cell with one possibility left gets that value
+Each change queues the units it affects, and the queue is worked until it is empty. The result is the same fixpoint
+the rescans reach, with work proportional to what changed rather than to the size of the board.
+"""
+from collections import deque
+
+from bitboard_state import BitboardSolverState, lowest_digit
+from exceptions import ConstraintViolationError
+
+
+class WorklistPropagator(object):
+    """
+    Keeps a SolverState consistent by propagating each change to the units it affects.
+
+    Changes go in through assign() and eliminate(), and propagate() works the queue to a fixpoint. A contradiction
+    raises ConstraintViolationError and empties the queue, so the caller can undo the state and carry on.
+    """
+    def __init__(self, state):
+        self.state = state
+        self.geometry = state.geometry
+        self.queue = deque()
+        self.queued = [False] * len(self.geometry.units)
+        self.seeded = False
+
+        # the unit numbers each kind of unit starts at, which propagate() looks at for every unit it takes off the queue
+        self.col_unit = self.geometry.col_unit
+        self.box_unit = self.geometry.box_unit
+
+        # rows and columns are worked on the masks directly when the state has them
+        if isinstance(state, BitboardSolverState):
+            self._process_line = self._process_line_masks
+
+    def _enqueue(self, unit: int):
+        if not self.queued[unit]:
+            self.queued[unit] = True
+            self.queue.append(unit)
+
+    def _cell_changed(self, row: int, col: int):
+        self._enqueue(self.geometry.row_unit + row)
+        self._enqueue(self.col_unit + col)
+
+    def clear(self):
+        """ Drops any queued work, e.g. after a contradiction """
+        self.queue.clear()
+        self.queued = [False] * len(self.geometry.units)
+
+    def seed(self):
+        """ Brings the clues into the possibility lists and queues every unit """
+        state = self.state
+        for r, c in self.geometry.cells:
+            if state.is_cell_solved(r, c):
+                state.update_board(r, c, state.board_at(r, c))
+        state.assert_still_valid()
+        for unit in range(len(self.geometry.units)):
+            self._enqueue(unit)
+        self.seeded = True
+
+    def assign(self, row: int, col: int, value: int):
+        """ Puts a value in an empty cell and queues the units around it. The state refuses a value a peer holds. """
+        geometry = self.geometry
+        self.state.update_board(row, col, value)
+        self._enqueue(geometry.row_unit + row)
+        self._enqueue(self.col_unit + col)
+        self._enqueue(self.box_unit + geometry.box_of[row][col])
+
+    def eliminate(self, row: int, col: int, value: int) -> bool:
+        """ Rules out a value for an empty cell. Returns False if it was already ruled out. """
+        if not self.state.mark_impossible_in_cell(row, col, value):
+            return False
+        self._narrowed(row, col)
+        return True
+
+    def _narrowed(self, row: int, col: int):
+        """ Follows up on a cell whose possibilities just shrank """
+        choices = self.state.get_choices_for_cell(row, col)
+        if len(choices) == 1:
+            self.assign(row, col, choices[0])
+        elif not choices:
+            raise ConstraintViolationError(f"Cell {row, col} has no possible values")
+        else:
+            self._cell_changed(row, col)
+
+    def propagate(self) -> int:
+        """ Works the queue until nothing changes. Returns how many units were processed. """
+        if not self.seeded:
+            self.seed()
+
+        processed = 0
+        queue = self.queue
+        queued = self.queued
+        row_unit = self.geometry.row_unit
+        col_unit = self.col_unit
+        box_unit = self.box_unit
+        try:
+            while queue:
+                unit = queue.popleft()
+                queued[unit] = False
+                processed += 1
+                if unit < col_unit:
+                    self._process_line(unit - row_unit, True)
+                elif unit < box_unit:
+                    self._process_line(unit - col_unit, False)
+                else:
+                    self._process_box(unit - box_unit)
+        except ConstraintViolationError:
+            self.clear()
+            raise
+        return processed
+
+    def _process_line(self, index: int, is_row: bool):
+        state = self.state
+        if is_row:
+            cells = self.geometry.row_cells[index]
+            remaining = state.get_choices_for_row(index)
+        else:
+            cells = self.geometry.col_cells[index]
+            remaining = state.get_choices_for_col(index)
+
+        # every value the line still needs has to fit in one of its empty cells
+        empty = [cell for cell in cells if not state.is_cell_solved(*cell)]
+        possible = set()
+        for r, c in empty:
+            possible.update(state.get_choices_for_cell(r, c))
+        for value in remaining:
+            if value not in possible:
+                raise ConstraintViolationError(f"No cell left for {value} in unit {index}")
+
+        # one value left goes in the one empty cell
+        if len(remaining) == 1:
+            if len(empty) != 1:
+                raise ConstraintViolationError(f"{len(empty)} empty cells left for {remaining} in unit {index}")
+            self.assign(*empty[0], remaining[0])
+            return
+
+        for r, c in empty:
+            row_choices = remaining if is_row else state.get_choices_for_row(r)
+            col_choices = state.get_choices_for_col(c) if is_row else remaining
+
+            # a cell can only hold what its row or its column still needs
+            choices = state.get_choices_for_cell(r, c)
+            allowed = [v for v in choices if v in row_choices or v in col_choices]
+            if len(allowed) != len(choices):
+                state.set_choices_for_cell(r, c, allowed)
+                self._narrowed(r, c)
+                if state.is_cell_solved(r, c):
+                    return
+
+            # a single value in common between the row and the column must go here
+            common = [v for v in row_choices if v in col_choices]
+            if len(common) == 1:
+                self.assign(r, c, common[0])
+                return
+
+    def _process_box(self, box: int):
+        state = self.state
+        cells = self.geometry.box_cells[box]
+        placed = [state.board_at(r, c) for r, c in cells if state.is_cell_solved(r, c)]
+        for r, c in cells:
+            if state.is_cell_solved(r, c):
+                continue
+            changed = False
+            for value in placed:
+                changed = state.mark_impossible_in_cell(r, c, value) or changed
+            if changed:
+                self._narrowed(r, c)
+                if state.is_cell_solved(r, c):
+                    # assign() queued this section again to remove the new value from the rest of it
+                    return
+
+    def _process_line_masks(self, index: int, is_row: bool):
+        """ _process_line for a BitboardSolverState, with the same rules applied to the masks """
+        state = self.state
+        if is_row:
+            cells = self.geometry.row_cells[index]
+            remaining = state.get_row_mask(index)
+        else:
+            cells = self.geometry.col_cells[index]
+            remaining = state.get_col_mask(index)
+
+        empty = [cell for cell in cells if not state.is_cell_solved(*cell)]
+        possible = 0
+        for r, c in empty:
+            possible |= state.get_cell_mask(r, c)
+        if remaining & ~possible:
+            raise ConstraintViolationError(f"No cell left for {lowest_digit(remaining & ~possible)} in unit {index}")
+
+        if remaining and not remaining & (remaining - 1):
+            if len(empty) != 1:
+                raise ConstraintViolationError(f"{len(empty)} empty cells left for {state.mask_values[remaining]} in "
+                                               f"unit {index}")
+            self.assign(*empty[0], lowest_digit(remaining))
+            return
+
+        for r, c in empty:
+            row_choices = remaining if is_row else state.get_row_mask(r)
+            col_choices = state.get_col_mask(c) if is_row else remaining
+
+            choices = state.get_cell_mask(r, c)
+            allowed = choices & (row_choices | col_choices)
+            if allowed != choices:
+                state.set_choices_for_cell(r, c, state.mask_values[allowed])
+                self._narrowed(r, c)
+                if state.is_cell_solved(r, c):
+                    return
+
+            common = row_choices & col_choices
+            if common and not common & (common - 1):
+                self.assign(r, c, lowest_digit(common))
+                return
@@ -0,0 +1,71 @@
+"""
+Reading and writing puzzles in the common one-line format: 81 characters in row-major order, with '.' or '0' for a
+blank cell. Blank lines and lines starting with '#' are ignored when reading a stream.
+
+Other board sizes use the same format with one character per cell, so a 4x4 puzzle is 16 characters, 16x16 is 256 and
+25x25 is 625. Digits past 9 are written as letters: A is 10, B is 11 and so on up to P for 25.
+"""
+import math
+from typing import Iterator, List, Optional, Tuple
+
+BLANKS = '.0'
+
+# SYMBOLS[v - 1] is the character for the digit v
+SYMBOLS = '123456789ABCDEFGHIJKLMNOP'
+
+_VALUE_OF = {ch: value for value, ch in enumerate(SYMBOLS, start=1)}
+_VALUE_OF.update({ch.lower(): value for ch, value in _VALUE_OF.items()})
+
+
+def symbol_of(value: Optional[int]) -> str:
+    """ Returns the character a cell value is written as, '.' for a blank """
+    return SYMBOLS[value - 1] if value else '.'
+
+
+def parse_puzzle(line: str) -> List[List[Optional[int]]]:
+    """
+    Turns a puzzle line into a board with None for blanks. The size comes from the length of the line: 81 characters
+    for 9x9, 256 for 16x16 and so on.
+    """
+    line = line.strip()
+    size = math.isqrt(math.isqrt(len(line)))
+    if size < 2 or size * size * size * size != len(line) or size * size > len(SYMBOLS):
+        raise ValueError(f"Expected 81 characters (or 16, 256 or 625) but got {len(line)}")
+    size *= size
+
+    board = []
+    for r in range(size):
+        row = []
+        for ch in line[r * size:r * size + size]:
+            if ch in BLANKS:
+                row.append(None)
+                continue
+            value = _VALUE_OF.get(ch, 0)
+            if not 1 <= value <= size:
+                raise ValueError(f"Unexpected character '{ch}' in puzzle")
+            row.append(value)
+        board.append(row)
+    return board
+
+
+def to_board(puzzle) -> List[List[Optional[int]]]:
+    """
+    Parses a puzzle line. A puzzle that is already a board, as packed.PackedCorpus gives them, is returned as is.
+    """
+    return parse_puzzle(puzzle) if isinstance(puzzle, str) else puzzle
+
+
+def format_board(board) -> str:
+    """ Turns a board back into a puzzle line, with '.' for blanks """
+    return ''.join(symbol_of(v) for row in board for v in row)
+
+
+def iter_puzzles(stream) -> Iterator[Tuple[int, str]]:
+    """
+    Yields (line number, puzzle line) for each puzzle in a text stream. Lines are read one at a time so a file of any
+    size can be processed in constant memory.
+    """
+    for line_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line_number, line
@@ -0,0 +1,238 @@
+"""
+Predicts how much work each puzzle needs and routes it accordingly.
+
+dispatcher.choose_engine goes by the number of clues, which says little about how hard a puzzle really is. The Router
+runs a cheap pre-pass first: the worklist propagation with only the basic rules, which costs about a millisecond on a
+9x9 board and finishes most everyday puzzles outright. What it leaves open is measured (see puzzle_features) and a
+CostModel predicts how long the search engine will take on it. Each puzzle then goes to one of three lanes:
+    inline   the pre-pass solved it, or found it has no solution, and its result is the answer
+    search   the search engine solves the board the pre-pass left, which already has the easy cells filled in
+    slow     the same, but the prediction is over slow_ms, so callers that can should put it aside until the rest are
+             done: batch.solve_stream solves these last, and the service has a separate queue and pool for them
+
+The default model was fitted on DLX solves of the corpus tiers and of some sparse 16x16 and 25x25 boards. A puzzle's
+difficulty is hard to predict from its candidates alone, and it explains about 60% of the variance of the log time.
+Every routed solve can be written to a log with its features, prediction and actual time, and the fit command fits the
+model again from such a log:
+
+    $ python sudoku/sudoku_solver.py puzzles.txt --engine routed --routing-log routing.jsonl
+    $ python sudoku/routing.py fit routing.jsonl
+"""
+import argparse
+import json
+import math
+import sys
+from typing import Iterable
+
+from dispatcher import ENGINES, create_solver
+from exceptions import ConstraintViolationError
+from puzzle_io import format_board
+from solve_result import SolveResult
+from solver import Solver
+from stats import StatsTracker
+from strategies import BASIC_STRATEGIES
+
+# The engine name that sends puzzles through a Router rather than straight to an engine
+ROUTED = 'routed'
+
+# The lanes a Router sends puzzles to
+INLINE = 'inline'
+SEARCH = 'search'
+SLOW = 'slow'
+
+# Predicted search time in milliseconds above which a puzzle goes to the slow lane
+DEFAULT_SLOW_MS = 50.0
+
+# The default CostModel, fitted with CostModel.fit as described above
+DEFAULT_INTERCEPT = -12.15
+DEFAULT_BITS_WEIGHT = 4.97
+
+# Routing log files opened by this process, by path, so each is opened once however many Routers write to it
+_LOG_FILES = {}
+
+
+def puzzle_features(state) -> dict:
+    """
+    Measures what is left of a board after propagation:
+        empty_cells    cells without a value
+        candidates     values still possible, summed over the empty cells
+        search_bits    log2 of the number of ways to fill the empty cells from their candidates
+        open_units     rows, columns and sections with an empty cell
+    """
+    geometry = state.geometry
+    empty = [(r, c) for r, c in geometry.cells if not state.is_cell_solved(r, c)]
+    counts = [len(state.get_choices_for_cell(r, c)) for r, c in empty]
+    return {
+        'empty_cells': len(empty),
+        'candidates': sum(counts),
+        'search_bits': round(sum(math.log2(count) for count in counts if count), 3),
+        'open_units': sum(1 for unit in geometry.units if any(not state.is_cell_solved(r, c) for r, c in unit)),
+    }
+
+
+class CostModel(object):
+    """
+    Predicts the search engine's time in milliseconds on a board the pre-pass left open, as
+    exp(intercept + bits_weight * search_bits / empty_cells): the more candidates the average empty cell has left, the
+    bigger the tree.
+    """
+    def __init__(self, intercept=DEFAULT_INTERCEPT, bits_weight=DEFAULT_BITS_WEIGHT):
+        self.intercept = intercept
+        self.bits_weight = bits_weight
+
+    def predict_ms(self, features: dict) -> float:
+        if not features['empty_cells']:
+            return 0.0
+        exponent = self.intercept + self.bits_weight * features['search_bits'] / features['empty_cells']
+        # far past any time worth waiting for, and exp() would overflow
+        return math.exp(min(exponent, 50.0))
+
+    @classmethod
+    def fit(cls, records: Iterable[dict]) -> 'CostModel':
+        """
+        Fits a model to routing log records by least squares on the log of search_ms. Records from the inline lane
+        are skipped, as they did no search. Raises ValueError if there are fewer than two usable records.
+        """
+        points = [(record['search_bits'] / record['empty_cells'], math.log(max(record['search_ms'], 0.01)))
+                  for record in records if record['lane'] != INLINE and record['empty_cells']]
+        if len(points) < 2:
+            raise ValueError(f"Need at least two searched puzzles to fit a model, not {len(points)}")
+        mean_x = sum(x for x, _ in points) / len(points)
+        mean_y = sum(y for _, y in points) / len(points)
+        spread = sum((x - mean_x) ** 2 for x, _ in points)
+        if not spread:
+            raise ValueError('Every puzzle has the same features, so there is nothing to fit')
+        weight = sum((x - mean_x) * (y - mean_y) for x, y in points) / spread
+        return cls(mean_y - weight * mean_x, weight)
+
+
+class Route(object):
+    """
+    Where the Router sent a puzzle. board is the board as the pre-pass left it, features and predicted_ms what it
+    measured and predicted, and engine the engine the search lanes use. For the inline lane, result already holds the
+    answer.
+    """
+    def __init__(self, puzzle, board, lane: str, engine: str, predicted_ms: float, features: dict,
+                 stats: StatsTracker, result: SolveResult = None):
+        self.puzzle = puzzle
+        self.board = board
+        self.lane = lane
+        self.engine = engine
+        self.predicted_ms = predicted_ms
+        self.features = features
+        self.stats = stats
+        self.result = result
+
+
+class Router(object):
+    """
+    Routes puzzles to a lane with a pre-pass and a CostModel (see the module docs) and solves them there.
+
+    search_engine is the engine for the search and slow lanes (see dispatcher.ENGINES). log is a path that a line is
+    appended to for every solve, with the features, the lane, the predicted and the actual search time. Routers are
+    cheap to make and can be sent to worker processes; each process opens the log for itself.
+    """
+    def __init__(self, slow_ms=DEFAULT_SLOW_MS, model: CostModel = None, search_engine='dlx', log: str = None):
+        if search_engine not in ENGINES:
+            raise ValueError(f"Unknown engine '{search_engine}'. Expected one of {sorted(ENGINES)}")
+        self.slow_ms = slow_ms
+        self.model = model if model is not None else CostModel()
+        self.search_engine = search_engine
+        self.log = log
+
+    def route(self, board) -> Route:
+        """ Runs the pre-pass on a board and decides where it goes. The board itself is left as it is. """
+        stats = StatsTracker()
+        stats.start_timer()
+        solver = Solver([row[:] for row in board], backend='bitboard', strategies=BASIC_STRATEGIES)
+        started = stats.clock()
+        try:
+            stats.num_iterations += solver.propagator.propagate()
+            consistent = True
+        except ConstraintViolationError:
+            stats.on_contradiction()
+            consistent = False
+        stats.add_phase_time('propagation', started)
+        state = solver.state
+        features = puzzle_features(state)
+
+        if not consistent or not features['empty_cells']:
+            stats.stop_timer()
+            status = SolveResult.SOLVED if consistent else SolveResult.UNSOLVABLE
+            result = SolveResult(status, state.board if consistent else board, stats)
+            return Route(board, state.board, INLINE, 'prepass', 0.0, features, stats, result)
+
+        stats.stop_timer()
+        predicted_ms = self.model.predict_ms(features)
+        lane = SLOW if predicted_ms > self.slow_ms else SEARCH
+        return Route(board, state.board, lane, self.search_engine, predicted_ms, features, stats)
+
+    def solve(self, route: Route, stats: StatsTracker = None, **options) -> SolveResult:
+        """
+        Solves a routed puzzle in its lane and returns the result, with route set to the Route. The options are
+        passed to the search engine. Stats are collected into stats if given, together with the pre-pass's.
+        """
+        if stats is None:
+            stats = StatsTracker()
+        if route.result is not None:
+            result = route.result
+            stats.merge(result.stats)
+            search_ns = 0
+        else:
+            search_stats = StatsTracker()
+            result = create_solver([row[:] for row in route.board], engine=route.engine,
+                                   **options).find_solution(search_stats)
+            stats.merge(route.stats)
+            stats.merge(search_stats)
+            search_ns = search_stats.get_elapsed_ns()
+            if result.status == SolveResult.UNSOLVABLE:
+                result.board = route.puzzle
+
+        result = SolveResult(result.status, result.board, stats, result.reason)
+        result.route = route
+        if self.log is not None:
+            self._write_log(route, result, search_ns)
+        return result
+
+    def _write_log(self, route: Route, result: SolveResult, search_ns: int):
+        log = _LOG_FILES.get(self.log)
+        if log is None:
+            # line buffered, so lines from several processes appending to the same file are not mixed up
+            log = _LOG_FILES[self.log] = open(self.log, 'a', buffering=1)
+        record = {
+            'puzzle': format_board(route.puzzle),
+            'lane': route.lane,
+            'engine': route.engine,
+            'status': result.status,
+            'predicted_ms': round(route.predicted_ms, 3),
+            'search_ms': round(search_ns / 1e6, 3),
+            'prepass_ms': round(route.stats.get_elapsed_time() * 1000, 3),
+            'nodes': result.stats.num_nodes,
+            **route.features,
+        }
+        log.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    fit = commands.add_parser('fit', help='fit the cost model to a routing log and print its constants')
+    fit.add_argument('log', help='a file written with --routing-log')
+    args = parser.parse_args(argv)
+
+    with open(args.log) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    try:
+        model = CostModel.fit(records)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"DEFAULT_INTERCEPT = {model.intercept:.2f}")
+    print(f"DEFAULT_BITS_WEIGHT = {model.bits_weight:.2f}")
+    searched = [record for record in records if record['lane'] != INLINE and record['empty_cells']]
+    errors = sorted(abs(math.log(model.predict_ms(record) / max(record['search_ms'], 0.01))) for record in searched)
+    print(f"{len(searched)} searched puzzles, median prediction off by a factor of "
+          f"{math.exp(errors[len(errors) // 2]):.1f}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
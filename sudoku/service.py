@@ -0,0 +1,474 @@
+"""
+A local solving service on asyncio, speaking JSON lines over TCP.
+
+Each request is one JSON object on its own line and gets one JSON line back:
+
+    {"id": 7, "puzzle": "4.....8.5.3..........7......2.....6.....8.4...", "deadline_ms": 500}
+    {"id":7,"status":"solved","solution":"417369825632158947...","ms":3.12,"passes":4,"guesses":9,...}
+
+id is optional and echoed back as is, so a client can send many requests on one connection without waiting and match
+up the answers, which come back as each one finishes. engine picks the engine for that request. {"op": "metrics"}
+returns the service's counters instead of solving anything.
+
+Solving is CPU bound, so it runs on a pool of worker processes and the event loop only moves bytes. Requests that
+arrive close together are sent to a worker as one batch, which costs much less than one round trip per puzzle: a
+batch goes out once it holds --batch-size requests or its first request has waited --batch-wait-ms. At most two
+batches per worker are out at a time; the rest wait in the queue, and its depth is one of the metrics.
+
+With the 'routed' engine (see routing.py), a worker that finds a request belongs in the slow lane hands it back
+unsolved, and it goes to a queue of its own that a separate pool of --slow-workers processes works through one puzzle
+at a time. A few puzzles that take seconds then hold up nothing but each other, rather than every request batched or
+queued behind them. The answer says which lane the puzzle took.
+
+A request whose deadline passes gets the status 'timeout'. If it is still queued it is never solved, a worker skips
+it if the deadline has passed by the time it gets to it, and a solve that is already running is stopped by a
+SearchBudget with the same deadline. Closing the connection cancels the requests on it that have not been answered.
+Those are dropped from the queue, and the ones already sent to a worker are cancelled through the CancellationToken
+their budget holds: each request out at a worker has a flag in an array shared with the worker processes, so the
+worker skips it or stops its solve within a few dozen nodes and moves on to the rest of the batch.
+
+    $ python sudoku/service.py --port 8765 --workers 4
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+from backends import STATE_BACKENDS
+from batch import DEFERRED, INVALID, solve_line
+from budget import CANCELLED, DEADLINE, CancellationToken, SearchBudget
+from dispatcher import ENGINES
+from heuristics import BRANCHING_HEURISTICS, VALUE_ORDERINGS
+from routing import DEFAULT_SLOW_MS, ROUTED, Router
+from solver import PROPAGATION_MODES
+from stats import percentile
+from strategies import DEFAULT_STRATEGIES, parse_strategies
+
+# Status sent when a request's deadline passed before it was solved
+TIMEOUT = 'timeout'
+
+# Status sent when solving a request failed in a way that is not the request's fault
+ERROR = 'error'
+
+DEFAULT_PORT = 8765
+
+# Requests sent to a worker together, and how long the first of them waits for the others
+DEFAULT_BATCH_SIZE = 16
+DEFAULT_BATCH_WAIT = 0.002
+
+# Batches handed to each worker before the rest have to wait in the queue
+BATCHES_IN_FLIGHT_PER_WORKER = 2
+
+# Latencies kept for the percentiles in the metrics
+LATENCY_WINDOW = 4096
+
+# Longest request line accepted, which fits a 25x25 puzzle with plenty to spare
+MAX_LINE_LENGTH = 1 << 16
+
+# Set in each worker process by _start_worker: the cancellation flags shared with the service, one per slot
+_cancel_flags = None
+
+
+class _SlotToken(CancellationToken):
+    """ A CancellationToken that works across processes, backed by one slot of the shared cancellation flags """
+    def __init__(self, flags, slot: int):
+        self.flags = flags
+        self.slot = slot
+
+    def cancel(self):
+        self.flags[self.slot] = 1
+
+    @property
+    def cancelled(self) -> bool:
+        return bool(self.flags[self.slot])
+
+
+def _start_worker(cancel_flags):
+    global _cancel_flags
+    _cancel_flags = cancel_flags
+
+
+def _solve_batch(items: List[Tuple[str, str, Optional[float], int]], options: dict, defer_slow=False) -> List[dict]:
+    """
+    Runs in a worker process. Solves each (puzzle line, engine, deadline, slot) in turn, skipping the ones whose
+    deadline has passed or whose slot has been cancelled. Deadlines are time.time() values, so they mean the same
+    thing in every process. With defer_slow, routed puzzles bound for the slow lane are not solved but get the status
+    'deferred' and their Route, which is sent back in place of the puzzle line to solve them in the slow lane.
+    """
+    results = []
+    for line, engine, deadline, slot in items:
+        token = _SlotToken(_cancel_flags, slot)
+        if token.cancelled:
+            # nobody is waiting for the answer any more
+            results.append({'status': CANCELLED})
+            continue
+        if deadline is not None and time.time() >= deadline:
+            results.append({'status': TIMEOUT})
+            continue
+        try:
+            budget = SearchBudget(deadline=deadline, token=token)
+            fields, _ = solve_line(0, line, engine, budget=budget, defer_slow=defer_slow, **options)
+        except ValueError as e:
+            # an engine name the dispatcher does not know
+            fields = {'status': INVALID, 'error': str(e)}
+        except Exception as e:
+            # answered on its own, so it does not take the rest of the batch down with it
+            fields = {'status': ERROR, 'error': repr(e)}
+        fields.pop('line', None)
+        if fields.get('reason') == DEADLINE:
+            fields['status'] = TIMEOUT
+        elif fields.get('reason') == CANCELLED:
+            fields['status'] = CANCELLED
+        results.append(fields)
+    return results
+
+
+class _Request(object):
+    def __init__(self, line: str, engine: str, deadline: Optional[float], future: asyncio.Future):
+        self.line = line
+        self.engine = engine
+        self.deadline = deadline
+        self.future = future
+        # the request's cancellation flag while it is out at a worker, otherwise None
+        self.slot = None
+        # the Route a worker deferred the request to the slow lane with, so it is not routed again there
+        self.route = None
+
+
+class ServiceMetrics(object):
+    """ Counters for a running service, and the latencies of the most recent requests """
+    def __init__(self):
+        self.started = time.time()
+        self.received = 0
+        self.cancelled = 0
+        self.batches = 0
+        self.batched_requests = 0
+        self.in_flight = 0
+        # requests handed back by the main workers to be solved in the slow lane
+        self.deferred = 0
+        self.status_counts = {}
+        self.latencies_ms = deque(maxlen=LATENCY_WINDOW)
+
+    def on_response(self, status: str, latency: float):
+        self.status_counts[status] = self.status_counts.get(status, 0) + 1
+        self.latencies_ms.append(latency * 1000)
+
+    def on_batch(self, size: int):
+        self.batches += 1
+        self.batched_requests += size
+
+    def to_dict(self, queue_depth: int, slow_lane_depth=0) -> dict:
+        latencies = sorted(self.latencies_ms)
+        return {
+            'uptime_seconds': round(time.time() - self.started, 3),
+            'queue_depth': queue_depth,
+            'slow_lane_depth': slow_lane_depth,
+            'deferred': self.deferred,
+            'in_flight': self.in_flight,
+            'received': self.received,
+            'cancelled': self.cancelled,
+            'responses': dict(self.status_counts),
+            'batches': self.batches,
+            'mean_batch_size': round(self.batched_requests / self.batches, 2) if self.batches else 0.0,
+            'latency_ms': {f"p{p}": round(percentile(latencies, p), 3) for p in (50, 95, 99)},
+        }
+
+
+class SolveService(object):
+    """
+    Solves puzzle lines on a pool of worker processes, batching requests that arrive together. Call start() from
+    inside the event loop before solving, and close() when done.
+
+    engine and the other options are the defaults for every request; default_deadline is in seconds, or None for
+    no deadline. Routed requests go through the router option, a routing.Router, and the slow lane has slow_workers
+    processes of its own.
+    """
+    def __init__(self, workers=1, batch_size=DEFAULT_BATCH_SIZE, batch_wait=DEFAULT_BATCH_WAIT,
+                 default_deadline: float = None, engine='auto', slow_workers=1, **options):
+        if workers < 1 or batch_size < 1 or slow_workers < 1:
+            raise ValueError('workers, batch_size and slow_workers must be at least 1')
+        self.workers = workers
+        self.slow_workers = slow_workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.default_deadline = default_deadline
+        self.engine = engine
+        self.options = options
+        self.metrics = ServiceMetrics()
+        self.queue = None
+        self.executor = None
+        self.batcher = None
+        self.batch_slots = None
+        self.slow_queue = None
+        self.slow_executor = None
+        self.slow_lane = None
+        self.slow_slots = None
+        self.cancel_flags = None
+        self.free_flags = None
+
+    async def start(self):
+        # one cancellation flag for every request that can be out at a worker at once
+        flags = self.workers * BATCHES_IN_FLIGHT_PER_WORKER * self.batch_size + self.slow_workers
+        self.cancel_flags = multiprocessing.RawArray('b', flags)
+        self.free_flags = list(range(flags))
+        self.queue = asyncio.Queue()
+        self.batch_slots = asyncio.Semaphore(self.workers * BATCHES_IN_FLIGHT_PER_WORKER)
+        self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_start_worker,
+                                            initargs=(self.cancel_flags,))
+        self.batcher = asyncio.create_task(self._run_batches())
+        self.slow_queue = asyncio.Queue()
+        self.slow_slots = asyncio.Semaphore(self.slow_workers)
+        # the processes are only started once something is sent to the slow lane
+        self.slow_executor = ProcessPoolExecutor(max_workers=self.slow_workers, initializer=_start_worker,
+                                                 initargs=(self.cancel_flags,))
+        self.slow_lane = asyncio.create_task(self._run_slow_lane())
+
+    async def close(self):
+        for task in (self.batcher, self.slow_lane):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for queue in (self.queue, self.slow_queue):
+            while not queue.empty():
+                queue.get_nowait().future.cancel()
+        # stop the solves still running, so the workers can exit
+        for flag in range(len(self.cancel_flags)):
+            self.cancel_flags[flag] = 1
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.slow_executor.shutdown(wait=False, cancel_futures=True)
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def slow_lane_depth(self) -> int:
+        return self.slow_queue.qsize() if self.slow_queue is not None else 0
+
+    async def solve(self, line: str, engine: str = None, deadline: float = None) -> dict:
+        """
+        Solves a puzzle line and returns the same fields batch.solve_line does, without 'line'. deadline is in
+        seconds from now. If it passes first, the status is 'timeout'. Cancelling the call drops the request.
+        """
+        started = time.time()
+        self.metrics.received += 1
+        if deadline is None:
+            deadline = self.default_deadline
+        request = _Request(line, engine or self.engine, started + deadline if deadline is not None else None,
+                           asyncio.get_running_loop().create_future())
+        self.queue.put_nowait(request)
+        try:
+            fields = await asyncio.wait_for(asyncio.shield(request.future), deadline)
+        except asyncio.TimeoutError:
+            self._cancel(request)
+            fields = {'status': TIMEOUT}
+        except asyncio.CancelledError:
+            self._cancel(request)
+            self.metrics.cancelled += 1
+            raise
+        self.metrics.on_response(fields['status'], time.time() - started)
+        return fields
+
+    def _cancel(self, request: _Request):
+        """ Drops a request from the queue, or stops its solve if a worker already has it """
+        request.future.cancel()
+        if request.slot is not None:
+            self.cancel_flags[request.slot] = 1
+
+    def _send_out(self, batch: List[_Request]) -> list:
+        """ Gives each request in a batch going to a worker a cleared cancellation flag, and returns the items """
+        for request in batch:
+            request.slot = self.free_flags.pop()
+            self.cancel_flags[request.slot] = 0
+        return [(request.route if request.route is not None else request.line, request.engine, request.deadline,
+                 request.slot) for request in batch]
+
+    async def _next_batch(self) -> List[_Request]:
+        """ Waits for a request, then gathers whatever else arrives within batch_wait, skipping cancelled ones """
+        batch = []
+        while not batch:
+            request = await self.queue.get()
+            if not request.future.done():
+                batch.append(request)
+        wait_until = asyncio.get_running_loop().time() + self.batch_wait
+        while len(batch) < self.batch_size:
+            remaining = wait_until - asyncio.get_running_loop().time()
+            try:
+                request = self.queue.get_nowait() if remaining <= 0 else await asyncio.wait_for(self.queue.get(),
+                                                                                                 remaining)
+            except (asyncio.QueueEmpty, asyncio.TimeoutError):
+                break
+            if not request.future.done():
+                batch.append(request)
+        return batch
+
+    async def _run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.batch_slots.acquire()
+            batch = await self._next_batch()
+            # requests may have timed out or been cancelled while waiting for a slot
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                self.batch_slots.release()
+                continue
+            self.metrics.on_batch(len(batch))
+            self.metrics.in_flight += len(batch)
+            items = self._send_out(batch)
+            work = loop.run_in_executor(self.executor, _solve_batch, items, self.options, True)
+            work.add_done_callback(lambda done, batch=batch: self._finish_batch(batch, done, self.batch_slots))
+
+    async def _run_slow_lane(self):
+        """ Sends the requests deferred to the slow lane to its own pool, one puzzle per process at a time """
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slow_slots.acquire()
+            request = await self.slow_queue.get()
+            if request.future.done():
+                self.slow_slots.release()
+                continue
+            self.metrics.in_flight += 1
+            items = self._send_out([request])
+            work = loop.run_in_executor(self.slow_executor, _solve_batch, items, self.options)
+            work.add_done_callback(lambda done, batch=[request]: self._finish_batch(batch, done, self.slow_slots))
+
+    def _finish_batch(self, batch: List[_Request], done: asyncio.Future, slots: asyncio.Semaphore):
+        slots.release()
+        self.metrics.in_flight -= len(batch)
+        for request in batch:
+            self.free_flags.append(request.slot)
+            request.slot = None
+        if done.cancelled():
+            results = [None] * len(batch)
+        elif done.exception() is not None:
+            results = [{'status': ERROR, 'error': repr(done.exception())}] * len(batch)
+        else:
+            results = done.result()
+        for request, fields in zip(batch, results):
+            if request.future.done():
+                continue
+            if fields is None:
+                request.future.cancel()
+            elif fields['status'] == DEFERRED:
+                self.metrics.deferred += 1
+                request.route = fields['route']
+                self.slow_queue.put_nowait(request)
+            else:
+                request.future.set_result(fields)
+
+
+async def handle_connection(service: SolveService, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """ Answers the requests on one connection until the client closes it, then cancels whatever is unanswered """
+    pending = set()
+
+    async def send(response: dict):
+        writer.write(json.dumps(response, separators=(',', ':')).encode() + b'\n')
+        await writer.drain()
+
+    async def answer(request: dict, deadline: Optional[float]):
+        fields = await service.solve(request['puzzle'], request.get('engine'), deadline)
+        try:
+            await send({'id': request.get('id'), **fields})
+        except ConnectionError:
+            pass
+
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            request = None
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('a request must be a JSON object')
+                if request.get('op') == 'metrics':
+                    await send(service.metrics.to_dict(service.queue_depth(), service.slow_lane_depth()))
+                    continue
+                if not isinstance(request.get('puzzle'), str):
+                    raise ValueError("a request needs a 'puzzle' string")
+                deadline_ms = request.get('deadline_ms')
+                if deadline_ms is not None and (isinstance(deadline_ms, bool) or
+                                                not isinstance(deadline_ms, (int, float)) or not deadline_ms >= 0):
+                    # not deadline_ms >= 0 also turns away NaN, which json.loads accepts
+                    raise ValueError("'deadline_ms' must be a number of milliseconds, at least 0")
+                engine = request.get('engine')
+                if engine is not None and (not isinstance(engine, str) or
+                                           engine not in ENGINES and engine not in ('auto', ROUTED)):
+                    raise ValueError(f"'engine' must be one of {', '.join(['auto', ROUTED] + sorted(ENGINES))}")
+            except ValueError as e:
+                # json.JSONDecodeError is a ValueError
+                await send({'id': request.get('id') if isinstance(request, dict) else None,
+                            'status': INVALID, 'error': str(e)})
+                continue
+            task = asyncio.create_task(answer(request, deadline_ms / 1000 if deadline_ms is not None else None))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+    except (ConnectionError, ValueError, asyncio.CancelledError):
+        # a dropped connection, a line over MAX_LINE_LENGTH, or the server shutting down
+        pass
+    finally:
+        for task in pending:
+            task.cancel()
+        writer.close()
+
+
+async def serve(host='127.0.0.1', port=DEFAULT_PORT, **service_options):
+    """ Runs the service until it is cancelled """
+    service = SolveService(**service_options)
+    await service.start()
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(service, reader, writer),
+                                        host, port, limit=MAX_LINE_LENGTH)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=1, help='number of processes to solve puzzles in')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='requests sent to a worker process at a time')
+    parser.add_argument('--batch-wait-ms', type=float, default=DEFAULT_BATCH_WAIT * 1000,
+                        help='how long a request waits for others to batch with')
+    parser.add_argument('--deadline-ms', type=float, help='deadline for requests that do not set their own')
+    parser.add_argument('--engine', choices=['auto', ROUTED] + sorted(ENGINES), default='auto')
+    parser.add_argument('--slow-workers', type=int, default=1,
+                        help=f"processes for the puzzles the '{ROUTED}' engine puts in the slow lane")
+    parser.add_argument('--slow-lane-ms', type=float, default=DEFAULT_SLOW_MS,
+                        help='predicted solve time above which a routed puzzle goes to the slow lane')
+    parser.add_argument('--routing-log', help='append every routed puzzle\'s features, lane and predicted and actual '
+                                              'time to this file as JSON lines')
+    parser.add_argument('--backend', choices=sorted(STATE_BACKENDS), default='list')
+    parser.add_argument('--heuristic', choices=sorted(BRANCHING_HEURISTICS), default='first')
+    parser.add_argument('--value-order', choices=sorted(VALUE_ORDERINGS), default='natural')
+    parser.add_argument('--propagation', choices=PROPAGATION_MODES, default='worklist')
+    parser.add_argument('--strategies', type=parse_strategies, default=DEFAULT_STRATEGIES)
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.batch_size < 1 or args.slow_workers < 1:
+        parser.error('--workers, --batch-size and --slow-workers must be at least 1')
+
+    try:
+        asyncio.run(serve(args.host, args.port, workers=args.workers, batch_size=args.batch_size,
+                          batch_wait=args.batch_wait_ms / 1000,
+                          default_deadline=args.deadline_ms / 1000 if args.deadline_ms is not None else None,
+                          engine=args.engine, slow_workers=args.slow_workers,
+                          router=Router(args.slow_lane_ms, log=args.routing_log), backend=args.backend,
+                          heuristic=args.heuristic, value_order=args.value_order, propagation=args.propagation,
+                          strategies=args.strategies))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,26 @@
+class SolveResult(object):
+    """
+    What a solve produced, for callers that want the answer as data instead of printed output.
+
+    board is the board as the solver left it: the full solution when status is SOLVED, otherwise whatever could be
+    worked out. stats is the StatsTracker for the run.
+
+    When the solver's SearchBudget ran out, status is BUDGET_EXCEEDED and reason says which limit it hit (see
+    budget.py). The board and stats are then as far as the search had got.
+    """
+    SOLVED = 'solved'
+    UNSOLVABLE = 'unsolvable'
+    BUDGET_EXCEEDED = 'budget_exceeded'
+
+    def __init__(self, status: str, board, stats, reason: str = None):
+        self.status = status
+        self.board = board
+        self.stats = stats
+        self.reason = reason
+
+        # the routing.Route the puzzle took, when it was solved through a Router
+        self.route = None
+
+    @property
+    def solved(self) -> bool:
+        return self.status == SolveResult.SOLVED
@@ -1,6 +1,22 @@
-from exceptions import ConstraintViolationError
-from solver_state import SolverState
-from stats import StatsTracker
+from backends import create_state
+from budget import SearchBudget
+from exceptions import BudgetExceededError, ConstraintViolationError
+from geometry import geometry_of
+from heuristics import BRANCHING_HEURISTICS, VALUE_ORDERINGS
+from propagation import WorklistPropagator
+from puzzle_io import symbol_of
+from solve_result import SolveResult
+from stats import NullStatsTracker, StatsTracker
+from strategies import BASIC_STRATEGIES, DEFAULT_STRATEGIES, STRATEGIES
+from tracing import Tracer
+
+# How the solver gets from a board to everything the rules imply about it
+PROPAGATION_MODES = ('worklist', 'rescan')
+
+# What Solver.visit_node() found at a node of the search: a solution, a contradiction, or a cell to guess at
+NODE_SOLVED = 0
+NODE_DEAD_END = 1
+NODE_OPEN = 2
 
 
 class Solver(object):
@@ -8,98 +24,330 @@ class Solver(object):
     Solves a Sudoku puzzle.
 
     The algorithm is structured as follows:
-        1. Use the known cells to figure out what is possible in each row, column, 3x3 section, and cell
+        1. Use the known cells to figure out what is possible in each row, column, section, and cell
         2. Use the updated information to rule out possibilities and solve cells.
         3. Repeat 2 until we cannot get any more. Easier puzzles will be solved at this point.
         4. If it is still not solved, pick an empty cell and arbitrarily choose one of its possible values
         5. Repeat from step 1. If the assumption in step 4 resulted in an illegal board, revert and try a new value
         6. Repeat step 5 until board is solved.
+
+    The backend argument picks how the scratch pad is stored (see backends.STATE_BACKENDS). The heuristic and
+    value_order arguments pick which cell step 4 guesses at and in which order its values are tried (see
+    heuristics.BRANCHING_HEURISTICS and heuristics.VALUE_ORDERINGS).
+
+    The propagation argument picks how steps 1-3 are done. 'worklist' only revisits the rows, columns and sections a
+    change touched (see propagation.WorklistPropagator), and 'rescan' scans the whole board until nothing changes.
+    Both reach the same result.
+
+    The strategies argument lists the deductions step 2 makes, in the order they are tried (see
+    strategies.STRATEGIES). The worklist propagator already applies the basic ones, so in that mode they are skipped.
+
+    Boards of any size that geometry.py supports can be solved, such as 4x4, 16x16 and 25x25. For the larger ones the
+    'bitboard' backend scales much better than 'list'.
+
+    The budget argument is a budget.SearchBudget that limits the time, nodes or guesses the search may use, or None
+    for no limits.
+
+    Contradictions are found as they happen: the state refuses a value a peer already holds, and the propagation
+    stops as soon as a cell has no values left or a row or column has no place left for a value it needs. The whole
+    board is only checked against the rules once for the clues and once more when it is full. checked=True also
+    checks it, and the consistency of every possibility list, after each round of propagation. That is much slower
+    and meant for debugging.
+
+    The tracer argument is a tracing.Tracer that is told about every node, guess, backtrack, propagation and strategy
+    run of the search, or None for no tracing.
     """
-    def __init__(self, board, expected_solution=None):
-        self.state = SolverState(board)
+    def __init__(self, board, expected_solution=None, backend='list', heuristic='first', value_order='natural',
+                 propagation='worklist', strategies=DEFAULT_STRATEGIES, budget: SearchBudget = None, checked=False,
+                 tracer: Tracer = None):
+        unknown = [name for name in strategies if name not in STRATEGIES]
+        if unknown:
+            raise ValueError(f"Unknown strategies {unknown}. Expected some of {list(STRATEGIES)}")
+        if propagation not in PROPAGATION_MODES:
+            raise ValueError(f"Unknown propagation '{propagation}'. Expected one of {list(PROPAGATION_MODES)}")
+        if heuristic not in BRANCHING_HEURISTICS:
+            raise ValueError(f"Unknown heuristic '{heuristic}'. Expected one of {sorted(BRANCHING_HEURISTICS)}")
+        if value_order not in VALUE_ORDERINGS:
+            raise ValueError(f"Unknown value order '{value_order}'. Expected one of {sorted(VALUE_ORDERINGS)}")
+
+        self.state = create_state(board, backend)
+        self.geometry = self.state.geometry
         self.expected_solution = expected_solution
+        self.select_cell = BRANCHING_HEURISTICS[heuristic]
+        self.order_values = VALUE_ORDERINGS[value_order]
+        self.propagator = WorklistPropagator(self.state) if propagation == 'worklist' else None
+        self.strategies = [(name, STRATEGIES[name]) for name in strategies
+                           if self.propagator is None or name not in BASIC_STRATEGIES]
+        self.budget = budget
+        self.checked = checked
+        self.tracer = tracer
+
+        # whether the clues have been checked against the rules yet, which the rescans do on their first pass
+        self.clues_checked = False
+
+        # the choice points of the search in progress, see search()
+        self.choice_points = []
+
+        # the key the search counts are recorded under in the StatsTracker
+        self.heuristic_name = f"{heuristic}/{value_order}"
 
     def solve(self):
-        stats = StatsTracker()
+        result = self.find_solution()
+        print_report(self.state, self.expected_solution, result.stats)
+
+    def find_solution(self, stats: StatsTracker = None) -> SolveResult:
+        """
+        Solves the puzzle without printing anything, and returns the board and stats. Pass a NullStatsTracker to skip
+        collecting stats. If the budget runs out first, the result says so instead of raising.
+        """
+        if stats is None:
+            stats = StatsTracker()
 
         stats.start_timer()
-        self.solve_recursively(stats, 0)
+        try:
+            if self.budget is not None:
+                self.budget.start()
+            solved = self.solve_recursively(stats, 0)
+        except BudgetExceededError as e:
+            stats.stop_timer()
+            return SolveResult(SolveResult.BUDGET_EXCEEDED, self.state.board, stats, e.reason)
         stats.stop_timer()
 
-        board_printer = BoardPrinter(self.state.board, self.expected_solution)
+        return SolveResult(SolveResult.SOLVED if solved else SolveResult.UNSOLVABLE, self.state.board, stats)
 
-        if self.state.is_solved() and self.expected_solution and self.state.matches_expected(self.expected_solution):
-            self.print_success_stats(stats)
-            board_printer.pretty_print()
-        else:
-            self.print_failure_stats(stats)
-            if self.expected_solution:
-                board_printer.print_diff()
+    def iter_solutions(self, stats: StatsTracker = None):
+        """
+        Generates every solution of the puzzle, each as a new board, finding the next one only when it is asked for.
+        The solver's state is used up by this, so create a new Solver to solve the puzzle again. Raises
+        BudgetExceededError if the budget runs out.
+        """
+        if stats is None:
+            stats = NullStatsTracker()
+        if self.budget is not None:
+            self.budget.start()
+        for _ in self.search(stats, 0):
+            yield [row[:] for row in self.state.board]
+
+    def count_solutions(self, limit: int = 2, stats: StatsTracker = None) -> int:
+        """
+        Returns how many solutions the puzzle has, counting no further than limit. A puzzle has a unique solution
+        when count_solutions(2) is 1, and the search stops as soon as it finds a second one. Raises
+        BudgetExceededError if the budget runs out.
+        """
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, not {limit}")
+        if stats is None:
+            stats = NullStatsTracker()
+
+        stats.start_timer()
+        if self.budget is not None:
+            self.budget.start()
+        count = 0
+        for _ in self.search(stats, 0):
+            count += 1
+            if count >= limit:
+                break
+        stats.stop_timer()
+        return count
 
     def solve_recursively(self, stats_tracker, recursion_depth) -> bool:
-        stats_tracker.on_recursion(recursion_depth)
+        """
+        Searches for the first solution, leaving it in the state. Returns False if there is none. The search no longer
+        recurses (see search()), but the name is kept for callers.
+        """
+        for _ in self.search(stats_tracker, recursion_depth):
+            return True
+        return False
 
-        # Using what is known, get as many cells as possible using the game constraints.
-        try:
-            self.make_consistent()
-            stats_tracker.num_iterations += self.iteratively_solve()
-            if self.state.is_solved():
-                return True
-        except ConstraintViolationError:
-            return False
+    def search(self, stats_tracker, recursion_depth=0):
+        """
+        Generates the solutions that extend the current state. The state holds the complete answer each time this
+        yields, and the search carries on from there when the next one is asked for.
 
-        for row in range(9):
-            for col in range(9):
-                # scan to the first unsolved space
-                if self.state.is_cell_solved(row, col):
+        The search is a loop over an explicit stack of choice points rather than a recursion, so it costs no Python
+        frames per guess and the depth it can reach does not depend on sys.getrecursionlimit(). Each choice point is
+        the guessed cell, an iterator over the values not tried there yet, and the undo mark to go back to before the
+        next one. Dead ends come back from visit_node() and try_guess() as status codes rather than exceptions.
+        """
+        budget = self.budget
+        tracer = self.tracer
+        undo = self.state.undo
+        if tracer is not None:
+            tracer.on_start(self.state.board)
+
+        # [row, col, values left to try, undo mark] for each cell guessed at, the innermost last. It is kept on the
+        # solver so that a search stopped by its budget can be split into the parts it had not got to yet.
+        choice_points = self.choice_points = []
+
+        while True:
+            status, guess_at = self.visit_node(stats_tracker, recursion_depth + len(choice_points))
+            if status == NODE_SOLVED:
+                if tracer is not None:
+                    tracer.on_solution(recursion_depth + len(choice_points))
+                yield
+            elif status == NODE_OPEN:
+                row, col, values = guess_at
+                choice_points.append((row, col, iter(values), self.state.mark()))
+                # nothing below the new choice point has been searched yet, so there is nothing to back out of
+                status = None
+
+            # find the next guess to make, giving up on choice points that have run out of values
+            while choice_points:
+                row, col, values, mark = choice_points[-1]
+                if status is not None:
+                    # every solution below the last guess here has been found, if there were any
+                    stats_tracker.on_backtrack()
+                    if tracer is not None:
+                        tracer.on_backtrack(row, col, recursion_depth + len(choice_points))
+                    undo(mark)
+                guess = next(values, None)
+                if guess is None:
+                    choice_points.pop()
+                    status = NODE_DEAD_END
                     continue
 
-                state_before_all_guesses = self.state.copy()
-
-                for guess in self.state.get_choices_for_cell(row, col):
-                    state_before_this_guess = self.state.copy()
-
-                    # if this guess was invalid from the start, then move on
-                    try:
-                        self.state.update_board(row, col, guess)
-                    except ConstraintViolationError:
-                        self.state = state_before_this_guess
-
-                    # if this guess did not eventually lead to a correct solution, then the guess was wrong
-                    if not self.solve_recursively(stats_tracker, recursion_depth + 1):
-                        self.state = state_before_this_guess
+                stats_tracker.on_guess(self.heuristic_name)
+                if budget is not None:
+                    budget.on_guess()
+                if tracer is not None:
+                    tracer.on_guess(row, col, guess, recursion_depth + len(choice_points))
+                if self.try_guess(row, col, guess):
+                    break
+                stats_tracker.on_contradiction()
+                if tracer is not None:
+                    tracer.on_contradiction(recursion_depth + len(choice_points))
+                status = NODE_DEAD_END
+            else:
+                return
 
-                # if none of the guesses worked
-                if not self.state.is_solved():
-                    self.state = state_before_all_guesses
-                    return False
+    def visit_node(self, stats_tracker, depth: int):
+        """
+        Works out everything the current state implies, and returns one of the NODE_ statuses. When it is NODE_OPEN,
+        the cell to guess at and the values to try there, in order, come with it as (row, col, values).
+        """
+        stats_tracker.on_recursion(depth)
+        stats_tracker.on_node(self.heuristic_name)
+        if self.budget is not None:
+            self.budget.on_node()
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.on_node(depth)
+            traced = tracer.clock()
 
+        # Using what is known, get as many cells as possible using the game constraints.
+        started = stats_tracker.clock()
+        passes = 0
+        try:
+            if self.propagator is not None:
+                passes += self.propagator.propagate()
+            else:
+                self.make_consistent()
+            passes += self.iteratively_solve(stats_tracker)
+            if self.checked:
+                self.state.assert_still_valid()
+        except ConstraintViolationError:
+            stats_tracker.num_iterations += passes
+            stats_tracker.add_phase_time('propagation', started)
+            stats_tracker.on_contradiction()
+            if tracer is not None:
+                tracer.on_propagation(depth, passes, traced)
+                tracer.on_contradiction(depth)
+            if self.propagator is not None:
+                self.propagator.clear()
+            return NODE_DEAD_END, None
+        stats_tracker.num_iterations += passes
+        stats_tracker.add_phase_time('propagation', started)
+        if tracer is not None:
+            tracer.on_propagation(depth, passes, traced)
+
+        started = stats_tracker.clock()
+        solved = self.state.is_solved()
+        stats_tracker.add_phase_time('validation', started)
+        if solved:
+            return NODE_SOLVED, None
+
+        started = stats_tracker.clock()
+        cell = self.select_cell(self.state)
+        if cell is None:
+            stats_tracker.add_phase_time('search', started)
+            return NODE_SOLVED, None
+        row, col = cell
+        values = self.order_values(self.state, row, col)
+        stats_tracker.add_phase_time('search', started)
+        return NODE_OPEN, (row, col, values)
+
+    def try_guess(self, row: int, col: int, value: int) -> bool:
+        """ Puts a guessed value in a cell. Returns False if that breaks a rule straight away. """
+        try:
+            if self.propagator is None:
+                self.state.update_board(row, col, value)
+            else:
+                self.propagator.assign(row, col, value)
+        except ConstraintViolationError:
+            return False
         return True
 
-    def iteratively_solve(self) -> int:
+    def iteratively_solve(self, stats_tracker: StatsTracker = None) -> int:
+        """
+        Runs the strategies in order. Whenever one makes progress, the board is brought up to date and the list starts
+        again from the top, so the cheaper strategies get the first chance at the new information. Stops when none of
+        them can do anything, and returns the number of times it went through the list.
+        """
+        if stats_tracker is None:
+            stats_tracker = NullStatsTracker()
+
+        tracer = self.tracer
         changed = True
         num_iterations = 0
         while changed:
             num_iterations += 1
             changed = False
+            if self.budget is not None:
+                # one pass can take a while on a big or sparse board, so the time limits are checked here as well
+                self.budget.check()
+
+            for name, strategy in self.strategies:
+                started = stats_tracker.clock()
+                if tracer is not None:
+                    traced = tracer.clock()
+                changes = strategy(self)
+                stats_tracker.on_strategy(name, started, changes)
+                if tracer is not None:
+                    tracer.on_strategy(name, traced, changes)
+
+                if changes:
+                    if self.propagator is not None:
+                        self.propagator.propagate()
+                    else:
+                        self.make_consistent()
+                    changed = True
+                    break
 
-            # Check the intersections between the possible row and column values at each cell. If any have a single
-            # point of intersection then we can solve it.
-            if self.check_intersections():
-                self.make_consistent()
-                changed = True
+        return num_iterations
 
-            # Check to see if any cell has only one possible value
-            if self.check_for_single_possibilities():
-                self.make_consistent()
-                changed = True
+    def assign(self, row: int, col: int, value: int):
+        """ Puts a value in an empty cell. Strategies make their changes through this and eliminate(). """
+        if self.propagator is not None:
+            self.propagator.assign(row, col, value)
+        else:
+            self.state.update_board(row, col, value)
 
-            # Can't repeat a number within a 3x3 section, so filter the possibilities
-            if self.attempt_section():
-                self.make_consistent()
-                changed = True
+    def eliminate(self, row: int, col: int, value: int) -> bool:
+        """
+        Rules out a value for an empty cell, filling the cell in if only one value is left. Returns False if the value
+        was already ruled out.
+        """
+        if self.propagator is not None:
+            return self.propagator.eliminate(row, col, value)
 
-        return num_iterations
+        if not self.state.mark_impossible_in_cell(row, col, value):
+            return False
+        choices = self.state.get_choices_for_cell(row, col)
+        if len(choices) == 1:
+            self.state.update_board(row, col, choices[0])
+        elif not choices:
+            raise ConstraintViolationError(f"Cell {row, col} has no possible values")
+        return True
 
     def make_consistent(self):
         """
@@ -109,51 +357,54 @@ class Solver(object):
         self.update_rows_and_columns_from_solved_cells()
         self.update_row_column_possibilities()
 
-        self.state.assert_still_valid()
+        if self.checked or not self.clues_checked:
+            self.state.assert_still_valid()
+            self.clues_checked = True
 
     def update_rows_and_columns_from_solved_cells(self):
-        for r in range(9):
-            for c in range(9):
-                cell_value = self.state.board_at(r, c)
+        for r, c in self.geometry.cells:
+            cell_value = self.state.board_at(r, c)
 
-                if cell_value in self.state.get_choices_for_row(r):
-                    self.remove_row_possibility(r, cell_value)
+            if cell_value in self.state.get_choices_for_row(r):
+                self.remove_row_possibility(r, cell_value)
 
-                if cell_value in self.state.get_choices_for_col(c):
-                    self.remove_col_possibility(c, cell_value)
+            if cell_value in self.state.get_choices_for_col(c):
+                self.remove_col_possibility(c, cell_value)
 
     def update_row_column_possibilities(self):
         """
         Brings the row and column choices into sync with the individual cell possibilites
         """
-        for r in range(9):
+        for r in range(self.geometry.size):
             # what is possible for the row is what is possible in the cells in the row AND possible for row
             possible_from_cells = self.state.get_choices_for_cells_in_row(r)
             row_choices = self.state.get_choices_for_row(r)
             self.state.set_choices_for_row(r, list(set(row_choices).intersection(possible_from_cells)))
 
-        for c in range(9):
+        for c in range(self.geometry.size):
             possible_from_cells = self.state.get_choices_for_cells_in_col(c)
             col_choices = self.state.get_choices_for_col(c)
             self.state.set_choices_for_col(c, list(set(col_choices).intersection(possible_from_cells)))
 
     def update_cell_possibilities(self):
-        for r in range(9):
-            for c in range(9):
-                if self.state.board_at(r, c) is None:
-                    self.compute_new_cell_possibilities(r, c)
+        for r, c in self.geometry.cells:
+            if self.state.board_at(r, c) is None:
+                self.compute_new_cell_possibilities(r, c)
 
-                    if len(self.state.get_choices_for_cell(r, c)) == 1:
-                        self.state.update_board(r, c, self.state.get_choices_for_cell(r, c)[0])
-                else:
-                    self.state.set_choices_for_cell(r, c, [self.state.board_at(r, c)])
+                if len(self.state.get_choices_for_cell(r, c)) == 1:
+                    self.state.update_board(r, c, self.state.get_choices_for_cell(r, c)[0])
+            else:
+                self.state.set_choices_for_cell(r, c, [self.state.board_at(r, c)])
 
     def compute_new_cell_possibilities(self, row, column):
         current_possible = set(self.state.get_choices_for_row(row)).union(self.state.get_choices_for_col(column))
         old_possible = set(self.state.get_choices_for_cell(row, column))
 
         # apply the updated information but intersect it with the old info so we don't go backward
-        self.state.set_choices_for_cell(row, column, list(current_possible.intersection(old_possible)))
+        new_possible = list(current_possible.intersection(old_possible))
+        if not new_possible:
+            raise ConstraintViolationError(f"Cell {row, column} has no possible values")
+        self.state.set_choices_for_cell(row, column, new_possible)
 
     def remove_row_possibility(self, row, value):
         if value in self.state.get_choices_for_row(row):
@@ -161,9 +412,9 @@ class Solver(object):
 
             if len(self.state.get_choices_for_row(row)) == 1:
                 # We can solve a cell. Find which column it is.
-                for col in range(9):
-                    if self.state.board_at(row, col) is None:
-                        self.state.update_board(row, col, self.state.get_choices_for_row(row)[0])
+                for r, c in self.geometry.row_cells[row]:
+                    if self.state.board_at(r, c) is None:
+                        self.state.update_board(r, c, self.state.get_choices_for_row(row)[0])
 
     def remove_col_possibility(self, col, value):
         if value in self.state.get_choices_for_col(col):
@@ -171,102 +422,119 @@ class Solver(object):
 
             if len(self.state.get_choices_for_col(col)) == 1:
                 # We can solve a cell. Find which row it is.
-                for row in range(9):
-                    if not self.state.is_cell_solved(row, col):
-                        self.state.update_board(row, col, self.state.get_choices_for_col(col)[0])
+                for r, c in self.geometry.col_cells[col]:
+                    if not self.state.is_cell_solved(r, c):
+                        self.state.update_board(r, c, self.state.get_choices_for_col(col)[0])
 
-    def attempt_section(self) -> bool:
-        changed = False
+    def attempt_section(self) -> int:
+        """ Returns how many possibilities were ruled out """
+        changed = 0
 
-        # look at each of the 3x3 sections
-        for start_row in range(0, 7, 3):
-            for start_col in range(0, 7, 3):
-                # changed = self.attempt_range(start_row, start_row + 3, start_col, start_col + 3) or changed
-                changed = self.attempt_range((start_row, start_col), (start_row + 3, start_col + 3)) or changed
+        # look at each of the sections
+        for box in range(self.geometry.size):
+            changed += self.attempt_box(box)
 
         return changed
 
-    # start values are inclusive
-    # end values are exclusive
-    def attempt_range(self, start_cell: (int, int), end_cell: (int, int)) -> bool:
+    def attempt_box(self, box: int) -> int:
         """
-        Solve as much as possible in a given section (defined by a range of cells)
+        Solve as much as possible in a given section
 
         Arguments:
-            start_cell: the (row, column) of the cell at the beginning of the range
-            end_cell: the (row, column) of the cell at the end of the range (non-inclusive)
+            box: the index of the section, numbered left to right, top to bottom
+
+        Returns how many possibilities were ruled out
         """
-        start_row = start_cell[0]
-        start_col = start_cell[1]
-        end_row = end_cell[0]
-        end_col = end_cell[1]
-        changed = False
-        values_in_section = self.state.get_unique_values_in_section((start_row, start_col), (end_row, end_col))
-
-        for r in range(start_row, end_row):
-            for c in range(start_col, end_col):
-                # remove it as a possibility unless this has been solved
-                if len(self.state.get_choices_for_cell(r, c)) != 1:
-                    # anything in the same section is not possible for this cell
-                    for val in values_in_section:
-                        changed = self.state.mark_impossible_in_cell(r, c, val)
-                        if len(self.state.get_choices_for_cell(r, c)) == 1:
-                            self.state.update_board(r, c, self.state.get_choices_for_cell(r, c)[0])
+        changed = 0
+        values_in_section = self.state.get_values_in_box(box)
+
+        for r, c in self.geometry.box_cells[box]:
+            # remove it as a possibility unless this has been solved
+            if len(self.state.get_choices_for_cell(r, c)) != 1:
+                # anything in the same section is not possible for this cell
+                for val in values_in_section:
+                    if self.state.mark_impossible_in_cell(r, c, val):
+                        changed += 1
+                    if len(self.state.get_choices_for_cell(r, c)) == 1:
+                        self.state.update_board(r, c, self.state.get_choices_for_cell(r, c)[0])
 
         return changed
 
-    def check_intersections(self) -> bool:
+    def check_intersections(self) -> int:
         """
         This uses the possible values for each row and column to find whether any cell has only one possible choice.
 
         If A is the set of possible values for row i, and B is the set of possible values in column j, then
-        intersect(Ai, Bj) are the possible values for cell i,j.
+        intersect(Ai, Bj) are the possible values for cell i,j. Returns how many cells were solved.
         """
-        changed = False
-        for r in range(9):
-            for c in range(9):
-                # for each unknown cell, intersect the possibilities for that row and column
-                if not self.state.is_cell_solved(r, c):
-                    row_choices = self.state.get_choices_for_row(r)
-                    col_choices = self.state.get_choices_for_col(c)
-                    intersection = set(row_choices).intersection(col_choices)
-                    if len(intersection) == 1:
-                        self.state.update_board(r, c, intersection.pop())
-                        changed = True
+        changed = 0
+        for r, c in self.geometry.cells:
+            # for each unknown cell, intersect the possibilities for that row and column
+            if not self.state.is_cell_solved(r, c):
+                row_choices = self.state.get_choices_for_row(r)
+                col_choices = self.state.get_choices_for_col(c)
+                intersection = set(row_choices).intersection(col_choices)
+                if len(intersection) == 1:
+                    self.state.update_board(r, c, intersection.pop())
+                    changed += 1
         return changed
 
-    def check_for_single_possibilities(self) -> bool:
-        changed = False
-        for r in range(9):
+    def check_for_single_possibilities(self) -> int:
+        """ Fills in the last empty cell of any row or column with one value left. Returns how many were filled. """
+        changed = 0
+        for r in range(self.geometry.size):
             remaining = self.state.get_choices_for_row(r)
             # if there is only one possibility for the row, we can fill it in on the board
             if len(remaining) == 1:
                 unknown_cols = [i for i, v in enumerate(self.state.get_row(r)) if v is None]
-                assert (len(unknown_cols) == 1)
+                if len(unknown_cols) != 1:
+                    # more empty cells than values left to fill them, so an earlier guess was wrong
+                    raise ConstraintViolationError(f"Row {r} has {len(unknown_cols)} empty cells for {remaining}")
                 self.state.update_board(r, unknown_cols[0], remaining[0])
-                changed = True
+                changed += 1
 
-        for c in range(9):
+        for c in range(self.geometry.size):
             remaining = self.state.get_choices_for_col(c)
             # if there is only one possibility for the column, we can fill it in on the board
             if len(remaining) == 1:
                 unknown_rows = [row_num for row_num, val in enumerate(self.state.get_column(c)) if val is None]
-                assert(len(unknown_rows) == 1)
+                if len(unknown_rows) != 1:
+                    raise ConstraintViolationError(f"Column {c} has {len(unknown_rows)} empty cells for {remaining}")
                 self.state.update_board(unknown_rows[0], c, remaining[0])
-                changed = True
+                changed += 1
 
         return changed
 
     @staticmethod
     def print_success_stats(stats):
-        print(f"Took {round(stats.get_elapsed_time(), 4)} milliseconds")
-        print(f"Solved in {stats.num_iterations} passes, with max recursion depth {stats.get_max_recursion_depth()}")
+        print(f"Took {round(stats.get_elapsed_time() * 1000, 4)} milliseconds")
+        print(f"Solved in {stats.num_iterations} passes, {stats.num_guesses} guesses and {stats.num_backtracks} "
+              f"backtracks, with max recursion depth {stats.get_max_recursion_depth()}")
+        print('Time by phase: ' + ', '.join(f"{phase} {round(elapsed / 1e6, 2)} ms"
+                                            for phase, elapsed in stats.phase_ns.items()))
+        for name, counts in stats.strategy_counts.items():
+            print(f"  {name}: {counts['changes']} changes in {counts['runs']} runs, "
+                  f"{round(counts['time_ns'] / 1e6, 2)} ms")
 
     @staticmethod
     def print_failure_stats(stats):
         print("Could not solve puzzle")
-        print(f"Took {round(stats.get_elapsed_time(), 4)} milliseconds")
-        print(f"Attempted {stats.num_iterations} passes and max recursion depth {stats.get_max_recursion_depth()}")
+        print(f"Took {round(stats.get_elapsed_time() * 1000, 4)} milliseconds")
+        print(f"Attempted {stats.num_iterations} passes, {stats.num_guesses} guesses and {stats.num_backtracks} "
+              f"backtracks, with max recursion depth {stats.get_max_recursion_depth()}")
+
+
+def print_report(state, expected_solution, stats):
+    """ Prints the stats and the board after a solve, highlighting any cells that differ from the expected solution """
+    board_printer = BoardPrinter(state.board, expected_solution)
+
+    if state.is_solved() and expected_solution and state.matches_expected(expected_solution):
+        Solver.print_success_stats(stats)
+        board_printer.pretty_print()
+    else:
+        Solver.print_failure_stats(stats)
+        if expected_solution:
+            board_printer.print_diff()
 
 
 class BoardPrinter(object):
@@ -279,12 +547,16 @@ class BoardPrinter(object):
             raise ValueError
         self.actual_board = result_board
         self.expected_board = expected_board
+        self.box_size = geometry_of(result_board).box_size
+
+        # the blank line printed under each band of rows, as wide as a row
+        self.separator = ' ' * len(self.format_row(result_board[0]))
 
     def pretty_print(self):
         for i, row in enumerate(self.actual_board):
             print(self.format_row(row))
-            if (i + 1) % 3 == 0:
-                print(''.join([' ' for _ in range(26)]))
+            if (i + 1) % self.box_size == 0:
+                print(self.separator)
 
     def print_diff(self):
         for r, row in enumerate(self.actual_board):
@@ -294,8 +566,8 @@ class BoardPrinter(object):
                     wrong_indexes.append(c)
                     print(f"{r, c} was {self.actual_board[r][c]} but expected {self.expected_board[r][c]}")
             print(self.format_row(row, wrong_indexes))
-            if (r + 1) % 3 == 0:
-                print(''.join([' ' for _ in range(26)]))
+            if (r + 1) % self.box_size == 0:
+                print(self.separator)
 
     def format_row(self, row: list[int], wrong_indexes=None) -> str:
         if wrong_indexes is None:
@@ -303,13 +575,13 @@ class BoardPrinter(object):
 
         cells = []
         for i, v in enumerate(row):
-            cell_value = str(v) if v else '.'
+            cell_value = symbol_of(v)
 
             if i in wrong_indexes:
                 cells.append(self.RED + cell_value + self.END_COLOR)
             else:
                 cells.append(cell_value)
 
-            if (i + 1) % 3 == 0 and i < len(row) - 1:
+            if (i + 1) % self.box_size == 0 and i < len(row) - 1:
                 cells.append(' ')
         return ' '.join(cells)
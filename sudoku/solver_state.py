@@ -1,6 +1,7 @@
 from __future__ import annotations
 from copy import deepcopy
 from exceptions import ConstraintViolationError
+from geometry import geometry_of
 from typing import List
 
 
@@ -11,18 +12,29 @@ class SolverState(object):
     methods in here are related to manipulating that information and accessing it in different ways.
 
     This allows the algorithm to be separate from the data.
+
+    Every change made through the public methods is recorded in a trail, so the solver can take a mark() before a
+    guess and undo() back to it instead of copying the whole state. Lists stored in the state are never modified in
+    place; they are replaced, and the trail keeps the old list.
+
+    The board can be any size geometry.py supports; self.geometry holds the tables for it.
     """
     def __init__(self, board):
         self.board = board
+        self.geometry = geometry = geometry_of(board)
+        size = geometry.size
+
+        # (container, key, previous value) for every change, in the order they were made
+        self.trail = []
 
         # This gives the remaining choices for cells in a row. When this is empty the row is solved.
-        self.row_remaining = [[i for i in range(1, 10)] for _ in range(1, 10)]
+        self.row_remaining = [list(geometry.digits) for _ in range(size)]
 
         # This gives the remaining choices for cells in a column. When this is empty the column is solved.
-        self.col_remaining = [[i for i in range(1, 10)] for _ in range(1, 10)]
+        self.col_remaining = [list(geometry.digits) for _ in range(size)]
 
         # cell_possibles[row][col] gives the possible values for each cell
-        self.cell_possible = [[[i for i in range(1, 10)] for _ in range(1, 10)] for _ in range(1, 10)]
+        self.cell_possible = [[list(geometry.digits) for _ in range(size)] for _ in range(size)]
 
     def copy(self) -> SolverState:
         """ Returns a deep copy of this SolverState. Useful for undoing changes. """
@@ -32,6 +44,17 @@ class SolverState(object):
         new_state.col_remaining = deepcopy(self.col_remaining)
         return new_state
 
+    def mark(self) -> int:
+        """ Returns a marker for the current point in the trail, to be passed to undo() later """
+        return len(self.trail)
+
+    def undo(self, mark: int):
+        """ Reverts every change made since the given mark was taken """
+        trail = self.trail
+        while len(trail) > mark:
+            container, key, previous = trail.pop()
+            container[key] = previous
+
     def get_choices_for_cell(self, row: int, column: int) -> List[int]:
         """ Returns the list of remaining choices possible for the given cell """
         return self.cell_possible[row][column]
@@ -42,10 +65,10 @@ class SolverState(object):
         unsolved cells because solved ones are no longer possible to assign.
         """
         choices = set()
-        for col in range(9):
+        for cell_choices in self.cell_possible[row]:
             # cells with one possibility are known
-            if len(self.cell_possible[row][col]) != 1:
-                choices.update(self.cell_possible[row][col])
+            if len(cell_choices) != 1:
+                choices.update(cell_choices)
         return choices
 
     def get_choices_for_cells_in_col(self, col: int) -> set[int]:
@@ -55,24 +78,16 @@ class SolverState(object):
         """
         # building a set explicitly is much faster than using itertools.chain(filter()))
         choices = set()
-        for row in range(9):
-            if len(self.cell_possible[row][col]) != 1:
-                choices.update(self.cell_possible[row][col])
+        for row_possible in self.cell_possible:
+            cell_choices = row_possible[col]
+            if len(cell_choices) != 1:
+                choices.update(cell_choices)
         return choices
 
-    def get_unique_values_in_section(self, start_cell: (int, int), end_cell: (int, int)) -> list[int]:
-        """
-        Returns the unique values that are known within a given section, bounded by start_cell and end_cell.
-        :param (int, int) start_cell: The upper left corner of the range (inclusive)
-        :param (int, int) end_cell: The lower right corner of the range (exclusive)
-        """
-        # building a set explicitly is much faster than using itertools.chain(filter()))
-        values_in_section = []
-        for r in range(start_cell[0], end_cell[0]):
-            for c in range(start_cell[1], end_cell[1]):
-                if self.board[r][c] is not None:
-                    values_in_section.append(self.board[r][c])
-        return values_in_section
+    def get_values_in_box(self, box: int) -> list[int]:
+        """ Returns the values that are known within the given section """
+        board = self.board
+        return [board[r][c] for r, c in self.geometry.box_cells[box] if board[r][c] is not None]
 
     def get_choices_for_row(self, row: int) -> list[int]:
         """ Returns the remaining possible choices for unsolved cells in the given row """
@@ -82,38 +97,53 @@ class SolverState(object):
         """ Returns the remaining possible choices for unsolved cells in the given row """
         return self.col_remaining[col]
 
+    def get_live_choices(self, row: int, col: int) -> list[int]:
+        """ Returns the cell's choices that are also still open for its row and column """
+        row_choices = self.row_remaining[row]
+        col_choices = self.col_remaining[col]
+        return [v for v in self.cell_possible[row][col] if v in row_choices and v in col_choices]
+
     def mark_impossible_in_cell(self, row, column, to_remove) -> bool:
         """
         Remove the given value from the list of remaining possibilities for the given cell
         :return bool True if anything was changed, False if the value was already impossible
         """
-        if to_remove in self.cell_possible[row][column]:
-            self.cell_possible[row][column].remove(to_remove)
-            return True
-        else:
-            return False
+        return self._remove_from(self.cell_possible[row], column, to_remove)
 
     def mark_impossible_in_row(self, row: int, value: int):
         """ Remove the given value from the list of remaining possibilities for a given row """
-        if value in self.row_remaining[row]:
-            self.row_remaining[row].remove(value)
+        self._remove_from(self.row_remaining, row, value)
 
     def mark_impossible_in_col(self, col: int, value: int):
         """ Remove the given value from the list of remaining possibilities for a given row """
-        if value in self.col_remaining[col]:
-            self.col_remaining[col].remove(value)
+        self._remove_from(self.col_remaining, col, value)
 
     def set_choices_for_cell(self, row: int, column: int, value: list[int]):
         """ Sets the list of remaining possibilities for a given cell """
-        self.cell_possible[row][column] = value
+        self._record(self.cell_possible[row], column, value)
 
     def set_choices_for_row(self, row, new_choices: List[int]):
         """ Sets the list of remaining possibilities for a given row """
-        self.row_remaining[row] = new_choices
+        self._record(self.row_remaining, row, new_choices)
 
     def set_choices_for_col(self, col, new_choices: List[int]):
         """ Sets the list of remaining possibilities for a given column """
-        self.col_remaining[col] = new_choices
+        self._record(self.col_remaining, col, new_choices)
+
+    def _record(self, container: list, key: int, value):
+        """ Replaces container[key] with value and remembers the old value in the trail """
+        previous = container[key]
+        if previous != value:
+            self.trail.append((container, key, previous))
+            container[key] = value
+
+    def _remove_from(self, container: list, key: int, to_remove: int) -> bool:
+        """ Replaces the list at container[key] with a copy that does not have to_remove in it """
+        choices = container[key]
+        if to_remove not in choices:
+            return False
+        self._record(container, key, [v for v in choices if v != to_remove])
+        return True
 
     def board_at(self, row: int, column: int) -> int:
         """ Returns the value of the given cell. Returns None if it does not have a known value. """
@@ -132,15 +162,26 @@ class SolverState(object):
         return [v[col] for v in self.board]
 
     def update_board(self, row: int, column: int, value: int):
-        """ Sets a value for the given cell in the board and updates the other possibility lists to match """
-        self.board[row][column] = value
+        """
+        Sets a value for the given cell in the board and updates the other possibility lists to match. Raises
+        ConstraintViolationError if the cell already holds a different value or a peer already holds this one, so a
+        duplicate is caught the moment it is made rather than by the next assert_still_valid().
+        """
+        board = self.board
+        current = board[row][column]
+        if current != value:
+            if current is not None:
+                raise ConstraintViolationError(f"Cell {row, column} already holds {current}, not {value}")
+            for r, c in self.geometry.peers[row][column]:
+                if board[r][c] == value:
+                    raise ConstraintViolationError(f"Cell {row, column} value {value} is already in peer {r, c}")
+
+        self._record(board[row], column, value)
 
         # update all derived information
         self.set_choices_for_cell(row, column, [value])
-        if value in self.row_remaining:
-            self.row_remaining[row].remove(value)
-        if value in self.col_remaining:
-            self.col_remaining[column].remove(value)
+        self._remove_from(self.row_remaining, row, value)
+        self._remove_from(self.col_remaining, column, value)
 
     def is_solved(self) -> bool:
         """ Returns True if every cell in the board has a known value """
@@ -158,10 +199,9 @@ class SolverState(object):
     def matches_expected(self, expected_solution) -> bool:
         """ Returns true if the current board matches the given expectation """
         matched = True
-        for r in range(9):
-            for c in range(9):
-                if self.board[r][c] != expected_solution[r][c]:
-                    return False
+        for r, c in self.geometry.cells:
+            if self.board[r][c] != expected_solution[r][c]:
+                return False
         return matched
 
     def assert_still_valid(self):
@@ -169,6 +209,9 @@ class SolverState(object):
         Ensures that all of the possiblity lists are consistent with each other. If they are not, it either
         indicates the solver has guessed an incorrect value (raises ConstraintViolationError) or there is a bug in the
         code (assertion failure)
+
+        This looks at the whole board. update_board() already refuses duplicates as they are made, so the Solver only
+        runs it on the clues and on a finished board, or after every pass in checked mode.
         """
         # no two values in the same column:
         self._check_rows()
@@ -177,16 +220,15 @@ class SolverState(object):
         self._check_columns()
 
         # no two values in the same section
-        for start_row in range(0, 7, 3):
-            for start_col in range(0, 7, 3):
-                self._check_section(start_row, start_row + 3, start_col, start_col + 3)
+        for box in range(self.geometry.size):
+            self._check_section(box)
 
         self._assert_internal_consistency()
 
     def _check_rows(self):
-        for r in range(9):
+        for r in range(self.geometry.size):
             row_values = set()
-            for c in range(9):
+            for c in range(self.geometry.size):
                 value = self.board[r][c]
                 if value:
                     if value in row_values:
@@ -194,37 +236,35 @@ class SolverState(object):
                     row_values.add(value)
 
     def _check_columns(self):
-        for c in range(9):
+        for c in range(self.geometry.size):
             col_values = set()
-            for r in range(9):
+            for r in range(self.geometry.size):
                 value = self.board[r][c]
                 if value:
                     if self.board[r][c] in col_values:
                         raise ConstraintViolationError(f"Cell {r, c} is duplicated in column")
                     col_values.add(value)
 
-    def _check_section(self, start_row, end_row, start_col, end_col):
+    def _check_section(self, box: int):
         nums_in_section = set()
-        for r in range(start_row, end_row):
-            for c in range(start_col, end_col):
-                if self.board[r][c] in nums_in_section:
-                    raise ConstraintViolationError(
-                        f"Duplicate value {self.board[r][c]} in section {(start_row, end_row), (start_col, end_col)}")
-                if self.board[r][c] is not None:
-                    nums_in_section.add(self.board[r][c])
+        for r, c in self.geometry.box_cells[box]:
+            value = self.board[r][c]
+            if value is not None:
+                if value in nums_in_section:
+                    raise ConstraintViolationError(f"Duplicate value {value} in section {box}")
+                nums_in_section.add(value)
 
     def _assert_internal_consistency(self):
         # any of these assertions that fail indicate a bug in the code
-        for r in range(9):
-            for c in range(9):
-                assert(self.get_choices_for_cell(r, c) != 0)
-
-                # if there are no more possibiliites, yet this cell has not been solved, there is a bug
-                if len(self.get_choices_for_cell(r, c)) == 1:
-                    assert(self.board[r][c] is not None)
-
-                if self.board[r][c] is not None:
-                    assert(self.board[r][c] not in self.row_remaining)
-                    assert(self.board[r][c] not in self.col_remaining)
-                    assert(self.board[r][c] == self.get_choices_for_cell(r, c)[0])
-                    assert(len(self.get_choices_for_cell(r, c)) == 1)
+        for r, c in self.geometry.cells:
+            assert(self.get_choices_for_cell(r, c) != 0)
+
+            # if there are no more possibiliites, yet this cell has not been solved, there is a bug
+            if len(self.get_choices_for_cell(r, c)) == 1:
+                assert(self.board[r][c] is not None)
+
+            if self.board[r][c] is not None:
+                assert(self.board[r][c] not in self.row_remaining)
+                assert(self.board[r][c] not in self.col_remaining)
+                assert(self.board[r][c] == self.get_choices_for_cell(r, c)[0])
+                assert(len(self.get_choices_for_cell(r, c)) == 1)
@@ -0,0 +1,273 @@
+"""
+Splits the search for one puzzle across worker processes.
+
+parallel.py solves many puzzles at once, which does nothing for a single puzzle whose search takes minutes, or for
+counting every solution of a sparse board. SplitSearchSolver runs the Solver's search tree in parallel instead:
+    1. The top of the tree is expanded breadth first in this process, until there are SUBPROBLEMS_PER_WORKER open
+       boards for each worker. A subproblem is the board with the guesses on the way to it filled in.
+    2. The subproblems wait on a stack in this process, and a few per worker are sent to the pool at a time, so a
+       worker that finishes early is given the next one straight away.
+    3. A worker searches its subproblem for at most split_nodes nodes. If the search is not done by then, the parts
+       it had not got to (the node it was about to visit, and the values not tried yet at each guess above it) go
+       back on the stack as new subproblems. However lopsided the tree is, no subproblem keeps a worker busy for
+       long while others wait. The deepest parts go on top, so the search as a whole still runs depth first and
+       the stack only grows with the depth of the tree; taken breadth first, the split parts would multiply with
+       every level.
+    4. Once enough solutions are found, the workers still searching are told to stop through a shared event, which
+       their budgets check every few nodes, and the subproblems still queued are dropped.
+
+The stats from every worker are merged into the one StatsTracker for the solve. Its time is the wall time of the whole
+solve, not the sum of the workers' times.
+
+Subproblems are sent as puzzle lines. Each worker rebuilds a Solver from its line, which redoes the propagation of the
+guessed values but costs far less to send than a solver state.
+"""
+import math
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from backends import create_state
+from budget import CANCELLED, SearchBudget
+from exceptions import BudgetExceededError
+from puzzle_io import format_board, to_board
+from solve_result import SolveResult
+from solver import NODE_OPEN, NODE_SOLVED, Solver, print_report
+from stats import NullStatsTracker, StatsTracker
+
+# Nodes a worker searches before handing the rest of its subproblem back to be split up. Smaller numbers balance the
+# load better, bigger ones send fewer boards back and forth.
+DEFAULT_SPLIT_NODES = 200
+
+# Subproblems made for each worker before the pool is started
+SUBPROBLEMS_PER_WORKER = 4
+
+# Subproblems sent to each worker at a time; the rest wait on the stack
+SUBPROBLEMS_IN_FLIGHT_PER_WORKER = 2
+
+# Seconds between looks at the budget's clock and token while waiting for the workers
+POLL_INTERVAL = 0.01
+
+# Set in each worker process by _start_worker: the token that stops the worker's search
+_stop_token = None
+
+
+class _EventToken(object):
+    """ A budget.CancellationToken that works across processes, backed by a multiprocessing Event """
+    def __init__(self, event):
+        self.event = event
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
+
+def _start_worker(stop_event):
+    global _stop_token
+    _stop_token = _EventToken(stop_event)
+
+
+def _search_subproblem(line: str, depth: int, limit: int, split_nodes: int, options: dict):
+    """
+    Runs in a worker process. Searches the board in line, which is depth guesses below the root, for up to limit
+    solutions. Returns the solutions found as lines, the parts of the search not got to as (line, depth) pairs, and the
+    stats for the search.
+    """
+    solver = Solver(to_board(line), budget=SearchBudget(max_nodes=split_nodes, token=_stop_token), **options)
+    stats = StatsTracker()
+    stats.start_timer()
+    solutions = []
+    remainder = []
+    try:
+        solver.budget.start()
+        for _ in solver.search(stats, depth):
+            solutions.append(format_board(solver.state.board))
+            if len(solutions) >= limit:
+                break
+    except BudgetExceededError as e:
+        if e.reason != CANCELLED:
+            remainder = _unexplored(solver, depth)
+    stats.stop_timer()
+    return solutions, remainder, stats
+
+
+def _unexplored(solver: Solver, depth: int):
+    """
+    The parts of the tree a search stopped by its node budget had not got to. The budget stops it at the start of a
+    node, so the state is that node's board, and every choice point above it still has the values it had not tried.
+    """
+    state = solver.state
+    choice_points = solver.choice_points
+    remainder = [(format_board(state.board), depth + len(choice_points))]
+    for level in range(len(choice_points) - 1, -1, -1):
+        row, col, values, mark = choice_points[level]
+        state.undo(mark)
+        for value in values:
+            board = [cells[:] for cells in state.board]
+            board[row][col] = value
+            remainder.append((format_board(board), depth + level + 1))
+    return remainder
+
+
+class SplitSearchSolver(object):
+    """
+    Solves one puzzle by splitting the Solver's search tree between worker processes (see the module docs). The
+    other options, such as heuristic and backend, are passed to the Solver in each worker.
+
+    A puzzle that propagation alone solves, or that has no open cells left after a few levels of expansion, is solved
+    without starting any processes.
+
+    budget limits the whole solve as it does for the Solver: the time and token are checked while waiting for the
+    workers, and the nodes and guesses are totalled across all of them.
+    """
+    def __init__(self, board, expected_solution=None, workers: int = None, split_nodes=DEFAULT_SPLIT_NODES,
+                 budget: SearchBudget = None, **options):
+        if split_nodes < 1:
+            raise ValueError(f"split_nodes must be at least 1, not {split_nodes}")
+        self.board = board
+        self.expected_solution = expected_solution
+        self.workers = workers or os.cpu_count() or 1
+        self.split_nodes = split_nodes
+        self.budget = budget
+        self.options = options
+
+        # check the options here rather than in every worker
+        Solver([row[:] for row in board], **options)
+
+    def solve(self):
+        result = self.find_solution()
+        state = create_state([row[:] for row in result.board], self.options.get('backend', 'list'))
+        for r, c in state.geometry.cells:
+            if state.is_cell_solved(r, c):
+                state.update_board(r, c, state.board_at(r, c))
+        print_report(state, self.expected_solution, result.stats)
+
+    def find_solution(self, stats: StatsTracker = None) -> SolveResult:
+        """ Solves the puzzle, and returns the first solution any worker finds along with the stats of all of them """
+        if stats is None:
+            stats = StatsTracker()
+        try:
+            solutions = self.search(1, stats)
+        except BudgetExceededError as e:
+            return SolveResult(SolveResult.BUDGET_EXCEEDED, self.board, stats, e.reason)
+        if not solutions:
+            return SolveResult(SolveResult.UNSOLVABLE, self.board, stats)
+        return SolveResult(SolveResult.SOLVED, solutions[0], stats)
+
+    def count_solutions(self, limit: int = 2, stats: StatsTracker = None) -> int:
+        """
+        Returns how many solutions the puzzle has, counting no further than limit. Raises BudgetExceededError if the
+        budget runs out.
+        """
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, not {limit}")
+        if stats is None:
+            stats = StatsTracker()
+        return len(self.search(limit, stats))
+
+    def iter_solutions(self, stats: StatsTracker = None):
+        """
+        Generates every solution of the puzzle, each as a new board, in the order the workers find them. The workers
+        keep searching while the caller works on a solution, and are stopped when the generator is closed. Raises
+        BudgetExceededError if the budget runs out.
+        """
+        if stats is None:
+            stats = NullStatsTracker()
+        yield from self._search(math.inf, stats)
+
+    def search(self, limit: int, stats: StatsTracker) -> list:
+        """ Returns up to limit solutions of the puzzle as boards, in no particular order """
+        return list(self._search(limit, stats))
+
+    def _search(self, limit, stats: StatsTracker):
+        """ Generates up to limit solutions of the puzzle as they are found """
+        stats.start_timer()
+        try:
+            if self.budget is not None:
+                self.budget.start()
+            solutions = []
+            frontier = self._expand(limit, stats, solutions)
+            # each node expanded adds at most one solution, so there are no more than limit
+            yield from solutions
+            if frontier and len(solutions) < limit:
+                yield from self._search_in_workers(frontier, limit - len(solutions), stats)
+        finally:
+            stats.stop_timer()
+
+    def _expand(self, limit: int, stats: StatsTracker, solutions: list) -> deque:
+        """
+        Visits the top of the tree breadth first until there are enough subproblems for the workers. Returns them as
+        (board, depth) pairs; the solutions found on the way are added to solutions.
+        """
+        frontier = deque([([row[:] for row in self.board], 0)])
+        target = self.workers * SUBPROBLEMS_PER_WORKER
+        while frontier and len(frontier) < target and len(solutions) < limit:
+            board, depth = frontier.popleft()
+            solver = Solver(board, budget=self.budget, **self.options)
+            status, guess_at = solver.visit_node(stats, depth)
+            if status == NODE_SOLVED:
+                solutions.append(solver.state.board)
+            elif status == NODE_OPEN:
+                row, col, values = guess_at
+                state = solver.state
+                for value in values:
+                    stats.on_guess(solver.heuristic_name)
+                    if self.budget is not None:
+                        self.budget.on_guess()
+                    mark = state.mark()
+                    if solver.try_guess(row, col, value):
+                        frontier.append(([cells[:] for cells in state.board], depth + 1))
+                    else:
+                        stats.on_contradiction()
+                    state.undo(mark)
+        return frontier
+
+    def _search_in_workers(self, frontier: deque, limit, stats: StatsTracker):
+        """ Searches the subproblems in the pool, and generates up to limit solutions as the workers find them """
+        budget = self.budget
+        max_in_flight = self.workers * SUBPROBLEMS_IN_FLIGHT_PER_WORKER
+
+        # (line, depth) for each subproblem not sent yet, the next to send last
+        stack = [(format_board(board), depth) for board, depth in reversed(frontier)]
+
+        found = 0
+        pending = set()
+        stop = multiprocessing.Event()
+        try:
+            with ProcessPoolExecutor(self.workers, initializer=_start_worker, initargs=(stop,)) as executor:
+                try:
+                    while (stack or pending) and found < limit:
+                        while stack and len(pending) < max_in_flight:
+                            line, depth = stack.pop()
+                            pending.add(executor.submit(_search_subproblem, line, depth, limit - found,
+                                                        self.split_nodes, self.options))
+
+                        done, pending = wait(pending, POLL_INTERVAL, FIRST_COMPLETED)
+                        if budget is not None:
+                            budget.check()
+                        lines = []
+                        for future in done:
+                            solutions, remainder, worker_stats = future.result()
+                            stats.merge(worker_stats, include_time=False)
+                            lines.extend(solutions)
+                            if budget is not None:
+                                budget.add(worker_stats.num_nodes, worker_stats.num_guesses)
+                            # the node the worker stopped at comes first, and should be the next one sent
+                            stack.extend(reversed(remainder))
+                        for line in lines:
+                            if found >= limit:
+                                break
+                            found += 1
+                            yield to_board(line)
+                finally:
+                    # the workers still searching stop at their next look at the token
+                    stop.set()
+        finally:
+            # the pool has shut down, so the searches that were stopped are done and their work can be counted too
+            for future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    stats.merge(future.result()[2], include_time=False)
@@ -1,42 +1,233 @@
+"""
+Counters and timers for a solve.
+
+Times are taken with time.perf_counter_ns, which is monotonic and has the best resolution the platform offers, and are
+kept as integer nanoseconds so that adding up many short intervals loses nothing. get_elapsed_time() and the exports
+give seconds.
+
+Pass a NullStatsTracker to a solver to turn all of this off: it has the same methods, but they do nothing.
+"""
+import json
+import math
 import time
+from typing import List
+
+# The solver's phases, which every tracker reports. Others, like the cache's canonicalization, are only reported by
+# the trackers they were recorded in.
+PHASES = ('propagation', 'validation', 'search')
+
+
+def percentile(sorted_values: List[float], percent: float) -> float:
+    """ The nearest-rank percentile of an already sorted list """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(percent / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
 
 
 class StatsTracker(object):
     def __init__(self):
-        self.num_iterations = None
+        self.num_nodes = 0
         self.num_guesses = 0
+
+        # guesses the search undid once everything below them was searched, whether that led to a contradiction or,
+        # when more than one solution is wanted, to the solutions under them
+        self.num_backtracks = 0
+
+        # passes made by the propagation and the strategies until nothing more could be worked out
+        self.num_iterations = 0
+
+        # times the solver found the board could not be solved, whether after a guess or from the start
+        self.num_contradictions = 0
+
         self.max_recursion_depth = 0
-        self.start_time = 0
-        self.end_time = 0
+        self.start_ns = 0
+        self.end_ns = 0
 
-    @property
-    def num_iterations(self):
-        return self._num_iterations
+        # time spent in other trackers that were merged into this one
+        self.merged_ns = 0
 
-    @num_iterations.setter
-    def num_iterations(self, val):
-        self._num_iterations = val
+        # phase -> nanoseconds spent in it
+        self.phase_ns = dict.fromkeys(PHASES, 0)
 
-    @property
-    def num_guesses(self):
-        return self._num_iterations
+        # heuristic name -> {'nodes': ..., 'guesses': ...} for the searches run with that heuristic
+        self.search_counts = {}
 
-    @num_guesses.setter
-    def num_guesses(self, val):
-        self._num_iterations = val
+        # strategy name -> {'runs': ..., 'changes': ..., 'time_ns': ...} for the deduction strategies the solver ran
+        self.strategy_counts = {}
+
+    @staticmethod
+    def clock() -> int:
+        """ Returns a timestamp to pass to add_phase_time() or on_strategy() later """
+        return time.perf_counter_ns()
+
+    def add_phase_time(self, phase: str, started: int):
+        """ Adds the time since started, a value from clock(), to the given phase """
+        self.phase_ns[phase] = self.phase_ns.get(phase, 0) + time.perf_counter_ns() - started
 
     def on_recursion(self, depth):
         if depth > self.max_recursion_depth:
             self.max_recursion_depth = depth
 
+    def on_node(self, heuristic: str):
+        """ Called for every node the search visits """
+        self.num_nodes += 1
+        self._counts_for(heuristic)['nodes'] += 1
+
+    def on_guess(self, heuristic: str):
+        """ Called every time the search assumes a value for a cell """
+        self.num_guesses += 1
+        self._counts_for(heuristic)['guesses'] += 1
+
+    def on_backtrack(self):
+        """ Called every time the search undoes a guess """
+        self.num_backtracks += 1
+
+    def on_contradiction(self):
+        """ Called every time the solver finds that the board as it stands has no solution """
+        self.num_contradictions += 1
+
+    def on_strategy(self, strategy: str, started: int, changes: int):
+        """ Called after every run of a deduction strategy, with when it started and how many changes it made """
+        elapsed = time.perf_counter_ns() - started
+        counts = self.strategy_counts.get(strategy)
+        if counts is None:
+            counts = self.strategy_counts[strategy] = {'runs': 0, 'changes': 0, 'time_ns': 0}
+        counts['runs'] += 1
+        counts['changes'] += changes
+        counts['time_ns'] += elapsed
+
+    def _counts_for(self, heuristic: str) -> dict:
+        counts = self.search_counts.get(heuristic)
+        if counts is None:
+            counts = self.search_counts[heuristic] = {'nodes': 0, 'guesses': 0}
+        return counts
+
+    def merge(self, other, include_time=True):
+        """
+        Adds another tracker's counts and time into this one, e.g. to total up the solves done by many workers. With
+        include_time=False the time is left out, for work done alongside this tracker's own rather than after it.
+        """
+        self.num_nodes += other.num_nodes
+        self.num_guesses += other.num_guesses
+        self.num_backtracks += other.num_backtracks
+        self.num_iterations += other.num_iterations
+        self.num_contradictions += other.num_contradictions
+        self.max_recursion_depth = max(self.max_recursion_depth, other.max_recursion_depth)
+        if include_time:
+            self.merged_ns += other.get_elapsed_ns()
+        for phase, elapsed in other.phase_ns.items():
+            self.phase_ns[phase] = self.phase_ns.get(phase, 0) + elapsed
+        for heuristic, counts in other.search_counts.items():
+            mine = self._counts_for(heuristic)
+            for key, value in counts.items():
+                mine[key] += value
+        for strategy, counts in other.strategy_counts.items():
+            mine = self.strategy_counts.setdefault(strategy, {'runs': 0, 'changes': 0, 'time_ns': 0})
+            for key, value in counts.items():
+                mine[key] += value
+
     def get_max_recursion_depth(self):
         return self.max_recursion_depth
 
     def start_timer(self):
-        self.start_time = time.time()
+        self.start_ns = time.perf_counter_ns()
 
     def stop_timer(self):
-        self.end_time = time.time()
+        self.end_ns = time.perf_counter_ns()
+
+    def get_elapsed_ns(self) -> int:
+        return self.end_ns - self.start_ns + self.merged_ns
+
+    def get_elapsed_time(self) -> float:
+        """ Returns the time between start_timer() and stop_timer(), plus any merged time, in seconds """
+        return self.get_elapsed_ns() / 1e9
+
+    def to_dict(self) -> dict:
+        """ Returns everything tracked as plain numbers, with times in seconds """
+        return {
+            'elapsed_seconds': self.get_elapsed_time(),
+            'nodes': self.num_nodes,
+            'guesses': self.num_guesses,
+            'backtracks': self.num_backtracks,
+            'passes': self.num_iterations,
+            'contradictions': self.num_contradictions,
+            'max_depth': self.max_recursion_depth,
+            'phase_seconds': {phase: elapsed / 1e9 for phase, elapsed in self.phase_ns.items()},
+            'search': {heuristic: dict(counts) for heuristic, counts in self.search_counts.items()},
+            'strategies': {strategy: {'runs': counts['runs'], 'changes': counts['changes'],
+                                      'seconds': counts['time_ns'] / 1e9}
+                           for strategy, counts in self.strategy_counts.items()},
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def to_prometheus(self, prefix='sudoku') -> str:
+        """ Returns the stats in the Prometheus text exposition format, with every metric name starting with prefix """
+        lines = []
+
+        def metric(name, kind, description, samples):
+            lines.append(f"# HELP {prefix}_{name} {description}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{_escape_label(str(v))}"' for key, v in labels.items())
+                lines.append(f"{prefix}_{name}{{{label_text}}} {value}" if labels else f"{prefix}_{name} {value}")
+
+        metric('solve_seconds_total', 'counter', 'Time spent solving.', [({}, self.get_elapsed_time())])
+        metric('nodes_total', 'counter', 'Search nodes visited.', [({}, self.num_nodes)])
+        metric('guesses_total', 'counter', 'Values assumed for a cell by the search.', [({}, self.num_guesses)])
+        metric('backtracks_total', 'counter', 'Guesses undone once the search below them was done.',
+               [({}, self.num_backtracks)])
+        metric('propagation_passes_total', 'counter', 'Propagation passes.', [({}, self.num_iterations)])
+        metric('contradictions_total', 'counter', 'Boards found to have no solution.',
+               [({}, self.num_contradictions)])
+        metric('max_recursion_depth', 'gauge', 'Deepest level the search reached.', [({}, self.max_recursion_depth)])
+        metric('phase_seconds_total', 'counter', 'Time spent in each phase of the solver.',
+               [({'phase': phase}, elapsed / 1e9) for phase, elapsed in self.phase_ns.items()])
+        metric('heuristic_nodes_total', 'counter', 'Search nodes visited with each heuristic.',
+               [({'heuristic': heuristic}, counts['nodes']) for heuristic, counts in self.search_counts.items()])
+        metric('heuristic_guesses_total', 'counter', 'Guesses made with each heuristic.',
+               [({'heuristic': heuristic}, counts['guesses']) for heuristic, counts in self.search_counts.items()])
+        metric('strategy_runs_total', 'counter', 'Runs of each deduction strategy.',
+               [({'strategy': name}, counts['runs']) for name, counts in self.strategy_counts.items()])
+        metric('strategy_changes_total', 'counter', 'Possibilities ruled out or cells filled in by each strategy.',
+               [({'strategy': name}, counts['changes']) for name, counts in self.strategy_counts.items()])
+        metric('strategy_seconds_total', 'counter', 'Time spent in each strategy.',
+               [({'strategy': name}, counts['time_ns'] / 1e9) for name, counts in self.strategy_counts.items()])
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class NullStatsTracker(StatsTracker):
+    """
+    A StatsTracker that records nothing, for runs where nobody will look at the stats. Only the overall timer still
+    works, since that costs two clock reads per solve.
+    """
+    @staticmethod
+    def clock() -> int:
+        return 0
+
+    def add_phase_time(self, phase: str, started: int):
+        pass
+
+    def on_recursion(self, depth):
+        pass
+
+    def on_node(self, heuristic: str):
+        pass
+
+    def on_guess(self, heuristic: str):
+        pass
+
+    def on_backtrack(self):
+        pass
+
+    def on_contradiction(self):
+        pass
 
-    def get_elapsed_time(self):
-        return self.end_time - self.start_time
+    def on_strategy(self, strategy: str, started: int, changes: int):
+        pass
@@ -0,0 +1,282 @@
+"""
+Deduction strategies that the Solver runs between guesses. The Solver looks them up by name in STRATEGIES and runs
+them in the order it is given, repeating the whole list until none of them can make progress.
+
+A strategy takes the Solver and returns how many changes it made: each value it ruled out for a cell and each cell it
+filled in counts as one. It makes changes only through solver.eliminate() and solver.assign(), so it works the same
+with either propagation mode, and raises ConstraintViolationError if it finds the board cannot be solved.
+
+The cell possibility lists only narrow down by section, so the strategies work from heuristics.live_choices, which
+also takes out values the cell's row or column no longer needs. Every strategy looks at one unit at a time and
+moves on to the next unit as soon as it changes anything, so it never acts on information it has just made stale.
+"""
+import argparse
+from itertools import combinations
+
+from bitboard_state import BitboardSolverState, lowest_digit
+from exceptions import ConstraintViolationError
+from heuristics import live_choices
+
+
+def _open_cells(state, cells) -> dict:
+    """ Maps each empty cell in the list to its live choices """
+    return {(r, c): live_choices(state, r, c) for r, c in cells if not state.is_cell_solved(r, c)}
+
+
+def _needed_values(state, cells) -> list:
+    """ Returns the values not yet placed in the list of cells """
+    placed = {state.board_at(r, c) for r, c in cells}
+    return [v for v in state.geometry.digits if v not in placed]
+
+
+def _places_for(state, cells, candidates: dict) -> dict:
+    """ Maps each value the cells still need to the empty cells that can hold it """
+    return {v: [cell for cell, choices in candidates.items() if v in choices] for v in _needed_values(state, cells)}
+
+
+def _eliminate_all(solver, cells, values) -> int:
+    """ Rules every value out for every empty cell in the list. Returns how many were actually removed. """
+    state = solver.state
+    removed = 0
+    for r, c in cells:
+        for v in values:
+            if not state.is_cell_solved(r, c) and solver.eliminate(r, c, v):
+                removed += 1
+    return removed
+
+
+def row_column_intersections(solver) -> int:
+    """ An empty cell where the row and column have exactly one value in common gets that value """
+    return solver.check_intersections()
+
+
+def last_value_in_line(solver) -> int:
+    """ A row or column with one value left puts it in its only empty cell """
+    return solver.check_for_single_possibilities()
+
+
+def section_exclusion(solver) -> int:
+    """ An empty cell cannot hold a value already placed in its section """
+    return solver.attempt_section()
+
+
+def naked_singles(solver) -> int:
+    """ Rules out the values a cell's row or column no longer needs, which fills in any cell left with one value """
+    state = solver.state
+    if isinstance(state, BitboardSolverState):
+        return _naked_singles_masks(solver, state)
+    removed = 0
+    for (r, c), choices in _open_cells(state, state.geometry.cells).items():
+        stale = [v for v in state.get_choices_for_cell(r, c) if v not in choices]
+        removed += _eliminate_all(solver, [(r, c)], stale)
+    return removed
+
+
+def hidden_singles(solver) -> int:
+    """ A value that fits in only one cell of a row, column or section goes in that cell """
+    state = solver.state
+    if isinstance(state, BitboardSolverState):
+        return _hidden_singles_masks(solver, state)
+    placed = 0
+    for cells in state.geometry.units:
+        for value, places in _places_for(state, cells, _open_cells(state, cells)).items():
+            if not places:
+                raise ConstraintViolationError(f"No cell left for {value} in {cells[0]}-{cells[-1]}")
+            if len(places) == 1:
+                solver.assign(*places[0], value)
+                placed += 1
+                break
+    return placed
+
+
+def _naked_singles_masks(solver, state: BitboardSolverState) -> int:
+    """ naked_singles on the bitboard backend, with the choices kept as masks rather than tuples """
+    live = [(r, c, state.get_live_mask(r, c)) for r, c in state.geometry.cells if not state.is_cell_solved(r, c)]
+    removed = 0
+    for r, c, mask in live:
+        stale = state.get_cell_mask(r, c) & ~mask
+        while stale and not state.is_cell_solved(r, c):
+            bit = stale & -stale
+            stale ^= bit
+            if solver.eliminate(r, c, bit.bit_length()):
+                removed += 1
+    return removed
+
+
+def _hidden_singles_masks(solver, state: BitboardSolverState) -> int:
+    """
+    hidden_singles on the bitboard backend. Going through a unit's empty cells once, seen collects the values that fit
+    in at least one of them and seen_twice the values that fit in more than one, so the values needed in the unit
+    that are only in seen go in a single cell.
+    """
+    geometry = state.geometry
+    box_unit = geometry.box_unit
+    placed = 0
+    for unit, cells in enumerate(geometry.units):
+        if unit >= box_unit:
+            needed = state.get_box_mask(unit - box_unit)
+        else:
+            needed = state.all_digits
+            for r, c in cells:
+                if state.is_cell_solved(r, c):
+                    needed &= ~state.get_cell_mask(r, c)
+        seen = seen_twice = 0
+        open_cells = []
+        for r, c in cells:
+            if not state.is_cell_solved(r, c):
+                mask = state.get_live_mask(r, c)
+                seen_twice |= seen & mask
+                seen |= mask
+                open_cells.append((r, c, mask))
+
+        missing = needed & ~seen
+        singles = needed & seen & ~seen_twice
+        if not missing | singles:
+            continue
+        # the smallest value decides, as it does when the values are gone through in order
+        value = lowest_digit(missing | singles)
+        if missing & (1 << (value - 1)):
+            raise ConstraintViolationError(f"No cell left for {value} in {cells[0]}-{cells[-1]}")
+        r, c = next((r, c) for r, c, mask in open_cells if mask & (1 << (value - 1)))
+        solver.assign(r, c, value)
+        placed += 1
+    return placed
+
+
+def _naked_subsets(solver, size: int) -> int:
+    """
+    If some number of cells in a unit can only hold that same number of values between them, those values go in
+    those cells and can be ruled out for the rest of the unit.
+    """
+    state = solver.state
+    removed = 0
+    for cells in state.geometry.units:
+        candidates = _open_cells(state, cells)
+        small = [cell for cell, choices in candidates.items() if 1 < len(choices) <= size]
+        for subset in combinations(small, size):
+            values = set().union(*(candidates[cell] for cell in subset))
+            if len(values) != size:
+                continue
+            others = [cell for cell in candidates if cell not in subset]
+            changed = _eliminate_all(solver, others, values)
+            if changed:
+                removed += changed
+                break
+    return removed
+
+
+def _hidden_subsets(solver, size: int) -> int:
+    """
+    If some number of values can only go in that same number of cells of a unit, those cells hold those values and
+    nothing else can go in them.
+    """
+    state = solver.state
+    removed = 0
+    for cells in state.geometry.units:
+        places = _places_for(state, cells, _open_cells(state, cells))
+        few = [v for v, cells_for_value in places.items() if 1 < len(cells_for_value) <= size]
+        for values in combinations(few, size):
+            subset = set().union(*(places[v] for v in values))
+            if len(subset) != size:
+                continue
+            changed = 0
+            for r, c in subset:
+                others = [v for v in state.get_choices_for_cell(r, c) if v not in values]
+                changed += _eliminate_all(solver, [(r, c)], others)
+            if changed:
+                removed += changed
+                break
+    return removed
+
+
+def naked_pairs(solver) -> int:
+    return _naked_subsets(solver, 2)
+
+
+def naked_triples(solver) -> int:
+    return _naked_subsets(solver, 3)
+
+
+def hidden_pairs(solver) -> int:
+    return _hidden_subsets(solver, 2)
+
+
+def hidden_triples(solver) -> int:
+    return _hidden_subsets(solver, 3)
+
+
+def pointing(solver) -> int:
+    """
+    If a value's places in a section all lie in one row or column, it goes in that part of the line, so it can be
+    ruled out for the rest of the line.
+    """
+    state = solver.state
+    geometry = state.geometry
+    removed = 0
+    for box, cells in enumerate(geometry.box_cells):
+        for value, places in _places_for(state, cells, _open_cells(state, cells)).items():
+            rows = {r for r, _ in places}
+            cols = {c for _, c in places}
+            if len(rows) == 1:
+                line = geometry.row_cells[rows.pop()]
+            elif len(cols) == 1:
+                line = geometry.col_cells[cols.pop()]
+            else:
+                continue
+            changed = _eliminate_all(solver, [(r, c) for r, c in line if geometry.box_of[r][c] != box], [value])
+            if changed:
+                removed += changed
+                break
+    return removed
+
+
+def box_line_reduction(solver) -> int:
+    """
+    If a value's places in a row or column all lie in one section, it goes in that part of the section, so it can be
+    ruled out for the rest of the section.
+    """
+    state = solver.state
+    geometry = state.geometry
+    removed = 0
+    for cells in geometry.row_cells + geometry.col_cells:
+        for value, places in _places_for(state, cells, _open_cells(state, cells)).items():
+            boxes = {geometry.box_of[r][c] for r, c in places}
+            if len(boxes) != 1:
+                continue
+            section = geometry.box_cells[boxes.pop()]
+            changed = _eliminate_all(solver, [cell for cell in section if cell not in cells], [value])
+            if changed:
+                removed += changed
+                break
+    return removed
+
+
+STRATEGIES = {
+    'intersections': row_column_intersections,
+    'line-singles': last_value_in_line,
+    'section': section_exclusion,
+    'naked-singles': naked_singles,
+    'hidden-singles': hidden_singles,
+    'pointing': pointing,
+    'box-line': box_line_reduction,
+    'naked-pairs': naked_pairs,
+    'hidden-pairs': hidden_pairs,
+    'naked-triples': naked_triples,
+    'hidden-triples': hidden_triples,
+}
+
+# The rules propagation.WorklistPropagator already applies on every change, so worklist mode skips them
+BASIC_STRATEGIES = ('intersections', 'line-singles', 'section')
+
+# Cheapest first, so the expensive searches only run once the simple ones are stuck
+DEFAULT_STRATEGIES = BASIC_STRATEGIES + ('naked-singles', 'hidden-singles', 'pointing', 'box-line', 'naked-pairs',
+                                         'hidden-pairs', 'naked-triples', 'hidden-triples')
+
+
+def parse_strategies(value: str) -> tuple:
+    """ Parses a comma-separated list of strategy names, for the --strategies option of the command line tools """
+    names = tuple(name.strip() for name in value.split(',') if name.strip())
+    unknown = [name for name in names if name not in STRATEGIES]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown strategies {unknown}, expected some of {list(STRATEGIES)}")
+    return names
@@ -1,7 +1,179 @@
-from solver import Solver
+import argparse
+import json
+import sys
+import time
 
+from backends import STATE_BACKENDS
+from batch import OUTPUT_FORMATS, solve_stream
+from budget import SearchBudget
+from cache import SolutionCache
+from dispatcher import ENGINES
+from heuristics import BRANCHING_HEURISTICS, VALUE_ORDERINGS
+from packed import PackedCorpus, is_packed
+from parallel import DEFAULT_CHUNK_SIZE, solve_stream_parallel
+from puzzle_io import iter_puzzles
+from routing import DEFAULT_SLOW_MS, ROUTED, Router
+from solver import PROPAGATION_MODES, Solver
+from strategies import DEFAULT_STRATEGIES, parse_strategies
+from vectorized import DEFAULT_BATCH_SIZE, solve_stream_vectorized
 
-def main():
+# Output is written in blocks of this many bytes when solving a puzzle file
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+STATS_FORMATS = ('text', 'json', 'prometheus')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Solves Sudoku puzzles. With no puzzle file, solves two built-in examples and prints them.')
+    parser.add_argument('puzzles', nargs='?',
+                        help="file with one puzzle per line, 81 characters for 9x9 ('.' or '0' for blanks), "
+                             "a file made by packed.py, or - for stdin")
+    parser.add_argument('--format', choices=sorted(OUTPUT_FORMATS), default='tsv', help='output format')
+    parser.add_argument('--engine', choices=['auto', ROUTED] + sorted(ENGINES), default='propagation',
+                        help=f"'{ROUTED}' picks a lane for each puzzle from a cheap propagation pass; see routing.py")
+    parser.add_argument('--backend', choices=sorted(STATE_BACKENDS), default='list')
+    parser.add_argument('--heuristic', choices=sorted(BRANCHING_HEURISTICS), default='first',
+                        help='which cell the propagation engine guesses at')
+    parser.add_argument('--value-order', choices=sorted(VALUE_ORDERINGS), default='natural',
+                        help='order the propagation engine tries values in')
+    parser.add_argument('--propagation', choices=PROPAGATION_MODES, default='worklist',
+                        help='whether the propagation engine revisits only what changed or rescans the whole board')
+    parser.add_argument('--strategies', type=parse_strategies, default=DEFAULT_STRATEGIES,
+                        help='comma-separated deductions the propagation engine makes, in the order they are tried '
+                             f"(default: {','.join(DEFAULT_STRATEGIES)})")
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes to solve puzzles in; with --engine split, the number of processes '
+                             'each puzzle\'s search is split between')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='puzzles sent to a worker process at a time')
+    parser.add_argument('--unordered', action='store_true',
+                        help='with --workers, write results as they finish instead of in input order')
+    parser.add_argument('--vectorize', action='store_true',
+                        help='propagate many puzzles at once with NumPy; --engine solves the ones left over')
+    parser.add_argument('--stats-format', choices=STATS_FORMATS, default='text',
+                        help='how the totals for a puzzle file are reported')
+    parser.add_argument('--stats-file', help='write the totals here instead of to stderr')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='puzzles propagated together with --vectorize')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='remember this many solutions, so repeated or equivalent puzzles are not solved again')
+    parser.add_argument('--cache-file', help='also keep solutions in this SQLite file, across runs')
+    parser.add_argument('--time-limit-ms', type=float,
+                        help="give up on a puzzle after this long and report it as 'budget_exceeded'")
+    parser.add_argument('--max-nodes', type=int, help='give up on a puzzle after this many search nodes')
+    parser.add_argument('--max-guesses', type=int, help='give up on a puzzle after this many guesses')
+    parser.add_argument('--checked', action='store_true',
+                        help='check the whole board against the rules after every round of propagation (slow)')
+    parser.add_argument('--slow-lane-ms', type=float, default=DEFAULT_SLOW_MS,
+                        help=f"with --engine {ROUTED}, puzzles predicted to take longer than this are solved last")
+    parser.add_argument('--routing-log', help=f"with --engine {ROUTED}, append each puzzle's features, lane and "
+                                              'predicted and actual time to this file as JSON lines')
+    args = parser.parse_args(argv)
+    if args.cache_size < 0:
+        parser.error('--cache-size cannot be negative')
+    if args.cache_file and not args.cache_size:
+        parser.error('--cache-file needs --cache-size')
+    if args.engine == 'split' and args.vectorize:
+        parser.error('--engine split cannot be combined with --vectorize')
+    if args.cache_size and (args.vectorize or args.workers > 1):
+        parser.error('--cache-size cannot be combined with --vectorize or --workers')
+    if args.engine == ROUTED and (args.vectorize or args.cache_size):
+        parser.error(f"--engine {ROUTED} cannot be combined with --vectorize or --cache-size")
+    if args.routing_log and args.engine != ROUTED:
+        parser.error(f"--routing-log needs --engine {ROUTED}")
+    return args
+
+
+def solve_file(args):
+    """ Streams the puzzle file through the chosen engine and writes results to stdout """
+    options = {'backend': args.backend, 'heuristic': args.heuristic, 'value_order': args.value_order,
+               'propagation': args.propagation, 'strategies': args.strategies, 'checked': args.checked}
+    if args.time_limit_ms is not None or args.max_nodes is not None or args.max_guesses is not None:
+        # the budget starts over for every puzzle
+        options['budget'] = SearchBudget(args.time_limit_ms / 1000 if args.time_limit_ms is not None else None,
+                                         args.max_nodes, args.max_guesses)
+
+    if args.puzzles != '-' and is_packed(args.puzzles):
+        source = PackedCorpus(args.puzzles)
+        puzzles = source.iter_puzzles()
+    else:
+        source = sys.stdin if args.puzzles == '-' else open(args.puzzles)
+        puzzles = iter_puzzles(source)
+    out = open(sys.stdout.fileno(), 'w', buffering=OUTPUT_BUFFER_SIZE, closefd=False)
+    cache = SolutionCache(args.cache_size, args.cache_file) if args.cache_size else None
+    if args.engine == ROUTED:
+        options['router'] = Router(args.slow_lane_ms, log=args.routing_log)
+    start = time.perf_counter()
+    try:
+        if args.vectorize:
+            counts, totals = solve_stream_vectorized(puzzles, out, args.format, args.batch_size, args.engine,
+                                                     **options)
+        elif args.engine == 'split':
+            # the workers go to the search for each puzzle, so the puzzles themselves are solved one at a time
+            options['workers'] = args.workers
+            counts, totals = solve_stream(puzzles, out, args.format, args.engine, cache, **options)
+        elif args.workers > 1:
+            counts, totals = solve_stream_parallel(puzzles, out, args.workers, args.format, args.chunk_size,
+                                                   not args.unordered, args.engine, **options)
+        else:
+            counts, totals = solve_stream(puzzles, out, args.format, args.engine, cache, **options)
+    finally:
+        out.flush()
+        if cache is not None:
+            cache.close()
+        if source is not sys.stdin:
+            source.close()
+
+    elapsed = time.perf_counter() - start
+    cache_counts = cache.counters() if cache is not None else None
+    if args.stats_format == 'json':
+        report = {'puzzles': counts, 'wall_seconds': elapsed, 'stats': totals.to_dict()}
+        if cache_counts is not None:
+            report['cache'] = cache_counts
+        report = json.dumps(report) + '\n'
+    elif args.stats_format == 'prometheus':
+        report = totals.to_prometheus()
+        if cache_counts is not None:
+            report += ''.join(f"# TYPE sudoku_cache_{name} {'gauge' if name == 'entries' else 'counter'}\n"
+                              f"sudoku_cache_{name}{'' if name == 'entries' else '_total'} {value}\n"
+                              for name, value in cache_counts.items())
+    else:
+        report = format_summary(counts, elapsed, totals, cache_counts)
+
+    if args.stats_file:
+        with open(args.stats_file, 'w') as f:
+            f.write(report)
+    else:
+        sys.stderr.write(report)
+
+
+def format_summary(counts: dict, elapsed: float, totals, cache_counts: dict = None) -> str:
+    """ The human-readable totals for a puzzle file """
+    total = sum(counts.values())
+    summary = ', '.join(f"{count} {status}" for status, count in sorted(counts.items()))
+    lines = [f"{total} puzzles in {elapsed:.3f}s ({summary}), {totals.num_guesses} guesses, "
+             f"{totals.num_backtracks} backtracks, {totals.get_elapsed_time():.3f}s solving"]
+    lines.append('  time by phase: ' + ', '.join(f"{phase} {phase_ns / 1e9:.3f}s"
+                                                 for phase, phase_ns in totals.phase_ns.items()))
+    for name, strategy_counts in totals.strategy_counts.items():
+        lines.append(f"  {name}: {strategy_counts['changes']} changes in {strategy_counts['runs']} runs, "
+                     f"{strategy_counts['time_ns'] / 1e9:.3f}s")
+    if cache_counts is not None:
+        lines.append('  cache: ' + ', '.join(f"{value} {name.replace('_', ' ')}"
+                                             for name, value in cache_counts.items()))
+    return '\n'.join(lines) + '\n'
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.puzzles:
+        solve_file(args)
+    else:
+        solve_examples()
+
+
+def solve_examples():
     x = None
     solver = Solver(
         [[x, x, x, 8, x, 5, x, 1, 3],
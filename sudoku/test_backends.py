@@ -0,0 +1,47 @@
+import unittest
+
+from backends import STATE_BACKENDS
+from puzzle_io import parse_puzzle
+from solver import PROPAGATION_MODES, Solver
+from stats import StatsTracker
+
+# a few from corpus/hardest.txt, which need a search after every strategy
+PUZZLES = [
+    '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+    '..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..',
+    '1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..',
+]
+
+
+class BackendTest(unittest.TestCase):
+    def solve(self, puzzle, backend, propagation):
+        stats = StatsTracker()
+        result = Solver(parse_puzzle(puzzle), backend=backend, propagation=propagation).find_solution(stats)
+        return result.status, result.board, stats.num_nodes, stats.num_guesses, stats.num_iterations
+
+    def test_backends_search_the_same_tree(self):
+        # the bitboard's mask fast paths in the strategies and the propagator must find what the list scans find
+        for puzzle in PUZZLES:
+            with self.subTest(puzzle=puzzle):
+                expected = self.solve(puzzle, 'list', 'worklist')
+                self.assertEqual(expected[0], 'solved')
+                for backend in STATE_BACKENDS:
+                    self.assertEqual(self.solve(puzzle, backend, 'worklist'), expected)
+
+    def test_backends_find_the_same_solution(self):
+        # the rescans leave the list backend's choices in another order, so only the answers are the same
+        for propagation in PROPAGATION_MODES:
+            for puzzle in PUZZLES:
+                with self.subTest(propagation=propagation, puzzle=puzzle):
+                    expected = self.solve(puzzle, 'list', propagation)[:2]
+                    for backend in STATE_BACKENDS:
+                        self.assertEqual(self.solve(puzzle, backend, propagation)[:2], expected)
+
+    def test_live_choices_agree(self):
+        states = [Solver(parse_puzzle(PUZZLES[0]), backend=backend).state for backend in sorted(STATE_BACKENDS)]
+        for r, c in states[0].geometry.cells:
+            self.assertEqual(len({tuple(state.get_live_choices(r, c)) for state in states}), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+import io
+import json
+import unittest
+from unittest import mock
+
+from batch import solve_stream
+from routing import SLOW, Router
+
+PUZZLES = [
+    '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..',
+    '..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..',
+    '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......',
+    '52...6.........7.13...........4..8..6......5...........418.........3..2...87.....',
+]
+
+
+class CountingRouter(Router):
+    """ A Router that sends everything it searches to the slow lane and counts the puzzles it routes """
+    def __init__(self):
+        super().__init__(slow_ms=0.0)
+        self.routed = 0
+
+    def route(self, board):
+        self.routed += 1
+        return super().route(board)
+
+
+class RoutedStreamTest(unittest.TestCase):
+    def solve(self, router) -> list:
+        out = io.StringIO()
+        counts, _ = solve_stream(enumerate(PUZZLES, start=1), out, 'jsonl', 'routed', router=router)
+        self.assertEqual(counts, {'solved': len(PUZZLES)})
+        return [json.loads(line) for line in out.getvalue().splitlines()]
+
+    def test_slow_lane_is_routed_once(self):
+        router = CountingRouter()
+        results = self.solve(router)
+        self.assertEqual(router.routed, len(PUZZLES))
+        self.assertTrue(all(fields['lane'] == SLOW for fields in results))
+
+    def test_slow_lane_is_solved_when_full(self):
+        with mock.patch('batch.MAX_DEFERRED', 2):
+            results = self.solve(CountingRouter())
+        self.assertEqual([fields['line'] for fields in results], [1, 2, 3, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
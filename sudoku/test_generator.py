@@ -0,0 +1,38 @@
+import random
+import unittest
+
+from dispatcher import count_solutions
+from generator import generate, generate_batch, random_grid
+from geometry import geometry_for_size
+
+
+def is_valid_grid(grid, geometry) -> bool:
+    return all(sorted(grid[r][c] for r, c in unit) == list(geometry.digits) for unit in geometry.units)
+
+
+class RandomGridTest(unittest.TestCase):
+    def test_4x4_grids_are_drawn_again_until_they_can_be_completed(self):
+        # about half the random fillings of the diagonal sections of a 4x4 board have no completion
+        geometry = geometry_for_size(4)
+        for seed in range(20):
+            self.assertTrue(is_valid_grid(random_grid(random.Random(seed), geometry), geometry))
+
+    def test_9x9_grid(self):
+        geometry = geometry_for_size(9)
+        self.assertTrue(is_valid_grid(random_grid(random.Random(1), geometry), geometry))
+
+
+class GenerateTest(unittest.TestCase):
+    def test_4x4_puzzles_have_one_solution(self):
+        for puzzle, solution in generate_batch(5, seed=1, box_size=2):
+            self.assertEqual(count_solutions(puzzle, engine='dlx'), 1)
+            self.assertTrue(all(v is None or v == solution[r][c] for r, row in enumerate(puzzle)
+                                for c, v in enumerate(row)))
+
+    def test_clue_target_is_met(self):
+        puzzle, _ = generate(random.Random(3), clues=30)
+        self.assertEqual(sum(1 for row in puzzle for v in row if v is not None), 30)
+
+
+if __name__ == '__main__':
+    unittest.main()
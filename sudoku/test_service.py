@@ -0,0 +1,57 @@
+import asyncio
+import json
+import multiprocessing
+import unittest
+
+import service
+from batch import INVALID
+from service import ERROR, SolveService, handle_connection
+
+PUZZLE = '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..'
+
+
+class SolveBatchTest(unittest.TestCase):
+    def setUp(self):
+        # what the pool initializer does in each worker process
+        service._start_worker(multiprocessing.RawArray('b', 4))
+
+    def test_a_failing_request_does_not_fail_its_batch(self):
+        results = service._solve_batch([(PUZZLE, ['dlx'], None, 0), (PUZZLE, 'dlx', None, 1)], {})
+        self.assertEqual(results[0]['status'], ERROR)
+        self.assertEqual(results[1]['status'], 'solved')
+
+    def test_a_cancelled_request_is_skipped(self):
+        service._cancel_flags[0] = 1
+        results = service._solve_batch([(PUZZLE, 'dlx', None, 0), (PUZZLE, 'dlx', None, 1)], {})
+        self.assertEqual([fields['status'] for fields in results], ['cancelled', 'solved'])
+
+
+class HandleConnectionTest(unittest.TestCase):
+    def exchange(self, *requests) -> list:
+        """ Sends requests to a service on one connection and returns its answers, one per request """
+        async def run():
+            solve_service = SolveService()
+            await solve_service.start()
+            server = await asyncio.start_server(lambda r, w: handle_connection(solve_service, r, w), '127.0.0.1', 0)
+            try:
+                reader, writer = await asyncio.open_connection(*server.sockets[0].getsockname()[:2])
+                for request in requests:
+                    writer.write(json.dumps(request).encode() + b'\n')
+                await writer.drain()
+                answers = [json.loads(await reader.readline()) for _ in requests]
+                writer.close()
+                return answers
+            finally:
+                server.close()
+                await solve_service.close()
+        return asyncio.run(run())
+
+    def test_an_engine_that_is_not_a_name_is_invalid(self):
+        # nothing here reaches a worker, so no process is started
+        answers = self.exchange({'id': 1, 'puzzle': PUZZLE, 'engine': ['dlx']},
+                                {'id': 2, 'puzzle': PUZZLE, 'engine': 'fastest'})
+        self.assertEqual([(answer['id'], answer['status']) for answer in answers], [(1, INVALID), (2, INVALID)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import unittest
+
+from dlx import DLXSolver
+from puzzle_io import parse_puzzle
+from session import Hint, SolvingSession
+
+# Arto Inkala's "hardest", where propagation alone leaves most of the board open
+PUZZLE = '8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..'
+
+
+class SolvingSessionTest(unittest.TestCase):
+    def setUp(self):
+        self.session = SolvingSession(PUZZLE)
+        self.solution = next(DLXSolver(parse_puzzle(PUZZLE)).iter_solutions())
+
+    def place_unsolvable(self):
+        """ Places the first wrong value propagation lets through, so only the search can tell it is wrong """
+        session = self.session
+        for r, c in session.geometry.cells:
+            if session.board[r][c] is not None:
+                continue
+            for value in session.get_choices_for_cell(r, c):
+                if value != self.solution[r][c] and session.place(r, c, value):
+                    if not session.is_solvable():
+                        return r, c
+                    session.clear(r, c)
+        self.fail("Every wrong value is caught by propagation")
+
+    def test_placing_over_a_wrong_entry_forgets_that_it_had_no_solution(self):
+        r, c = self.place_unsolvable()
+        self.assertTrue(self.session.place(r, c, self.solution[r][c]))
+        self.assertTrue(self.session.is_solvable())
+        self.assertIsNotNone(self.session.next_hint())
+
+    def test_clearing_a_wrong_entry_forgets_that_it_had_no_solution(self):
+        r, c = self.place_unsolvable()
+        self.session.clear(r, c)
+        self.assertTrue(self.session.is_solvable())
+
+    def test_hint_points_at_the_wrong_entry(self):
+        r, c = self.place_unsolvable()
+        hint = self.session.next_hint()
+        self.assertEqual((hint.row, hint.col, hint.value, hint.reason), (r, c, self.solution[r][c], Hint.MISTAKE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,24 @@
+import unittest
+
+from cache import SolutionCache
+from dispatcher import solve_board
+from puzzle_io import parse_puzzle
+from stats import PHASES
+
+PUZZLE = '4.....8.5.3..........7......2.....6.....8.4......1.......6.3.7.5..2.....1.4......'
+
+
+class PhaseTest(unittest.TestCase):
+    def test_a_solve_reports_only_the_solver_phases(self):
+        result = solve_board(parse_puzzle(PUZZLE), engine='propagation')
+        self.assertEqual(tuple(result.stats.phase_ns), PHASES)
+
+    def test_a_cached_solve_reports_canonicalization(self):
+        cache = SolutionCache(8)
+        for _ in range(2):
+            result = cache.solve(parse_puzzle(PUZZLE), engine='propagation')
+            self.assertGreater(result.stats.phase_ns['canonicalization'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
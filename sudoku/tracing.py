@@ -0,0 +1,223 @@
+"""
+Hooks into the Solver's search, for finding out why a puzzle is slow.
+
+StatsTracker counts what the search did; a Tracer is told each thing as it happens, with the cell and depth. Pass one
+to the Solver as the tracer option. With no tracer, each hook in the search costs one comparison with None, the same
+as the budget does.
+
+TraceRecorder writes the events to a file as JSON lines, and summarize_trace() reads such a file back into the
+cells guessed at most, the biggest subtrees that were searched for nothing, and the time each strategy took.
+profiling.py runs both from the command line. The file holds one line per search, then one per event:
+    {"start": puzzle}                         a search starts from this board
+    ["n", depth, us]                          a node is visited
+    ["p", depth, passes, ns]                  the propagation at a node is done, strategies included
+    ["s", strategy, changes, ns]              a strategy was run
+    ["g", depth, row, col, value, us]         a value is guessed, leading to a node at depth
+    ["x", depth]                              a guess or a node turned out to break a rule
+    ["b", depth, row, col]                    the search backs out of a guess
+    ["y", depth, us]                          a solution is found
+us is microseconds since the start of the search and ns a duration in nanoseconds.
+"""
+import heapq
+import json
+import time
+from typing import Iterable, List
+
+from puzzle_io import format_board
+
+# The first item of each event in a trace file
+NODE = 'n'
+PROPAGATION = 'p'
+STRATEGY = 's'
+GUESS = 'g'
+CONTRADICTION = 'x'
+BACKTRACK = 'b'
+SOLUTION = 'y'
+
+# Entries in each list of a summary
+DEFAULT_TOP = 10
+
+
+class Tracer(object):
+    """
+    Receives the events of a Solver's search. Every method does nothing here, so a subclass only overrides the ones
+    it wants. Depths count the guesses between a node and the root, as StatsTracker does.
+    """
+    @staticmethod
+    def clock() -> int:
+        """ Returns a timestamp, which the solver passes back as started to on_propagation() and on_strategy() """
+        return time.perf_counter_ns()
+
+    def on_start(self, board):
+        pass
+
+    def on_node(self, depth: int):
+        pass
+
+    def on_propagation(self, depth: int, passes: int, started: int):
+        pass
+
+    def on_strategy(self, strategy: str, started: int, changes: int):
+        pass
+
+    def on_guess(self, row: int, col: int, value: int, depth: int):
+        pass
+
+    def on_contradiction(self, depth: int):
+        pass
+
+    def on_backtrack(self, row: int, col: int, depth: int):
+        pass
+
+    def on_solution(self, depth: int):
+        pass
+
+
+class TraceRecorder(Tracer):
+    """
+    Writes every event to out, an open text file, in the format described in the module docs. Writing a line per
+    event slows the search down several times over, so the times in a trace are only good for comparing its parts.
+    """
+    def __init__(self, out):
+        self.out = out
+        self.start_ns = 0
+
+    def _us(self) -> int:
+        return (time.perf_counter_ns() - self.start_ns) // 1000
+
+    def on_start(self, board):
+        self.start_ns = time.perf_counter_ns()
+        self.out.write(json.dumps({'start': format_board(board)}) + '\n')
+
+    def on_node(self, depth: int):
+        self.out.write(f'["{NODE}",{depth},{self._us()}]\n')
+
+    def on_propagation(self, depth: int, passes: int, started: int):
+        self.out.write(f'["{PROPAGATION}",{depth},{passes},{time.perf_counter_ns() - started}]\n')
+
+    def on_strategy(self, strategy: str, started: int, changes: int):
+        self.out.write(f'["{STRATEGY}","{strategy}",{changes},{time.perf_counter_ns() - started}]\n')
+
+    def on_guess(self, row: int, col: int, value: int, depth: int):
+        self.out.write(f'["{GUESS}",{depth},{row},{col},{value},{self._us()}]\n')
+
+    def on_contradiction(self, depth: int):
+        self.out.write(f'["{CONTRADICTION}",{depth}]\n')
+
+    def on_backtrack(self, row: int, col: int, depth: int):
+        self.out.write(f'["{BACKTRACK}",{depth},{row},{col}]\n')
+
+    def on_solution(self, depth: int):
+        self.out.write(f'["{SOLUTION}",{depth},{self._us()}]\n')
+
+
+def summarize_trace(lines: Iterable[str], top=DEFAULT_TOP) -> List[dict]:
+    """
+    Reads a trace file and returns a summary of each search in it:
+        puzzle, nodes, guesses, contradictions, solutions, us
+        cells        the top cells by guesses, as (row, col, guesses, guesses searched for nothing, nodes under those)
+        wasted       the top subtrees searched for nothing, by nodes, as (nodes, us, depth, row, col, value)
+        strategies   runs, changes and ns for each strategy
+        propagation  ns spent in the propagation at the nodes, not counting the strategies
+    A guess was searched for nothing if the search went on to try another value at its cell or gave up on the cell,
+    rather than reaching the solution through it.
+    """
+    summaries = []
+    summary = None
+    for line in lines:
+        if not line.strip():
+            continue
+        event = json.loads(line)
+        if isinstance(event, dict):
+            if summary is not None:
+                summaries.append(_finish(summary, top))
+            summary = _new_summary(event['start'])
+            continue
+
+        if summary is None:
+            # the search was started without a start line, such as from visit_node() directly
+            summary = _new_summary(None)
+        kind = event[0]
+        if kind == NODE:
+            summary['nodes'] += 1
+            summary['us'] = event[2]
+        elif kind == GUESS:
+            _, depth, row, col, value, us = event
+            summary['guesses'] += 1
+            summary['us'] = us
+            _close_guesses(summary, depth, us, top)
+            cell = summary['cells'].setdefault((row, col), [row, col, 0, 0, 0])
+            cell[2] += 1
+            summary['open'].append((depth, row, col, value, summary['nodes'], us))
+        elif kind == CONTRADICTION:
+            summary['contradictions'] += 1
+        elif kind == SOLUTION:
+            summary['solutions'] += 1
+            summary['us'] = event[2]
+            # the guesses on the way to a solution were not for nothing
+            summary['open'] = []
+        elif kind == PROPAGATION:
+            summary['propagation'] += event[3]
+        elif kind == STRATEGY:
+            _, strategy, changes, ns = event
+            counts = summary['strategies'].setdefault(strategy, {'runs': 0, 'changes': 0, 'ns': 0})
+            counts['runs'] += 1
+            counts['changes'] += changes
+            counts['ns'] += ns
+    if summary is not None:
+        summaries.append(_finish(summary, top))
+    return summaries
+
+
+def _new_summary(puzzle: str) -> dict:
+    return {'puzzle': puzzle, 'nodes': 0, 'guesses': 0, 'contradictions': 0, 'solutions': 0, 'us': 0, 'cells': {},
+            'wasted': [], 'strategies': {}, 'propagation': 0,
+            # the guesses whose subtrees are still being searched, as (depth, row, col, value, nodes, us) at the guess
+            'open': []}
+
+
+def _close_guesses(summary: dict, depth: int, us: int, top: int):
+    """ Records the guesses at depth or below as searched for nothing, since the search has moved on from them """
+    open_guesses = summary['open']
+    while open_guesses and open_guesses[-1][0] >= depth:
+        guess_depth, row, col, value, nodes, started = open_guesses.pop()
+        nodes = summary['nodes'] - nodes
+        cell = summary['cells'][row, col]
+        cell[3] += 1
+        cell[4] += nodes
+        subtree = (nodes, us - started, guess_depth, row, col, value)
+        if len(summary['wasted']) < top:
+            heapq.heappush(summary['wasted'], subtree)
+        else:
+            heapq.heappushpop(summary['wasted'], subtree)
+
+
+def _finish(summary: dict, top: int) -> dict:
+    if not summary['solutions']:
+        # nothing under any of them led anywhere
+        _close_guesses(summary, 0, summary['us'], top)
+    del summary['open']
+    summary['cells'] = sorted(summary['cells'].values(), key=lambda cell: (-cell[2], -cell[4]))[:top]
+    summary['wasted'] = sorted(summary['wasted'], reverse=True)
+    summary['propagation'] -= sum(counts['ns'] for counts in summary['strategies'].values())
+    return summary
+
+
+def format_summary(summary: dict) -> str:
+    """ Lays out one search's summary from summarize_trace() for reading """
+    lines = [summary['puzzle'] or '(unknown puzzle)',
+             f"  {summary['nodes']} nodes, {summary['guesses']} guesses, {summary['contradictions']} contradictions, "
+             f"{summary['solutions']} solutions in {summary['us'] / 1000:.3f} ms traced"]
+    if summary['cells']:
+        lines.append('  hottest cells:')
+        lines.extend(f"    ({row}, {col}): {guesses} guesses, {wasted} for nothing, {nodes} nodes under those"
+                     for row, col, guesses, wasted, nodes in summary['cells'])
+    if summary['wasted']:
+        lines.append('  biggest subtrees searched for nothing:')
+        lines.extend(f"    {value} at ({row}, {col}), depth {depth}: {nodes} nodes, {us / 1000:.3f} ms"
+                     for nodes, us, depth, row, col, value in summary['wasted'])
+    lines.append('  time by strategy:')
+    lines.append(f"    propagation: {summary['propagation'] / 1e6:.3f} ms")
+    lines.extend(f"    {name}: {counts['ns'] / 1e6:.3f} ms in {counts['runs']} runs, {counts['changes']} changes"
+                 for name, counts in sorted(summary['strategies'].items(), key=lambda item: -item[1]['ns']))
+    return '\n'.join(lines) + '\n'